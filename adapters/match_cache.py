@@ -0,0 +1,124 @@
+import logging
+import os
+import pickle
+from collections import OrderedDict
+from pathlib import Path
+
+from domain.match import Match
+from shared.const import CSGO_DEMOPARSE_VERSION
+
+log = logging.getLogger(__name__)
+
+# bump whenever Match (or anything it holds) changes shape,
+# so stale pickles are never loaded into new code
+FORMAT_VERSION = 2
+
+SUFFIX = ".match"
+
+
+class MatchCache:
+    """Parsed Match objects pickled to disk, keyed by demo id and parse version.
+
+    Files are evicted least recently used first once the folder goes over max_bytes.
+    Recency is the file mtime, which is bumped on every hit, so the order
+    survives restarts."""
+
+    def __init__(self, folder: Path, max_bytes: int) -> None:
+        self.folder = Path(folder)
+        self.max_bytes = max_bytes
+
+        self.folder.mkdir(parents=True, exist_ok=True)
+
+        # file name -> size, least recently used first
+        self._files: OrderedDict[str, int] = OrderedDict()
+        self._total = 0
+
+        self._load_index()
+
+    @staticmethod
+    def _name(demo_id: int) -> str:
+        return f"{demo_id}-{CSGO_DEMOPARSE_VERSION}-{FORMAT_VERSION}{SUFFIX}"
+
+    def _load_index(self):
+        current = f"-{CSGO_DEMOPARSE_VERSION}-{FORMAT_VERSION}{SUFFIX}"
+        entries = []
+
+        for entry in os.scandir(self.folder):
+            if entry.name.endswith(".tmp"):
+                # interrupted write
+                self._unlink(entry.name)
+                continue
+
+            if not entry.name.endswith(SUFFIX) or not entry.is_file():
+                continue
+
+            if not entry.name.endswith(current):
+                # left behind by an older parser or format
+                self._unlink(entry.name)
+                continue
+
+            stat = entry.stat()
+            entries.append((stat.st_mtime, entry.name, stat.st_size))
+
+        for _, name, size in sorted(entries):
+            self._files[name] = size
+            self._total += size
+
+        log.info("Match cache has %s entries (%s bytes)", len(self._files), self._total)
+        self._evict()
+
+    def _unlink(self, name: str):
+        try:
+            os.unlink(self.folder / name)
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        while self._total > self.max_bytes and self._files:
+            name, size = self._files.popitem(last=False)
+            self._total -= size
+            self._unlink(name)
+
+    def get(self, demo_id: int) -> Match | None:
+        name = self._name(demo_id)
+        if name not in self._files:
+            return None
+
+        path = self.folder / name
+
+        try:
+            with open(path, "rb") as f:
+                match = pickle.load(f)
+        except Exception:
+            log.exception("Dropping unreadable match cache entry %s", name)
+            self._total -= self._files.pop(name)
+            self._unlink(name)
+            return None
+
+        self._files.move_to_end(name)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+        return match
+
+    def put(self, demo_id: int, match: Match):
+        name = self._name(demo_id)
+        path = self.folder / name
+        temp = path.with_suffix(".tmp")
+
+        data = pickle.dumps(match, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_bytes:
+            return
+
+        # write then rename, so a crash never leaves a half written entry behind
+        with open(temp, "wb") as f:
+            f.write(data)
+        os.replace(temp, path)
+
+        self._total -= self._files.pop(name, 0)
+        self._files[name] = len(data)
+        self._total += len(data)
+
+        self._evict()
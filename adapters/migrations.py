@@ -0,0 +1,82 @@
+import logging
+from typing import NamedTuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+log = logging.getLogger(__name__)
+
+# arbitrary key for pg_advisory_xact_lock, keeps two processes from
+# migrating at the same time
+MIGRATION_LOCK_KEY = 7311
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    statements: tuple
+
+
+# append only! never edit a migration that has been released,
+# add a new one with a higher version instead.
+# statements should be idempotent (IF NOT EXISTS etc.) since a fresh database
+# gets its tables from meta.create_all before the migrations run
+MIGRATIONS = (
+    Migration(
+        version=1,
+        description="index hot job and demo lookups",
+        statements=(
+            # JobRepository.recording_count and views.get_user_demo_formats
+            "CREATE INDEX IF NOT EXISTS ix_job_user_id_state_started_at "
+            "ON job (user_id, state, started_at)",
+            # JobRepository.waiting_for_demo
+            "CREATE INDEX IF NOT EXISTS ix_job_demo_id_state_started_at "
+            "ON job (demo_id, state, started_at)",
+            # JobRepository.get_restart and JobRepository.active_ids
+            "CREATE INDEX IF NOT EXISTS ix_job_state_started_at ON job (state, started_at)",
+            # DemoRepository.from_identifier
+            "CREATE INDEX IF NOT EXISTS ix_demo_origin_identifier ON demo (origin, identifier)",
+        ),
+    ),
+    Migration(
+        version=2,
+        description="track demo archive sizes for retention",
+        statements=("ALTER TABLE demo ADD COLUMN IF NOT EXISTS archive_size BIGINT",),
+    ),
+)
+
+
+async def current_version(conn: AsyncConnection) -> int:
+    result = await conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_version"))
+    return result.scalar()
+
+
+async def migrate(conn: AsyncConnection, migrations=MIGRATIONS):
+    """Applies every migration newer than the stored schema version.
+
+    Expects to be run inside a transaction, so a failing step rolls back the whole run."""
+
+    await conn.execute(
+        text("SELECT pg_advisory_xact_lock(:key)").bindparams(key=MIGRATION_LOCK_KEY)
+    )
+
+    version = await current_version(conn)
+    pending = [migration for migration in migrations if migration.version > version]
+
+    if not pending:
+        log.info("Schema is up to date (version %s)", version)
+        return
+
+    for migration in pending:
+        log.info("Applying migration %s: %s", migration.version, migration.description)
+
+        for statement in migration.statements:
+            await conn.execute(text(statement))
+
+        await conn.execute(
+            text("INSERT INTO schema_version (version) VALUES (:version)").bindparams(
+                version=migration.version
+            )
+        )
+
+    log.info("Schema migrated from version %s to %s", version, pending[-1].version)
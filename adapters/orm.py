@@ -5,6 +5,7 @@ import sqlalchemy as sa
 import sqlalchemy.ext.asyncio as aio
 import sqlalchemy.orm as orm
 from bot import config
+from adapters.migrations import migrate
 from domain.enums import DemoGame, DemoState, JobState, RecordingType, DemoOrigin
 from domain.domain import Demo, Job, UserSettings
 from sqlalchemy.dialects import postgresql as pg
@@ -29,6 +30,7 @@ demo_table = sa.Table(
     sa.Column("downloaded_at", sa.DateTime(timezone=True), nullable=True),
     sa.Column("data_version", sa.SmallInteger, nullable=True),
     sa.Column("data", sa.JSON, nullable=True),
+    sa.Column("archive_size", sa.BigInteger, nullable=True),
 )
 
 job_table = sa.Table(
@@ -61,12 +63,42 @@ user_table = sa.Table(
     sa.Column("use_demo_crosshair", sa.Boolean, nullable=True),
 )
 
+# messages to publish, written in the same transaction as the state they belong to
+# and relayed to the broker by adapters.outbox.OutboxRelay
+outbox_table = sa.Table(
+    "outbox",
+    meta,
+    sa.Column("id", sa.BigInteger, primary_key=True, autoincrement=True),
+    sa.Column("message_type", sa.TEXT, nullable=False),
+    sa.Column("payload", sa.JSON, nullable=False),
+    sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+)
+
+schema_table = sa.Table(
+    "schema_version",
+    meta,
+    sa.Column("version", sa.Integer, primary_key=True, autoincrement=False),
+    sa.Column("applied_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+)
+
 engine: aio.AsyncEngine = aio.create_async_engine(
     config.DB_BIND,
     execution_options={"isolation_options": "REPEATABLE READ"},
     future=True,
 )
 
+# read-only engine for services.views, bypassing the session/uow machinery.
+# autocommit means no BEGIN/COMMIT round trips, and asyncpg keeps the prepared
+# statements around per pooled connection. can be pointed at a replica
+read_engine: aio.AsyncEngine = aio.create_async_engine(
+    config.DB_READ_BIND or config.DB_BIND,
+    execution_options={"isolation_level": "AUTOCOMMIT"},
+    connect_args={"prepared_statement_cache_size": 256},
+    pool_size=4,
+    max_overflow=8,
+    future=True,
+)
+
 Session = orm.sessionmaker(
     engine, autocommit=False, expire_on_commit=False, class_=aio.AsyncSession
 )
@@ -90,6 +122,23 @@ async def start_orm():
 
         logging.Logger.info = wrap_info(logging.Logger.info)
 
+    start_mappers()
+
+    async with engine.begin() as conn:
+        if config.DROP_TABLES:
+            await conn.run_sync(meta.drop_all)
+            pass
+
+        log.info("Creating tables if necessary")
+        await conn.run_sync(meta.create_all)
+
+        log.info("Running schema migrations")
+        await migrate(conn)
+
+    log.info("ORM initialized")
+
+
+def start_mappers():
     registry = orm.registry()
 
     registry.map_imperatively(Demo, demo_table)
@@ -103,13 +152,3 @@ async def start_orm():
     )
 
     registry.map_imperatively(UserSettings, user_table)
-
-    async with engine.begin() as conn:
-        if config.DROP_TABLES:
-            await conn.run_sync(meta.drop_all)
-            pass
-
-        log.info("Creating tables if necessary")
-        await conn.run_sync(meta.create_all)
-
-    log.info("ORM initialized")
@@ -0,0 +1,116 @@
+import asyncio
+import logging
+from dataclasses import asdict
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from adapters.orm import outbox_table
+from messages import commands, events
+
+log = logging.getLogger(__name__)
+
+# set whenever a transaction with outbox messages commits, so the relay
+# doesn't have to wait for its next poll
+pending = asyncio.Event()
+
+
+def message_type_from_name(name: str):
+    message_type = getattr(commands, name, None) or getattr(events, name, None)
+    if message_type is None:
+        raise ValueError(f"Unknown outbox message type {name}")
+    return message_type
+
+
+class OutboxRepository:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+        self.messages = []
+
+    def add(self, message):
+        self.messages.append(message)
+
+    async def flush(self):
+        # called by the uow right before it commits, as a single insert
+        if not self.messages:
+            return
+
+        rows = [
+            dict(message_type=type(message).__name__, payload=asdict(message))
+            for message in self.messages
+        ]
+
+        await self.session.execute(insert(outbox_table), rows)
+        self.messages.clear()
+
+
+class OutboxRelay:
+    """Publishes committed outbox rows to the broker, at least once.
+
+    Rows are claimed with SKIP LOCKED so several relays can run side by side,
+    and each batch is published concurrently so the broker confirms are pipelined
+    instead of paying a round trip per message. Rows are only deleted once confirmed."""
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        publish,
+        batch_size: int = 100,
+        poll_interval: float = 5.0,
+    ) -> None:
+        self.engine = engine
+        self.publish = publish
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+
+    async def relay_batch(self) -> int:
+        """Publishes one batch, returns how many rows were published"""
+
+        async with self.engine.begin() as conn:
+            stmt = (
+                select(outbox_table.c.id, outbox_table.c.message_type, outbox_table.c.payload)
+                .order_by(outbox_table.c.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            )
+
+            rows = (await conn.execute(stmt)).all()
+            if not rows:
+                return 0
+
+            results = await asyncio.gather(
+                *(self._publish(row) for row in rows), return_exceptions=True
+            )
+
+            published = []
+            for row, result in zip(rows, results):
+                if isinstance(result, BaseException):
+                    log.error("Failed relaying outbox message %s", row.id, exc_info=result)
+                else:
+                    published.append(row.id)
+
+            if published:
+                await conn.execute(delete(outbox_table).where(outbox_table.c.id.in_(published)))
+
+            # a short count stops the drain, failed rows are retried on the next round
+            return len(published)
+
+    async def _publish(self, row):
+        message_type = message_type_from_name(row.message_type)
+        await self.publish(message_type(**row.payload))
+
+    async def run(self):
+        while True:
+            try:
+                async with asyncio.timeout(self.poll_interval):
+                    await pending.wait()
+            except asyncio.TimeoutError:
+                pass
+
+            pending.clear()
+
+            try:
+                while await self.relay_batch() == self.batch_size:
+                    pass
+            except Exception:
+                log.exception("Outbox relay failed, retrying in %s seconds", self.poll_interval)
@@ -2,14 +2,22 @@ from datetime import datetime, timedelta, timezone
 from typing import List
 from uuid import UUID
 
-from sqlalchemy import func, inspect, select, text, update
+from sqlalchemy import func, inspect, null, select, text, update
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
 
 from domain.domain import Demo, Job, UserSettings
 from domain.enums import DemoOrigin, DemoState, JobState
 
 INTERACTION_MINUTES = 15
 
+ACTIVE_JOB_STATES = (JobState.WAITING, JobState.SELECTING, JobState.RECORDING)
+
+
+def _has_active_job():
+    # built on demand as the classes are only mapped once the orm is started
+    return select(Job.id).where(Job.demo_id == Demo.id, Job.state.in_(ACTIVE_JOB_STATES)).exists()
+
 
 class SqlRepository:
     def __init__(self, session: AsyncSession, _type):
@@ -51,14 +59,19 @@ class JobRepository(SqlRepository):
         result = await self.session.execute(stmt)
         return result.scalars().all()
 
-    async def get_restart(self, minutes=INTERACTION_MINUTES) -> List[Job]:
-        """Gets jobs that were made within the last {minutes} minutes and have state JobState.SELECT"""
+    async def get_restart(self, minutes=INTERACTION_MINUTES, defer_data=False) -> List[Job]:
+        """Gets jobs that were made within the last {minutes} minutes and have state JobState.SELECT
+
+        With defer_data the demo data is left unloaded, see DemoRepository.ensure_data"""
 
         stmt = select(Job).where(
             Job.state == JobState.SELECTING,
             Job.started_at > datetime.now(timezone.utc) - timedelta(minutes=minutes),
         )
 
+        if defer_data:
+            stmt = stmt.options(joinedload(Job.demo).defer(Demo.data))
+
         result = await self.session.execute(stmt)
         return result.scalars().all()
 
@@ -118,50 +131,102 @@ class DemoRepository(SqlRepository):
         result = await self.session.execute(stmt)
         return result.scalars().all()
 
+    async def ensure_data(self, demo: Demo):
+        # loads the data of a demo that was fetched with it deferred
+        if "data" in inspect(demo).unloaded:
+            await self.session.refresh(demo, ["data"])
+
     async def set_failed(self, _id):
         stmt = update(Demo).where(Demo.id == _id).values(state=DemoState.FAILED, queued=False)
         await self.session.execute(stmt)
 
-    async def bulk_set_deleted(self, ids: list):
-        # if we set data=None and version=None, it's like we've "deparsed" the demo,
-        # so if it gets given to /record again, handle_demo_step knows to send it
-        # to the demoparse microservice
-        # -- in reality, we could just remove "version" but data holds so much
-        # potentially useless data I'd rather just clear that as well,
-        # I mean the demoparse microservice will re-parse it anyway
+    async def bulk_clear_data(self, ids: list) -> list:
+        # data_version is kept, so handle_demo_step knows the archive is still in
+        # our bucket and asks demoparse to reparse it from there.
+        # demos that picked up an active job since they were selected are skipped.
+        # data=None would store a json null, which is still NOT NULL to postgres
         stmt = (
             update(Demo)
-            .where(Demo.id.in_(ids))
-            .values(state=DemoState.DELETED, data=None, version=None)
+            .where(Demo.id.in_(ids), Demo.data.is_not(None), ~_has_active_job())
+            .values(data=null())
+            .returning(Demo.id)
         )
-        await self.session.execute(stmt)
 
-    async def least_recently_used_matchids(self, keep_count):
-        # bruh sql be like
-        # this gets the matchids of the demos which has been least recently in use
-        # the definition of "least recently" is sorting by the greatest of
-        # the demos downloaded_at date and the demos latest used job started_at date
-        #
-        # there are also safety concerns with sqla when using raw sql like this,
-        # but in this case we're only selecting so it *should* be fine
+        result = await self.session.execute(stmt, execution_options=dict(synchronize_session=False))
+        return result.scalars().all()
+
+    async def bulk_set_deleted(self, ids: list) -> list:
+        # with the archive gone there is nothing left to reparse from,
+        # so the demo is deleted for good
+        stmt = (
+            update(Demo)
+            .where(Demo.id.in_(ids), Demo.state != DemoState.DELETED, ~_has_active_job())
+            .values(state=DemoState.DELETED, data=null(), data_version=None, archive_size=None)
+            .returning(Demo.id)
+        )
+
+        result = await self.session.execute(stmt, execution_options=dict(synchronize_session=False))
+        return result.scalars().all()
+
+    async def _over_budget(self, size: str, where: str, budget: int, limit: int, grace: int):
+        # walks demos from most to least recently used, summing their sizes.
+        # everything past the budget is returned, least recently used first.
+        # demos in use still count towards the budget, they just can't be evicted
         stmt = text(
-            """WITH demos AS (
-                SELECT demo.id, demo.matchid, demo.state, demo.downloaded_at, MAX(job.started_at) AS started_at
-                FROM demo LEFT JOIN job ON job.demo_id=demo.id
-                WHERE demo.state='SUCCESS'
-                GROUP BY demo.id
+            f"""WITH demos AS (
+                SELECT d.id, d.origin, d.identifier, {size} AS size,
+                    GREATEST(d.downloaded_at, MAX(j.started_at)) AS used_at
+                FROM demo AS d LEFT JOIN job AS j ON j.demo_id=d.id
+                WHERE {where}
+                GROUP BY d.id
+            ), ranked AS (
+                SELECT *, SUM(size) OVER (ORDER BY used_at DESC NULLS LAST, id DESC) AS total
+                FROM demos
             )
 
-            SELECT id, matchid, GREATEST(downloaded_at, started_at)
-            FROM demos AS d
-            WHERE NOT EXISTS(SELECT 1 FROM job WHERE demo_id=d.id AND state IN ('DEMO', 'SELECT', 'RECORD') LIMIT 1)
-            ORDER BY greatest
-            LIMIT (SELECT GREATEST(0, COUNT(*) - :keep) FROM demos)"""
-        ).bindparams(keep=keep_count)
+            SELECT id, origin, identifier, size
+            FROM ranked AS r
+            WHERE total > :budget
+            AND (used_at IS NULL OR used_at < :grace_cutoff)
+            AND NOT EXISTS(
+                SELECT 1 FROM job
+                WHERE demo_id=r.id AND state IN ('WAITING', 'SELECTING', 'RECORDING')
+            )
+            ORDER BY used_at ASC NULLS FIRST
+            LIMIT :limit"""
+        ).bindparams(
+            budget=budget,
+            limit=limit,
+            grace_cutoff=datetime.now(timezone.utc) - timedelta(minutes=grace),
+        )
 
         result = await self.session.execute(stmt)
         return result.all()
 
+    async def evictable_data(self, budget: int, limit: int, grace: int = INTERACTION_MINUTES * 4):
+        """Least recently used demos whose parsed data is past the byte budget"""
+
+        return await self._over_budget(
+            size="pg_column_size(d.data)",
+            where="d.data IS NOT NULL",
+            budget=budget,
+            limit=limit,
+            grace=grace,
+        )
+
+    async def evictable_archives(
+        self, budget: int, limit: int, grace: int = INTERACTION_MINUTES * 4
+    ):
+        """Least recently used demos whose bucket archive is past the byte budget"""
+
+        return await self._over_budget(
+            size="d.archive_size",
+            where="d.archive_size IS NOT NULL AND d.state IN ('READY', 'FAILED')",
+            budget=budget,
+            limit=limit,
+            grace=grace,
+        )
+
 
 class UserRepository(SqlRepository):
     def __init__(self, session: AsyncSession):
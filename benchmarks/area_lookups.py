@@ -0,0 +1,93 @@
+"""Microbenchmark for the nearest nav area lookups in bot.area.
+
+Runs on the largest maps in bot/navparse/nav.json (see navparse.go), or on a random
+map of --areas areas if that hasn't been generated. Compares the old brute force loop
+with a KD-tree lookup per kill and one batched lookup for every kill of a half.
+
+    python -m benchmarks.area_lookups [--maps 3] [--kills 100] [--number 20]
+"""
+
+import argparse
+import json
+import random
+from math import sqrt
+from pathlib import Path
+from timeit import timeit
+
+from bot.area import MapAreas
+
+NAV = Path(__file__).parent.parent / "bot" / "navparse" / "nav.json"
+
+
+def brute_force(map_area: MapAreas, vec):
+    # what MapAreas.get_vec_id used to do
+    best_dist = None
+    winning_place_id = None
+
+    for area_vec, place_id in zip(map_area._points.tolist(), map_area._place_ids.tolist()):
+        x = area_vec[0] - vec[0]
+        y = area_vec[1] - vec[1]
+        z = area_vec[2] - vec[2]
+        d = sqrt(x * x + y * y + z * z)
+
+        if best_dist is None or d < best_dist:
+            best_dist = d
+            winning_place_id = place_id
+
+    return winning_place_id
+
+
+def random_map(areas: int, places: int = 40) -> dict:
+    data = dict()
+    for place in range(places):
+        data[f"Place{place}"] = [
+            [random.uniform(-4000, 4000), random.uniform(-4000, 4000), random.uniform(-200, 400)]
+            for _ in range(areas // places)
+        ]
+    return data
+
+
+def load_maps(count: int, areas: int) -> dict:
+    if not NAV.is_file():
+        print(f"{NAV} not found, using a random map")
+        return dict(random=random_map(areas))
+
+    data = json.loads(NAV.read_text())
+    largest = sorted(data, key=lambda name: sum(map(len, data[name].values())), reverse=True)
+    return {name: data[name] for name in largest[:count]}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--maps", type=int, default=3)
+    parser.add_argument("--areas", type=int, default=2000)
+    parser.add_argument("--kills", type=int, default=100)
+    parser.add_argument("--number", type=int, default=20)
+    args = parser.parse_args()
+
+    for name, data in load_maps(args.maps, args.areas).items():
+        map_area = MapAreas.from_nav(name, data)
+        points = map_area._points
+
+        # kills happen close to, but rarely exactly on, an area center
+        kills = [
+            [c + random.uniform(-64, 64) for c in points[random.randrange(len(points))]]
+            for _ in range(args.kills)
+        ]
+
+        assert [brute_force(map_area, kill) for kill in kills] == map_area.get_vec_ids(kills)
+        print(f"{name}: {len(points)} areas, {args.kills} kills")
+
+        timings = {
+            "brute force": lambda: [brute_force(map_area, kill) for kill in kills],
+            "tree": lambda: [map_area.get_vec_id(kill) for kill in kills],
+            "tree batch": lambda: map_area.get_vec_ids(kills),
+        }
+
+        for label, stmt in timings.items():
+            seconds = timeit(stmt, number=args.number) / args.number
+            print(f"  {label:<14}{seconds * 1000:9.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
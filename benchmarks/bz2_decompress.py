@@ -0,0 +1,83 @@
+"""Benchmark for the block-parallel bzip2 decompression in shared.parallel_bz2.
+
+Decompresses a .dem.bz2 (or a generated one of --megabytes if none is given) serially
+with the bz2 module, and in parallel with process pools of increasing size, fed in
+the chunks a download would come in.
+
+    python -m benchmarks.bz2_decompress [--archive demo.dem.bz2] [--workers 1 2 4 8]
+"""
+
+import argparse
+import bz2
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from time import perf_counter
+
+from shared.parallel_bz2 import ParallelBz2Decompressor
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def random_demo(megabytes: int) -> bytes:
+    # demos compress about 4:1, a mix of noise and repetition gets close enough
+    parts, size = [], 0
+    while size < megabytes * 1024 * 1024:
+        part = os.urandom(random.randrange(1, 2000)) + b"HL2DEMO" * random.randrange(1, 3000)
+        parts.append(part)
+        size += len(part)
+
+    return b"".join(parts)
+
+
+def serial(data: bytes) -> int:
+    decompressor = bz2.BZ2Decompressor()
+    return sum(
+        len(decompressor.decompress(data[i : i + CHUNK_SIZE]))
+        for i in range(0, len(data), CHUNK_SIZE)
+    )
+
+
+def parallel(data: bytes, executor) -> int:
+    decompressor = ParallelBz2Decompressor(executor)
+    size = sum(
+        len(decompressor.decompress(data[i : i + CHUNK_SIZE]))
+        for i in range(0, len(data), CHUNK_SIZE)
+    )
+    return size + len(decompressor.flush())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--archive", type=Path)
+    parser.add_argument("--megabytes", type=int, default=200)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    if args.archive:
+        data = args.archive.read_bytes()
+    else:
+        print(f"Compressing {args.megabytes} MB of generated demo...")
+        data = bz2.compress(random_demo(args.megabytes))
+
+    started = perf_counter()
+    size = serial(data)
+    baseline = perf_counter() - started
+    print(f"{len(data) / 1e6:.1f} MB to {size / 1e6:.1f} MB, {os.cpu_count()} cores")
+    print(f"  {'serial':<12}{baseline:8.2f} s")
+
+    for workers in args.workers:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # start the workers before timing
+            list(executor.map(abs, range(workers)))
+
+            started = perf_counter()
+            assert parallel(data, executor) == size
+            seconds = perf_counter() - started
+
+        print(f"  {f'{workers} workers':<12}{seconds:8.2f} s  {baseline / seconds:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""Time of Match.best_highlights on the test demos, scaled up to long overtime matches.
+
+    python -m benchmarks.highlights [--players 10] [--repeat 8] [--number 50]
+"""
+
+import argparse
+import json
+from pathlib import Path
+from timeit import timeit
+
+from benchmarks.match_lookups import scale
+from domain.killtable import KillTable
+from domain.match import Match
+
+DATA = Path(__file__).parent.parent / "tests" / "data"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--players", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=8)
+    parser.add_argument("--number", type=int, default=50)
+    args = parser.parse_args()
+
+    for name in ("valve", "faceit"):
+        data = scale(json.loads((DATA / f"{name}.json").read_text()), args.players, args.repeat)
+
+        match = Match(data)
+        match.parse()
+
+        table_seconds = timeit(lambda: KillTable(match), number=args.number)
+        highlight_seconds = timeit(lambda: match.best_highlights(n=5), number=args.number)
+
+        print(f"{name}: {len(match.kill_table)} kills, {len(match.kill_table.slots)} rounds")
+        print(f"  kill table  {table_seconds / args.number * 1000:9.3f} ms")
+        print(f"  highlights  {highlight_seconds / args.number * 1000:9.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
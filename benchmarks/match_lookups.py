@@ -0,0 +1,90 @@
+"""Microbenchmark for the player/team lookups in domain.match.
+
+Scales the test demos up with extra players (think community servers) and repeated
+kills, then times what RoundView.gen_table does: kills_info for every round of every player.
+
+    python -m benchmarks.match_lookups [--players 64] [--repeat 4] [--number 20]
+"""
+
+import argparse
+import json
+from pathlib import Path
+from timeit import timeit
+
+from domain.match import Match
+
+DATA = Path(__file__).parent.parent / "tests" / "data"
+
+
+def scale(data: dict, players: int, repeat: int) -> dict:
+    data = json.loads(json.dumps(data))
+
+    userids = [table["userid"] for table in data["stringtables"] if table["table"] == "userinfo"]
+    next_userid = max(userids) + 1
+
+    extra = list(range(next_userid, next_userid + players))
+    for n, userid in enumerate(extra):
+        data["stringtables"].append(
+            dict(table="userinfo", xuid=[n, 1 << 20], name=f"bot{n}", userid=userid)
+        )
+
+    events = []
+    joined = False
+    for event in data["events"]:
+        events.append(event)
+
+        if not joined and event["event"] == "player_team":
+            joined = True
+            for n, userid in enumerate(extra):
+                events.append(dict(event="player_team", userid=userid, team=2 + n % 2))
+
+        if event["event"] == "player_death":
+            events.extend(dict(event) for _ in range(repeat - 1))
+
+    data["events"] = events
+    return data
+
+
+def render_tables(match: Match):
+    # RoundView.gen_table, for every player
+    for player in match._players.values():
+        for half in match.halves:
+            for round_id, kills in half.get_player_kills(player).items():
+                if kills:
+                    half.kills_info(round_id, kills)
+
+
+def lookup_xuids(match: Match):
+    for player in match._players.values():
+        match.get_player_by_xuid(player.xuid)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--players", type=int, default=64)
+    parser.add_argument("--repeat", type=int, default=4)
+    parser.add_argument("--number", type=int, default=20)
+    args = parser.parse_args()
+
+    for name in ("valve", "faceit"):
+        data = scale(json.loads((DATA / f"{name}.json").read_text()), args.players, args.repeat)
+
+        match = Match(data)
+        match.parse()
+
+        kills = sum(len(deaths) for half in match.halves for deaths in half.rounds.values())
+        print(f"{name}: {len(match._players)} players, {kills} kills")
+
+        timings = {
+            "parse": lambda: Match(data).parse(),
+            "xuid lookups": lambda: lookup_xuids(match),
+            "tables": lambda: render_tables(match),
+        }
+
+        for label, stmt in timings.items():
+            seconds = timeit(stmt, number=args.number) / args.number
+            print(f"  {label:<14}{seconds * 1000:9.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""Time and peak allocations of Match.parse on the test demos.
+
+    python -m benchmarks.match_parse [--repeat 8] [--number 20]
+
+--repeat scales the kill count up, as the event list is what dominates large demos.
+"""
+
+import argparse
+import json
+import tracemalloc
+from pathlib import Path
+from timeit import timeit
+
+from benchmarks.match_lookups import scale
+from domain.match import Match
+
+DATA = Path(__file__).parent.parent / "tests" / "data"
+
+
+def peak_allocated(data: dict) -> int:
+    tracemalloc.start()
+    try:
+        Match(data).parse()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=8)
+    parser.add_argument("--number", type=int, default=20)
+    args = parser.parse_args()
+
+    for name in ("valve", "faceit"):
+        data = scale(json.loads((DATA / f"{name}.json").read_text()), 0, args.repeat)
+
+        seconds = timeit(lambda: Match(data).parse(), number=args.number) / args.number
+        peak = peak_allocated(data)
+
+        print(f"{name}: {len(data['events'])} events")
+        print(f"  parse       {seconds * 1000:9.3f} ms")
+        print(f"  peak alloc  {peak / 1024:9.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,11 +3,17 @@ import logging
 
 from adapters import orm, steam
 from adapters.faceit import FACEITAPI
+from adapters.match_cache import MatchCache
+from adapters.outbox import OutboxRelay
 from bot import bot, config
+from bot.area import resolve_places
 from messages import commands, events
 from messages.broker import Broker
 from messages.bus import MessageBus
+from services import views
+from services.counters import recording_counter
 from services.uow import SqlUnitOfWork
+from shared import metrics
 from shared.log import logging_config
 from shared.utils import add_signal_handlers, sentry_init
 
@@ -15,6 +21,38 @@ logging_config(config.DEBUG)
 
 log = logging.getLogger(__name__)
 
+# the event loop only keeps weak references to tasks
+background_tasks: set[asyncio.Task] = set()
+
+
+def run_in_background(coro):
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+
+async def cancel_background_tasks():
+    tasks = list(background_tasks)
+    for task in tasks:
+        task.cancel()
+
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def retention_forever(bus: MessageBus, interval: float):
+    while True:
+        try:
+            await bus.dispatch(
+                commands.EnforceRetention(
+                    data_budget=config.DEMO_DATA_BUDGET,
+                    archive_budget=config.DEMO_ARCHIVE_BUDGET,
+                )
+            )
+        except Exception:
+            log.exception("Failed enforcing demo retention")
+
+        await asyncio.sleep(interval)
+
 
 async def bootstrap(
     uow_type,
@@ -25,13 +63,21 @@ async def bootstrap(
     restore: bool,
 ) -> MessageBus:
     # close_tasks = add_signal_handlers()
-    close_tasks = []
+    close_tasks = [cancel_background_tasks]
 
     if start_orm:
         await orm.start_orm()
 
+        # keeps the in-memory job limit counts honest
+        run_in_background(recording_counter.reconcile_forever(views.recording_jobs))
+
     bus = MessageBus(
-        dependencies=dict(video_upload_url=config.VIDEO_UPLOAD_URL, tokens=config.TOKENS),
+        dependencies=dict(
+            video_upload_url=config.VIDEO_UPLOAD_URL,
+            tokens=config.TOKENS,
+            match_cache=MatchCache(config.MATCH_CACHE_FOLDER, config.MATCH_CACHE_BYTES),
+            place_resolver=resolve_places,
+        ),
         factories=dict(uow=uow_type),
     )
 
@@ -42,6 +88,7 @@ async def bootstrap(
             commands.RequestDemoParse,
             commands.RequestPresignedUrl,
             commands.RequestRecording,
+            commands.DeleteDemoArchives,
         },
         consume_events={
             events.PresignedUrlGenerated,
@@ -75,6 +122,12 @@ async def bootstrap(
     await broker.start(config.RABBITMQ_HOST)
     gather.set()
 
+    if start_orm:
+        # publishes whatever the services wrote to the outbox, including
+        # anything left over from before a restart
+        relay = OutboxRelay(orm.engine, broker.publish)
+        run_in_background(relay.run())
+
     close_tasks.append(broker.connection.close)
 
     log.info("Ready to bot!")
@@ -85,6 +138,9 @@ async def bootstrap(
     if restore:
         await bus.dispatch(commands.Restore())
 
+    if start_orm and config.RETENTION_INTERVAL:
+        run_in_background(retention_forever(bus, config.RETENTION_INTERVAL))
+
     return bus
 
 
@@ -97,6 +153,10 @@ def main():
     logging.getLogger("aio_pika").setLevel(logging.INFO)
     logging.getLogger("aiormq.connection").setLevel(logging.INFO)
 
+    metrics.set_service("bot")
+    if config.METRICS_PORT:
+        loop.run_until_complete(metrics.start_server(config.METRICS_PORT))
+
     coro = bootstrap(
         uow_type=SqlUnitOfWork,
         start_orm=True,
@@ -1,30 +1,59 @@
+import hashlib
 import json
-from math import sqrt
+import logging
+from functools import lru_cache
+from pathlib import Path
 from string import ascii_uppercase
 
-CAPITALIZERS = ascii_uppercase + "".join(str(i) for i in range(10))
+import numpy as np
+from scipy.spatial import cKDTree
 
-REPLACEMENTS = (("Topof", "Top of"), ("Backof", "Back of"))
+log = logging.getLogger(__name__)
+
+NAV_FOLDER = Path(__file__).parent / "navparse"
+NAV_JSON = NAV_FOLDER / "nav.json"  # made by navparse.go
 
+# nav.json compiled to one pair of .npy files per map, plus an index of place names
+# and the hash of the nav.json it was compiled from
+COMPILED_FOLDER = NAV_FOLDER / "maps"
+COMPILED_INDEX = COMPILED_FOLDER / "places.json"
 
-def dist(a, b):
-    x = b[0] - a[0]
-    y = b[1] - a[1]
-    z = b[2] - a[2]
-    return sqrt(x * x + y * y + z * z)
+# how many maps are kept loaded at once
+MAX_RESIDENT_MAPS = 8
+
+CAPITALIZERS = ascii_uppercase + "".join(str(i) for i in range(10))
+
+REPLACEMENTS = (("Topof", "Top of"), ("Backof", "Back of"))
 
 
 class MapAreas:
-    def __init__(self, map, data):
+    def __init__(self, map, places, points, place_ids):
         self.map = map
 
-        self._areas = dict()
-        self._places = list(data.keys())
+        self._places = list(places)
+
+        # nav area centers and the place each one belongs to, row for row
+        self._points = points
+        self._place_ids = place_ids
+
+        # built once per map, nearest area lookups are then O(log n)
+        self._tree = cKDTree(self._points) if len(points) else None
 
+    @classmethod
+    def from_nav(cls, map, data):
+        """From the {place name: [area centers]} of a map in nav.json"""
+
+        points = []
+        place_ids = []
         for idx, areas in enumerate(data.values()):
-            for area in areas:
-                area = tuple(area)
-                self._areas[area] = idx
+            points.extend(areas)
+            place_ids.extend([idx] * len(areas))
+
+        # float64 so the tree can use memory mapped points without a copy
+        points = np.array(points, dtype=np.float64).reshape(-1, 3)
+        place_ids = np.array(place_ids, dtype=np.int32)
+
+        return cls(map, data.keys(), points, place_ids)
 
     def prettify_name(self, name):
         p = name[0]
@@ -50,9 +79,12 @@ class MapAreas:
         return s.strip()
 
     def get_place(self, place_id):
+        if place_id is None:
+            return "Unknown"
+
         try:
             place_name = self._places[place_id]
-        except ValueError:
+        except IndexError:
             return "Unknown"
 
         return self.prettify_name(place_name)
@@ -60,20 +92,101 @@ class MapAreas:
     def get_vec_name(self, vec):
         return self.get_place(self.get_vec_id(vec))
 
+    def get_vec_names(self, vecs):
+        return [self.get_place(place_id) for place_id in self.get_vec_ids(vecs)]
+
     def get_vec_id(self, vec):
-        best_dist = None
-        winning_place_id = None
+        return self.get_vec_ids([vec])[0]
+
+    def get_vec_ids(self, vecs):
+        """Place ids of the nav areas closest to each of vecs, in one query"""
+
+        if not len(vecs):
+            return []
+
+        if self._tree is None:
+            return [None] * len(vecs)
+
+        _, nearest = self._tree.query(np.asarray(vecs, dtype=np.float64).reshape(-1, 3))
+        return self._place_ids[nearest].tolist()
+
+
+def _nav_hash(nav_json: Path) -> str:
+    return hashlib.sha256(nav_json.read_bytes()).hexdigest()
+
+
+def compile_nav(nav_json: Path = NAV_JSON, folder: Path = COMPILED_FOLDER):
+    source = _nav_hash(nav_json)
+    with open(nav_json) as f:
+        data = json.loads(f.read())
+
+    folder.mkdir(parents=True, exist_ok=True)
+
+    index = dict()
+    for map, map_data in data.items():
+        map_areas = MapAreas.from_nav(map, map_data)
+        np.save(folder / f"{map}.points.npy", map_areas._points)
+        np.save(folder / f"{map}.place_ids.npy", map_areas._place_ids)
+        index[map] = map_areas._places
+
+    # written last, so an interrupted compile is redone
+    with open(folder / "places.json", "w") as f:
+        f.write(json.dumps(dict(source=source, maps=index)))
+
+    log.info("Compiled nav data for %s maps to %s", len(index), folder)
+
+
+def _read_index() -> dict | None:
+    if not COMPILED_INDEX.is_file():
+        return None
+
+    with open(COMPILED_INDEX) as f:
+        return json.loads(f.read())
+
+
+@lru_cache(maxsize=1)
+def _load_index() -> dict:
+    index = _read_index()
+
+    if not NAV_JSON.is_file():
+        # the compiled arrays can be shipped without the nav.json they came from
+        if index is None:
+            log.warning("No nav data found, map places are unavailable")
+            return dict()
+
+        return index["maps"]
+
+    if index is None or index.get("source") != _nav_hash(NAV_JSON):
+        compile_nav(NAV_JSON, COMPILED_FOLDER)
+        index = _read_index()
+
+    return index["maps"]
+
+
+def resolve_places(map: str, positions: list) -> list | None:
+    """Place names of positions on a map in one batch, None if the map is unknown"""
+
+    map_areas = get_map_areas(map)
+    if map_areas is None:
+        return None
+
+    return map_areas.get_vec_names(positions)
+
+
+@lru_cache(maxsize=MAX_RESIDENT_MAPS)
+def get_map_areas(map: str) -> MapAreas | None:
+    """Areas of a map, loaded on first use and kept for the MAX_RESIDENT_MAPS most recent maps"""
 
-        for area_vec, place_id in self._areas.items():
-            d = dist(vec, area_vec)
+    places = _load_index().get(map)
+    if places is None:
+        return None
 
-            if best_dist is None or d < best_dist:
-                best_dist = d
-                winning_place_id = place_id
+    points = np.load(COMPILED_FOLDER / f"{map}.points.npy", mmap_mode="r")
+    place_ids = np.load(COMPILED_FOLDER / f"{map}.place_ids.npy", mmap_mode="r")
 
-        return winning_place_id
+    return MapAreas(map, places, points, place_ids)
 
 
-with open("bot/navparse/nav.json") as f:
-    data = json.loads(f.read())
-    places = {k: MapAreas(k, v) for k, v in data.items()}
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    compile_nav()
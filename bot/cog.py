@@ -3,13 +3,14 @@ import logging
 import pickle
 import re
 from functools import partial
+from time import time
 from uuid import UUID
 
 import disnake
 from disnake.ext import commands
-from rapidfuzz import fuzz, process
 from tabulate import tabulate
 
+from bot.demo_index import DemoIndex
 from bot.sharecode import is_valid_sharecode
 from domain.match import Player
 from messages import commands as cmds
@@ -17,7 +18,7 @@ from messages import dto
 from messages.bus import MessageBus
 from services import views
 from services.uow import SqlUnitOfWork
-from shared.utils import TimedDict
+from shared.cache import Cache
 
 from . import config
 from .errors import SponsorRequired
@@ -103,7 +104,7 @@ def not_maintenance():
 
 
 async def job_limit_checker(inter: disnake.AppCmdInter, limit: int):
-    job_count = await views.user_recording_count(user_id=inter.author.id, uow=SqlUnitOfWork())
+    job_count = await views.user_recording_count(user_id=inter.author.id)
 
     if job_count < limit:
         return True
@@ -120,14 +121,18 @@ async def job_limit_checker(inter: disnake.AppCmdInter, limit: int):
 job_limit = lambda limit: commands.check(partial(job_limit_checker, limit=limit))
 
 
-async def get_tier(bot: commands.InteractionBot, user_id):
+# patreon roles rarely change, and every lookup is a discord api call
+tier_cache: Cache[int, int] = Cache("tiers", maxsize=10_000, ttl=300.0)
+
+
+async def fetch_tier(bot: commands.InteractionBot, user_id) -> int:
     guild = bot.get_guild(config.STRIKER_GUILD_ID)
     if guild is None:
         return 0
 
     try:
         member = await guild.fetch_member(user_id)
-    except disnake.HTTPException:
+    except disnake.NotFound:
         return 0
 
     for level, role_ids in reversed(config.PATREON_TIERS.items()):
@@ -137,6 +142,14 @@ async def get_tier(bot: commands.InteractionBot, user_id):
     return 0
 
 
+async def get_tier(bot: commands.InteractionBot, user_id):
+    try:
+        return await tier_cache.get_or_load(user_id, partial(fetch_tier, bot, user_id))
+    except disnake.HTTPException:
+        # not cached, so the next command asks discord again
+        return 0
+
+
 async def tier_checker(inter: disnake.AppCmdInter, required_tier: int):
     actual_level = await get_tier(inter.bot, inter.author.id)
 
@@ -158,13 +171,14 @@ class RecorderCog(commands.Cog):
 
         self.embed = EmbedBuilder(bot)
 
-        self._demo_view_cache = TimedDict(10.0)
+        self.demo_index = DemoIndex(views.get_user_demo_formats)
 
         self.bus.add_event_listener(dto.JobSelectable, self.job_selectable)
         self.bus.add_event_listener(dto.JobFailed, self.job_failed)
         self.bus.add_event_listener(dto.JobWaiting, self.job_processing)
         self.bus.add_event_listener(dto.JobRecording, self.job_recording)
         self.bus.add_event_listener(dto.JobSuccess, self.job_success)
+        self.bus.add_event_listener(dto.DemosDeleted, self.demos_deleted)
 
         self.bot._error_actionrow = self.make_actionrow(discord=True)
         self.bot._error_sponsor_actionrow = self.make_actionrow(patreon=True)
@@ -257,16 +271,7 @@ class RecorderCog(commands.Cog):
             "Your search query did not match any demos available."
         )
 
-        found = await self._search_demos(inter.author.id, search, limit=1)
-
-        if not found:
-            raise not_found_exc
-
-        found_desc = found[0]
-        found_demo_id = None
-        for demo_id, demo_desc in self._demo_view_cache.get(inter.author.id).items():
-            if demo_desc == found_desc:
-                found_demo_id = demo_id
+        found_demo_id = await self.demo_index.resolve(inter.author.id, search)
 
         if found_demo_id is None:
             raise not_found_exc
@@ -274,9 +279,7 @@ class RecorderCog(commands.Cog):
         await inter.response.defer(ephemeral=True)
 
         user_id = inter.author.id
-        demo_origin, _ = await views.get_demo_origin_and_identifier(
-            found_demo_id, uow=SqlUnitOfWork()
-        )
+        demo_origin, _ = await views.get_demo_origin_and_identifier(found_demo_id)
 
         # this data probably belongs in a dict somewhere
         if demo_origin == "FACEIT":
@@ -294,34 +297,10 @@ class RecorderCog(commands.Cog):
             )
         )
 
-    async def _search_demos(self, user_id: int, search: str, limit: int = 5):
-        demos = self._demo_view_cache.get(user_id, None)
-
-        if demos is None:
-            demos = await views.get_user_demo_formats(user_id, SqlUnitOfWork())
-            self._demo_view_cache[user_id] = demos
-
-        choices = list(demos.values())
-
-        if not choices:
-            return ["No demos available! Use /record to add one!"]
-
-        if not search:
-            return choices[:limit]
-
-        fuzzed = process.extract(
-            query=search,
-            choices=choices,
-            scorer=fuzz.ratio,
-            processor=None,
-            limit=limit,
-        )
-
-        return list(t[0] for t in fuzzed)
-
     @demos.autocomplete("search")
     async def demos_autocomplete(self, inter: disnake.AppCmdInter, search: str):
-        return await self._search_demos(inter.author.id, search, limit=5)
+        found = await self.demo_index.search(inter.author.id, search, limit=5)
+        return found or ["No demos available! Use /record to add one!"]
 
     async def _record_another(self, inter: disnake.MessageInteraction):
         message = inter.message
@@ -332,7 +311,7 @@ class RecorderCog(commands.Cog):
         embed = message.embeds[0]
         job_id = embed.footer.text[4:]
 
-        demo_id = await views.get_job_demo_id(UUID(job_id), uow=SqlUnitOfWork())
+        demo_id = await views.get_job_demo_id(UUID(job_id))
         if demo_id is None:
             return
 
@@ -382,6 +361,10 @@ class RecorderCog(commands.Cog):
         else:  # queued
             embed.description = f"{config.SPINNER} #{event.infront} in queue..."
 
+        if event.infront is not None and event.eta is not None:
+            done_at = disnake.utils.format_dt(time() + event.eta, "R")
+            embed.description += f"\nShould be done {done_at}."
+
         tier = await get_tier(self.bot, inter.author.id)
 
         if tier == 0:
@@ -420,12 +403,14 @@ class RecorderCog(commands.Cog):
 
         await self.edit_inter(inter, embed=embed, content=None, components=[button])
 
+    async def demos_deleted(self, event: dto.DemosDeleted):
+        self.demo_index.remove(event.demo_ids)
+
     async def job_selectable(self, event: dto.JobSelectable):
         inter = make_inter(event.job_inter, self.bot)
 
-        # also clear this users demo cache
-        if inter.author.id in self._demo_view_cache:
-            del self._demo_view_cache[inter.author.id]
+        # the demo is now the users most recently used one
+        self.demo_index.add(inter.author.id, event.demo_id, event.demo_format)
 
         await self.select_player(event, inter)
 
@@ -599,14 +584,14 @@ class RecorderCog(commands.Cog):
 
         try:
             job_id = UUID(job_or_demo_id)
-            demo_id = await views.get_job_demo_id(job_id, uow=SqlUnitOfWork())
+            demo_id = await views.get_job_demo_id(job_id)
         except ValueError:
             try:
                 demo_id = int(job_or_demo_id)
             except ValueError:
                 raise commands.BadArgument("Not a valid job or demo id.")
 
-        row = await views.get_demo_origin_and_identifier(demo_id=demo_id, uow=SqlUnitOfWork())
+        row = await views.get_demo_origin_and_identifier(demo_id=demo_id)
         if row is None:
             raise commands.BadArgument("Could not find that job/demo.")
 
@@ -0,0 +1,116 @@
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+from rapidfuzz import fuzz, process
+from rapidfuzz.utils import default_process
+
+from shared.cache import Cache
+
+# most recently used demos kept per user, older ones can't be searched for
+MAX_DEMOS = 100
+
+# users kept in memory, least recently searched are dropped and reloaded on demand
+MAX_USERS = 2000
+
+# seconds before a user is reloaded, catching whatever changed their demos behind our back
+USER_TTL = 5 * 60
+
+
+class UserDemos:
+    def __init__(self, demos: dict[int, str]) -> None:
+        # demo id -> description, oldest first
+        self.formats: OrderedDict[int, str] = OrderedDict()
+        # demo id -> normalized description, what the search actually runs on
+        self.normalized: dict[int, str] = dict()
+
+        # demos come in most recent first
+        for demo_id, demo_format in reversed(demos.items()):
+            self.add(demo_id, demo_format)
+
+    def add(self, demo_id: int, demo_format: str):
+        self.formats[demo_id] = demo_format
+        self.formats.move_to_end(demo_id)
+        self.normalized[demo_id] = default_process(demo_format)
+
+        while len(self.formats) > MAX_DEMOS:
+            old_id, _ = self.formats.popitem(last=False)
+            del self.normalized[old_id]
+
+    def remove(self, demo_id: int):
+        if self.formats.pop(demo_id, None) is not None:
+            del self.normalized[demo_id]
+
+    def recent(self, limit: int):
+        result = []
+        for demo_id in reversed(self.formats):
+            if len(result) == limit:
+                break
+            result.append(demo_id)
+
+        return result
+
+    def search(self, query: str, limit: int):
+        """Returns the ids of the demos best matching query"""
+
+        query = default_process(query)
+        if not query:
+            return self.recent(limit)
+
+        fuzzed = process.extract(
+            query=query,
+            choices=self.normalized,
+            scorer=fuzz.ratio,
+            processor=None,
+            limit=limit,
+        )
+
+        return [demo_id for _, _, demo_id in fuzzed]
+
+
+class DemoIndex:
+    """Per-user index of recently used demos for /demos and its autocomplete.
+
+    A user is loaded from the database on first search, after that the index is
+    updated in place as their jobs become selectable and demos get deleted, and
+    reloaded every USER_TTL seconds."""
+
+    def __init__(self, loader: Callable[[int, int], Awaitable[dict[int, str]]]) -> None:
+        self.loader = loader
+
+        # concurrent autocompletes for the same user share one query
+        self._users: Cache[int, UserDemos] = Cache("demo_index", maxsize=MAX_USERS, ttl=USER_TTL)
+
+    async def _load(self, user_id: int) -> UserDemos:
+        return UserDemos(await self.loader(user_id, MAX_DEMOS))
+
+    async def _get(self, user_id: int) -> UserDemos:
+        return await self._users.get_or_load(user_id, lambda: self._load(user_id))
+
+    def add(self, user_id: int, demo_id: int, demo_format: str):
+        # users that haven't searched yet get the demo when they're loaded
+        user = self._users.peek(user_id)
+        if user is not None:
+            user.add(demo_id, demo_format)
+
+    def remove(self, demo_ids: list[int]):
+        # deleted demos can't be recorded from anymore, whoever had them
+        for user in self._users.values():
+            for demo_id in demo_ids:
+                user.remove(demo_id)
+
+    async def search(self, user_id: int, query: str, limit: int = 5) -> list[str]:
+        user = await self._get(user_id)
+        return [user.formats[demo_id] for demo_id in user.search(query, limit)]
+
+    async def resolve(self, user_id: int, query: str) -> int | None:
+        """Returns the id of the demo best matching query"""
+
+        user = await self._get(user_id)
+
+        # the common case, query was picked from the autocomplete
+        for demo_id, demo_format in user.formats.items():
+            if demo_format == query:
+                return demo_id
+
+        found = user.search(query, limit=1)
+        return found[0] if found else None
@@ -8,7 +8,7 @@ from tabulate import tabulate
 
 from domain.match import Match, MatchHalf, Player
 
-from .area import places
+from .area import get_map_areas
 from .config import CT_COIN, T_COIN
 from .sharecode import is_valid_sharecode
 
@@ -227,13 +227,30 @@ class RoundView(disnake.ui.View):
         )
 
     def gen_table(self, half: MatchHalf):
-        map_area = places.get(self.match.map, None)
         data = []
 
-        all_kills = half.get_player_kills(self.player)
+        all_kills = {
+            round_num: kills
+            for round_num, kills in half.get_player_kills(self.player).items()
+            if kills
+        }
+
+        # places are stored with the kills at ingest, older demos get
+        # one nearest area query for every kill in the half
+        areas = dict()
+        map_area = None
+        if any(kill.place is None for kills in all_kills.values() for kill in kills):
+            map_area = get_map_areas(self.match.map)
+
+        if map_area is not None:
+            positions = [kill.pos for kills in all_kills.values() for kill in kills]
+            names = iter(map_area.get_vec_names(positions))
+            areas = {
+                round_num: [next(names) for _ in kills] for round_num, kills in all_kills.items()
+            }
+
         for round_num, kills in all_kills.items():
-            if kills:
-                data.append(half.kills_info(round_num, kills, map_area))
+            data.append(half.kills_info(round_num, kills, areas=areas.get(round_num)))
 
         if not data:
             return "This player got zero kills this half."
@@ -39,6 +39,7 @@ class Demo(Entity):
         downloaded_at: datetime = None,
         data_version: int = None,
         data: dict = None,
+        archive_size: int = None,
     ):
         self.game = game
         self.origin = origin
@@ -52,6 +53,7 @@ class Demo(Entity):
         self.downloaded_at = downloaded_at
         self.data_version = data_version
         self.data = data
+        self.archive_size = archive_size
 
     def has_download_url(self):
         return self.download_url is not None
@@ -69,6 +71,10 @@ class Demo(Entity):
     def is_ready(self):
         return self.is_selectable() and self.state is DemoState.READY
 
+    def is_evicted(self):
+        # data was dropped by retention but the archive is still in our bucket
+        return not self.has_data() and self.data_version is not None
+
     def failed(self, reason):
         self.state = DemoState.FAILED
         self.add_event(events.DemoFailure(self.id, reason))
@@ -80,11 +86,15 @@ class Demo(Entity):
         self.state = DemoState.READY
         self.add_event(events.DemoReady(self.id))
 
-    def set_demo_data(self, data, version):
+    def set_demo_data(self, data, version, archive_size=None):
         self.data = data
         self.data_version = version
         self.downloaded_at = datetime.now(timezone.utc)
 
+        # reparses don't reupload the archive, so they don't know its size
+        if archive_size is not None:
+            self.archive_size = archive_size
+
         demoheader = data["demoheader"]
         self.map = demoheader["mapname"]
         self.score = data["score"]
@@ -125,23 +135,30 @@ class Job(Entity):
         else:
             self.add_event(events.JobWaiting(self.id))
 
-    def selecting(self):
-        self.state = JobState.SELECTING
-        self.add_event(events.JobSelecting(self.id))
+    def _set_state(self, state: JobState):
+        self.state = state
+        self.add_event(events.JobStateChanged(self.id, self.user_id, self.started_at, state.name))
+
+    def selecting(self, notify: bool = True):
+        # notify=False when the caller emits the JobSelectable itself,
+        # e.g. when many jobs share a demo that only has to be parsed once
+        self._set_state(JobState.SELECTING)
+        if notify:
+            self.add_event(events.JobSelecting(self.id))
 
     def aborted(self):
-        self.state = JobState.ABORTED
+        self._set_state(JobState.ABORTED)
         # self.add_event(events.JobAborted(self.id))
 
     def failed(self, reason: str):
-        self.state = JobState.FAILED
+        self._set_state(JobState.FAILED)
         self.add_event(events.JobFailed(self.id, reason))
 
     def recording(self):
-        self.state = JobState.RECORDING
+        self._set_state(JobState.RECORDING)
 
     def success(self):
-        self.state = JobState.SUCCESS
+        self._set_state(JobState.SUCCESS)
         self.completed_at = utcnow()
 
 
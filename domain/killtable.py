@@ -0,0 +1,225 @@
+from collections import namedtuple
+from typing import Dict, List
+
+import numpy as np
+
+from .match import Death, Match, Player
+
+NO_PLAYER = -1
+NO_TEAM = -1
+
+Highlight = namedtuple("Highlight", "player half round_id kills score")
+
+# highlight scoring, see KillTable.highlights
+HEADSHOT_WEIGHT = 0.25
+WEAPON_WEIGHTS = {
+    "knife": 1.5,
+    "bayonet": 1.5,
+    "taser": 1.5,
+    "hegrenade": 1.0,
+    "inferno": 0.5,
+    "deagle": 0.25,
+}
+# seconds per kill within which a multikill counts as one burst
+COMPACT_SECONDS = 3.0
+
+
+def weapon_weight(weapon: str) -> float:
+    # knives come in a lot of flavours (knife_t, knife_karambit, ...)
+    if weapon.startswith("knife"):
+        return WEAPON_WEIGHTS["knife"]
+    return WEAPON_WEIGHTS.get(weapon, 0.0)
+
+
+class KillTable:
+    """Columnar view of every kill in a parsed match.
+
+    One row per death, in the order the deaths appear in the match halves, with
+    players, teams and weapons stored as small integer ids. Queries are array
+    masks instead of list comprehensions, and return the same Death tuples
+    the MatchHalf methods do, so callers can switch over freely."""
+
+    def __init__(self, match: Match) -> None:
+        if not match._parsed:
+            raise ValueError("Match has to be parsed before building a kill table")
+
+        self.players: List[Player] = list(match._players.values())
+        self.player_ids: Dict[Player, int] = {p: i for i, p in enumerate(self.players)}
+
+        self.weapons: List[str] = list()
+        self.weapon_ids: Dict[str, int] = dict()
+
+        self.teams: List = list()
+        self.team_ids: Dict = dict()
+
+        self.deaths: List[Death] = list()
+
+        # (half index, round id) of every round, round ids alone aren't unique
+        # as a knife round is numbered 1 just like the first regulation round
+        self.slots: List[tuple] = list()
+
+        tick, slot, rnd, half_idx, attacker, victim, weapon = [], [], [], [], [], [], []
+        attacker_team, victim_team, pos, headshot = [], [], [], []
+
+        for half_num, half in enumerate(match.halves):
+            for round_id, deaths in half.rounds.items():
+                slot_id = len(self.slots)
+                self.slots.append((half_num, round_id))
+
+                for death in deaths:
+                    self.deaths.append(death)
+
+                    tick.append(death.tick)
+                    slot.append(slot_id)
+                    rnd.append(round_id)
+                    half_idx.append(half_num)
+                    attacker.append(self._player_id(death.attacker))
+                    victim.append(self._player_id(death.victim))
+                    weapon.append(self._weapon_id(death.weapon))
+                    attacker_team.append(self._team_id(half.get_player_teamnum(death.attacker)))
+                    victim_team.append(self._team_id(half.get_player_teamnum(death.victim)))
+                    pos.append(death.pos)
+                    headshot.append(death.headshot)
+
+        self.tick = np.array(tick, dtype=np.int32)
+        self.slot = np.array(slot, dtype=np.int16)
+        self.round = np.array(rnd, dtype=np.int16)
+        self.half = np.array(half_idx, dtype=np.int16)
+        self.attacker = np.array(attacker, dtype=np.int16)
+        self.victim = np.array(victim, dtype=np.int16)
+        self.weapon = np.array(weapon, dtype=np.int16)
+        self.attacker_team = np.array(attacker_team, dtype=np.int8)
+        self.victim_team = np.array(victim_team, dtype=np.int8)
+        self.pos = np.array(pos, dtype=np.float32).reshape(-1, 3)
+        self.headshot = np.array(headshot, dtype=bool)
+
+        # indexed by weapon id
+        self.weapon_weights = np.array([weapon_weight(w) for w in self.weapons], dtype=np.float64)
+
+        # same rule as MatchHalf.death_is_tk, unknown teams compare equal to each other
+        self.is_tk = self.attacker_team == self.victim_team
+
+    def __len__(self):
+        return len(self.deaths)
+
+    def _player_id(self, player: Player):
+        return NO_PLAYER if player is None else self.player_ids[player]
+
+    def _weapon_id(self, weapon: str):
+        weapon_id = self.weapon_ids.get(weapon)
+        if weapon_id is None:
+            weapon_id = self.weapon_ids[weapon] = len(self.weapons)
+            self.weapons.append(weapon)
+        return weapon_id
+
+    def _team_id(self, teamnum):
+        if teamnum is None:
+            return NO_TEAM
+
+        team_id = self.team_ids.get(teamnum)
+        if team_id is None:
+            team_id = self.team_ids[teamnum] = len(self.teams)
+            self.teams.append(teamnum)
+        return team_id
+
+    def _rows(self, mask: np.ndarray) -> List[Death]:
+        return [self.deaths[i] for i in np.flatnonzero(mask)]
+
+    def player_mask(self, player: Player) -> np.ndarray:
+        player_id = self.player_ids.get(player)
+        if player_id is None:
+            return np.zeros(len(self), dtype=bool)
+        return self.attacker == player_id
+
+    def get_player_kills(self, player: Player, half: int = None) -> Dict[int, List[Death]]:
+        """Every round the player got a kill in, unlike MatchHalf.get_player_kills
+        which also lists the rounds they didn't"""
+
+        mask = self.player_mask(player)
+        if half is not None:
+            mask &= self.half == half
+
+        rounds = dict()
+        for i in np.flatnonzero(mask):
+            rounds.setdefault(int(self.round[i]), []).append(self.deaths[i])
+
+        return rounds
+
+    def get_player_kills_round(self, player: Player, rnd: int, half: int = None) -> List[Death]:
+        mask = self.player_mask(player) & (self.round == rnd)
+        if half is not None:
+            mask &= self.half == half
+
+        return self._rows(mask)
+
+    def team_kills(self) -> List[Death]:
+        return self._rows(self.is_tk)
+
+    def kill_counts(self, include_tk: bool = False) -> np.ndarray:
+        """Kills per player and round, as a players x slots array"""
+
+        mask = self.attacker != NO_PLAYER
+        if not include_tk:
+            mask &= ~self.is_tk
+
+        counts = np.zeros((len(self.players), len(self.slots)), dtype=np.int32)
+        np.add.at(counts, (self.attacker[mask], self.slot[mask]), 1)
+
+        return counts
+
+    def highlights(self, tickrate: int, n: int = 5, min_kills: int = 2) -> List[Highlight]:
+        """Scores every (player, round) pair in one pass and returns the n best, best first.
+
+        score = kills^2 * (1 + compactness) + weapon and headshot bonuses, where compactness
+        goes from 1 for kills in quick succession towards 0 as they spread out over the round.
+        Team kills don't count, and pairs with less than min_kills kills are never returned."""
+
+        if not len(self):
+            return []
+
+        mask = (self.attacker != NO_PLAYER) & ~self.is_tk
+        index = (self.attacker[mask], self.slot[mask])
+        tick = self.tick[mask].astype(np.int64)
+        shape = (len(self.players), len(self.slots))
+
+        kills = np.zeros(shape, dtype=np.int64)
+        np.add.at(kills, index, 1)
+
+        first = np.full(shape, np.iinfo(np.int64).max, dtype=np.int64)
+        np.minimum.at(first, index, tick)
+
+        last = np.full(shape, np.iinfo(np.int64).min, dtype=np.int64)
+        np.maximum.at(last, index, tick)
+
+        bonus = np.zeros(shape, dtype=np.float64)
+        row_bonus = self.weapon_weights[self.weapon[mask]] + HEADSHOT_WEIGHT * self.headshot[mask]
+        np.add.at(bonus, index, row_bonus)
+
+        candidates = kills >= max(min_kills, 1)
+        count = min(n, int(candidates.sum()))
+        if count <= 0:
+            return []
+
+        span = np.where(candidates, last - first, 0) / tickrate
+        compactness = np.exp(-span / (COMPACT_SECONDS * np.maximum(kills - 1, 1)))
+        score = np.where(candidates, kills**2 * (1.0 + compactness) + bonus, -np.inf).ravel()
+
+        top = np.argpartition(-score, count - 1)[:count]
+        top = top[np.argsort(-score[top], kind="stable")]
+
+        result = []
+        for flat in top:
+            player_id, slot_id = divmod(int(flat), shape[1])
+            half, round_id = self.slots[slot_id]
+
+            result.append(
+                Highlight(
+                    player=self.players[player_id],
+                    half=half,
+                    round_id=round_id,
+                    kills=int(kills[player_id, slot_id]),
+                    score=float(score[flat]),
+                )
+            )
+
+        return result
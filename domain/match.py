@@ -1,12 +1,39 @@
 import logging
 from collections import Counter, defaultdict, namedtuple
-from copy import deepcopy
 from typing import List
 
 log = logging.getLogger(__name__)
 
 Player = namedtuple("Player", "xuid name userid")
-Death = namedtuple("Death", "tick victim attacker pos weapon")
+# headshot was added to the parser output later, demos parsed before that have it False.
+# place is the name of the map area the victim died in, see annotate_places
+Death = namedtuple(
+    "Death", "tick victim attacker pos weapon headshot place", defaults=(False, None)
+)
+
+
+def annotate_places(data: dict, resolver):
+    """Adds the place name of every kill to the player_death events of demo data.
+
+    resolver(map, positions) returns a place name for each position, or None if it
+    doesn't know the map, and is called once for the whole demo. Kills that already
+    have a place are left alone."""
+
+    deaths = [
+        event
+        for event in data["events"]
+        if event["event"] == "player_death" and "place" not in event
+    ]
+
+    if not deaths:
+        return
+
+    places = resolver(data["demoheader"]["mapname"], [event["pos"] for event in deaths])
+    if places is None:
+        return
+
+    for event, place in zip(deaths, places):
+        event["place"] = place
 
 
 class MatchHalf:
@@ -16,6 +43,9 @@ class MatchHalf:
         self.rounds = defaultdict(list)
         self.name = ""
 
+        # player -> teamnum, kept in sync with teams by add_player
+        self._player_teams = dict()
+
     def __iter__(self):
         yield from self.rounds
 
@@ -30,6 +60,7 @@ class MatchHalf:
         for team_num, team_set in preceding.teams.items():
             self.teams[team_num] = team_set.copy()
 
+        self._player_teams = preceding._player_teams.copy()
         return self
 
     def get_player_kills(self, player: Player):
@@ -46,10 +77,7 @@ class MatchHalf:
         return [d for d in deaths if d.attacker is player]
 
     def get_player_teamnum(self, player: Player):
-        for teamnum, players in self.teams.items():
-            if player in players:
-                return teamnum
-        return None
+        return self._player_teams.get(player, None)
 
     def death_is_tk(self, death: Death) -> bool:
         attacker_team = self.get_player_teamnum(death.attacker)
@@ -60,13 +88,14 @@ class MatchHalf:
         self.rounds[self.rnd].append(death)
 
     def add_player(self, player: Player, teamnum: str):
-        for team_num, players in self.teams.items():
-            if team_num != teamnum and player in players:
-                # log.info("Removing %s from %s", player.userid, team_num)
-                players.remove(player)
+        previous = self._player_teams.get(player, None)
+        if previous is not None and previous != teamnum:
+            # log.info("Removing %s from %s", player.userid, previous)
+            self.teams[previous].discard(player)
 
         # log.info("Adding %s to %s", player.userid, teamnum)
         self.teams[teamnum].add(player)
+        self._player_teams[player] = teamnum
 
     def next_round(self):
         self.rnd += 1
@@ -79,14 +108,21 @@ class MatchHalf:
         return ", ".join(weap for weap, _ in c.most_common(n))
 
     @staticmethod
-    def area_by_order(kills, map_area, n=2):
-        if map_area is None:
-            return "?"
+    def area_by_order(kills, map_area, n=2, areas=None):
+        # areas are the place names of kills, if they've already been looked up.
+        # demos ingested before places were stored fall back to looking them up
+        if areas is None:
+            if all(kill.place is not None for kill in kills):
+                areas = [kill.place for kill in kills]
+            elif map_area is None:
+                return "?"
+            else:
+                areas = map_area.get_vec_names([kill.pos for kill in kills])
 
-        areas = Counter([map_area.get_vec_name(kill.pos) for kill in kills])
+        areas = Counter(areas)
         return ", ".join(area for area, _ in areas.most_common(n))
 
-    def kills_info(self, round_id, kills, map_area=None):
+    def kills_info(self, round_id, kills, map_area=None, areas=None):
         k = 0
         tk = 0
         for kill in kills:
@@ -104,7 +140,7 @@ class MatchHalf:
         return (
             f"R{round_id}",
             " ".join(info),
-            self.area_by_order(kills, map_area),
+            self.area_by_order(kills, map_area, areas=areas),
         )
 
 
@@ -121,6 +157,17 @@ class Match:
         self._parsed = False
         self._id_mapper = dict()
         self._players = dict()
+        self._players_by_xuid = dict()
+        self._kill_table = None
+
+    def __getstate__(self):
+        # a parsed match doesn't need the raw data anymore, and it's by far the
+        # largest part. the kill table is cheap to rebuild
+        state = self.__dict__.copy()
+        if self._parsed:
+            state["data"] = None
+        state["_kill_table"] = None
+        return state
 
     @classmethod
     def from_demo(cls, demo):
@@ -130,10 +177,7 @@ class Match:
         return self._players.get(self._ground_userid(_id), None)
 
     def get_player_by_xuid(self, xuid) -> Player:
-        for player in self._players.values():
-            if player.xuid == xuid:
-                return player
-        return None
+        return self._players_by_xuid.get(xuid, None)
 
     def _add_half(self, half: MatchHalf):
         if not half.name:
@@ -152,7 +196,7 @@ class Match:
         half = MatchHalf(1)
 
         for data in events:
-            event = data.pop("event")
+            event = data["event"]
 
             if event == "round_announce_match_start":
                 if half.rounds:  # knife round, most likely
@@ -201,6 +245,23 @@ class Match:
 
         self._add_half(half)
 
+    @property
+    def kill_table(self):
+        """Columnar domain.killtable.KillTable of every kill, built on first access.
+
+        Needs numpy, which is why it's imported here and not at the top."""
+
+        if self._kill_table is None:
+            from .killtable import KillTable
+
+            self._kill_table = KillTable(self)
+
+        return self._kill_table
+
+    def best_highlights(self, n: int = 5, min_kills: int = 2):
+        """Top n (player, round) highlights of the whole match, see KillTable.highlights"""
+        return self.kill_table.highlights(self.tickrate, n=n, min_kills=min_kills)
+
     @property
     def time_str(self):
         return "Unknown" if self.time is None else self.time.strftime(f" %Y/%m/%d at %I:%M")
@@ -213,7 +274,8 @@ class Match:
         if self._parsed:
             return
 
-        data = deepcopy(self.data)
+        # the parse only reads from data, it's shared with the demo (and possibly other matches)
+        data = self.data
 
         # primarily userinfo stuff
         self._parse_stringtables(data["stringtables"])
@@ -241,30 +303,35 @@ class Match:
 
     def _parse_stringtables(self, tables: List[dict]):
         for table in tables:
-            table_name = table.pop("table")
-            if table_name == "userinfo":
+            if table["table"] == "userinfo":
                 self._add_player(table)
 
     def _make_death(self, data):
-        victim_id = data.pop("victim")
-        attacker_id = data.pop("attacker")
-
-        data["victim"] = self.get_player_by_id(victim_id)
-        data["attacker"] = self.get_player_by_id(attacker_id)
-
-        return Death(**data)
+        return Death(
+            tick=data["tick"],
+            victim=self.get_player_by_id(data["victim"]),
+            attacker=self.get_player_by_id(data["attacker"]),
+            pos=data["pos"],
+            weapon=data["weapon"],
+            headshot=data.get("headshot", False),
+            place=data.get("place"),
+        )
 
     def _ground_userid(self, _id):
         return self._id_mapper.get(_id, _id)
 
     def _add_player(self, data):
         xuid = data["xuid"]
-        data["xuid"] = (xuid[1] << 32) + xuid[0]  # I truly hate javascript
 
-        player = Player(**data)
+        player = Player(
+            xuid=(xuid[1] << 32) + xuid[0],  # I truly hate javascript
+            name=data["name"],
+            userid=data["userid"],
+        )
         actual_player = self.get_player_by_xuid(player.xuid)
 
         if actual_player is None:
             self._players[player.userid] = player
+            self._players_by_xuid[player.xuid] = player
         else:
             self._id_mapper[player.userid] = actual_player.userid
@@ -1,4 +1,5 @@
-from more_itertools import windowed
+from collections import namedtuple
+from dataclasses import dataclass
 
 ADD_INTRO = 4
 ADD_OUTRO = 3
@@ -6,24 +7,113 @@ ADD_OUTRO = 3
 ADD_BEFORE_KILL = 2.5
 ADD_AFTER_KILL = 1.5
 
-MAX_INTERLEAVE = 1
+# how a gap between two recorded segments is skipped, see script_builder
+SKIP_FAST_FORWARD = "ff"
+SKIP_GOTO = "goto"
 
+Plan = namedtuple("Plan", "start_tick end_tick skips seconds wall_seconds")
 
-def single_highlight(tick_rate, kills):
-    start_tick = kills[0].tick - int(tick_rate * ADD_INTRO)
-    end_tick = kills[-1].tick + int(tick_rate * ADD_OUTRO)
 
-    ticks = end_tick - start_tick
+@dataclass(frozen=True)
+class CostModel:
+    """What a second of demo costs the recorder, in seconds of wall time.
+
+    Recorded seconds are also weighted by record_weight, as they have to be
+    encoded, muxed and uploaded on top of being played back. cut_penalty isn't
+    wall time, it's what a jump cut in the video is worth avoiding. With the
+    defaults gaps of up to 5 seconds are recorded through, as they always were."""
+
+    record_speed: float = 1.0  # demo seconds per wall second while recording
+    record_weight: float = 2.0
+    cut_seconds: float = 2.0  # every skip starts a new take that has to be muxed
+    cut_penalty: float = 8.0
+    ff_speed: float = 8.0  # mirv_time drive while fast forwarding
+    ff_min: float = 5.0  # shorter gaps are just played back at normal speed
+    ff_ramp: float = 1.5  # played at normal speed around a fast forward
+    goto_seconds: float = 4.0  # a demo_gototick, mostly spent reconstructing the game state
+    goto_preroll: float = 1.0  # played after a goto so the next segment doesn't start cold
+
+    def record(self, seconds: float) -> float:
+        return seconds / self.record_speed + seconds * self.record_weight
+
+    def fast_forward(self, seconds: float) -> float:
+        if seconds <= self.ff_min:
+            return seconds
+        return self.ff_ramp + (seconds - self.ff_ramp) / self.ff_speed
+
+    def goto(self, seconds: float) -> float:
+        return self.goto_seconds + self.goto_preroll
+
+    def skip(self, seconds: float):
+        """Cheapest way to get past a gap, (method, cost) where method is None
+        if it's cheaper to just keep recording. cost is in wall time, so without
+        the cut_penalty the choice was made with"""
+
+        options = [(self.record(seconds), None)]
+
+        if seconds > 0:
+            options.append((self.cut_seconds + self.fast_forward(seconds), SKIP_FAST_FORWARD))
+
+        if seconds > self.goto_preroll:
+            options.append((self.cut_seconds + self.goto(seconds), SKIP_GOTO))
+
+        cost, method = min(
+            options, key=lambda option: option[0] + (option[1] is not None) * self.cut_penalty
+        )
+        return method, cost
+
+
+DEFAULT_COST_MODEL = CostModel()
+
+
+def plan_highlights(tick_rate, kills, cost_model: CostModel = DEFAULT_COST_MODEL) -> Plan:
+    """Plans a recording of any set of kills, from any rounds and players.
+
+    Every kill gets a window of ADD_BEFORE_KILL/ADD_AFTER_KILL seconds around it,
+    with ADD_INTRO/ADD_OUTRO at the ends of the reel. Overlapping windows are merged
+    and every gap between them is either recorded through, fast forwarded or jumped
+    over with a goto, whichever the cost model says is cheapest. The costs of the
+    gaps don't depend on each other, so picking the cheapest for each is optimal."""
+
+    if not kills:
+        raise ValueError("Can't plan a highlight without kills")
+
+    ticks = sorted(kill.tick for kill in kills)
+
+    before = int(tick_rate * ADD_BEFORE_KILL)
+    after = int(tick_rate * ADD_AFTER_KILL)
+
+    segments = [[tick - before, tick + after] for tick in ticks]
+    segments[0][0] = ticks[0] - int(tick_rate * ADD_INTRO)
+    segments[-1][1] = ticks[-1] + int(tick_rate * ADD_OUTRO)
+
+    merged = [segments[0]]
+    for start, end in segments[1:]:
+        if start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
 
     skips = list()
+    recorded = sum(end - start for start, end in merged)
+    skipped_seconds = 0.0
+
+    for (_, end), (start, _) in zip(merged, merged[1:]):
+        gap = start - end
+        method, cost = cost_model.skip(gap / tick_rate)
 
-    if len(kills) > 1:
-        for k1, k2 in windowed(kills, n=2, step=1):
-            end = k1.tick + int(tick_rate * ADD_AFTER_KILL)
-            start = k2.tick - int(tick_rate * ADD_BEFORE_KILL)
+        if method is None:
+            recorded += gap
+        else:
+            skips.append((end, start, method))
+            skipped_seconds += cost
 
-            if start - end > tick_rate * (ADD_BEFORE_KILL + ADD_AFTER_KILL + MAX_INTERLEAVE):
-                skips.append((end, start))
-                ticks -= start - end
+    seconds = recorded / tick_rate
 
-    return start_tick, end_tick, skips, ticks / tick_rate
+    return Plan(
+        start_tick=merged[0][0],
+        end_tick=merged[-1][1],
+        skips=skips,
+        seconds=seconds,
+        wall_seconds=seconds / cost_model.record_speed + skipped_seconds,
+    )
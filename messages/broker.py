@@ -2,6 +2,7 @@ import logging
 from dataclasses import asdict
 from functools import partial
 from json import JSONDecodeError, dumps, loads
+from time import perf_counter
 from typing import Mapping
 from uuid import uuid4
 
@@ -15,10 +16,28 @@ from aio_pika.abc import (
 )
 from pamqp.commands import Basic
 
+from shared.metrics import Counter, Histogram
+
 from . import bus, commands, deco, events
 
 log = logging.getLogger(__name__)
 
+publish_seconds = Histogram(
+    "broker_publish_seconds",
+    "Time until rabbitmq confirmed a published message",
+    labelnames=("message",),
+)
+consume_seconds = Histogram(
+    "broker_consume_seconds",
+    "Time from consuming a message to acking or requeueing it, by what happened to it",
+    labelnames=("message", "outcome"),
+)
+dead_letters = Counter(
+    "broker_dead_letters_total",
+    "Commands that came back dead lettered",
+    labelnames=("message",),
+)
+
 
 class MessageError(Exception):
     pass
@@ -202,6 +221,7 @@ class Broker:
 
         log.info("Publishing %s", message)
 
+        started = perf_counter()
         exchange = self.exchanges[exchange]
 
         message = aio_pika.Message(
@@ -218,6 +238,8 @@ class Broker:
         log.info("Publish result: %s", result.name)
         assert isinstance(result, Basic.Ack)
 
+        publish_seconds.observe(perf_counter() - started, message=message_type.__name__)
+
     async def _load_message(self, message: AbstractIncomingMessage, message_type: type):
         log.info("Consuming %s", message_type)
 
@@ -240,42 +262,55 @@ class Broker:
         dispatch_err: callable,
         requeue: bool,
     ):
-        msg = await self._load_message(message, message_type)
+        started = perf_counter()
+        outcome = "invalid"
 
         try:
-            await self.bus.dispatch(msg)
-        except Exception as exc:
-            # MessageError is used to specify an error reason for the DTO, usually anyway
-            is_ok = isinstance(exc, MessageError)
+            msg = await self._load_message(message, message_type)
+            outcome = "failed"
 
-            # if this command is set up to requeue, only do it once (before it's redelivered)
-            if requeue and not message.redelivered:
-                await message.nack(requeue=True)
+            try:
+                await self.bus.dispatch(msg)
+            except Exception as exc:
+                # MessageError is used to specify an error reason for the DTO, usually anyway
+                is_ok = isinstance(exc, MessageError)
 
-            # if we're unable to requeue...
-            else:
-                # publish an error event if an error factory is set up
-                if publish_err:
-                    await self.publish(publish_err(msg, str(exc) if is_ok else None))
+                # if this command is set up to requeue, only do it once (before it's redelivered)
+                if requeue and not message.redelivered:
+                    await message.nack(requeue=True)
+                    outcome = "requeued"
 
-                # or dispatch one if that's set up instead
-                elif dispatch_err:
-                    await self.bus.dispatch(dispatch_err(msg, str(exc) if is_ok else None))
+                # if we're unable to requeue...
+                else:
+                    # publish an error event if an error factory is set up
+                    if publish_err:
+                        await self.publish(publish_err(msg, str(exc) if is_ok else None))
 
-                # and ack the command
-                await message.ack()
+                    # or dispatch one if that's set up instead
+                    elif dispatch_err:
+                        await self.bus.dispatch(dispatch_err(msg, str(exc) if is_ok else None))
 
-            raise exc
+                    # and ack the command
+                    await message.ack()
 
-        # if the command handler didn't except, ack the message
-        else:
-            await message.ack()
+                raise exc
+
+            # if the command handler didn't except, ack the message
+            else:
+                await message.ack()
+                outcome = "ack"
+
+        finally:
+            consume_seconds.observe(
+                perf_counter() - started, message=message_type.__name__, outcome=outcome
+            )
 
     async def recv_dead(self, message: AbstractIncomingMessage, message_type, dead_event):
         msg = await self._load_message(message, message_type)
 
         reason = message.properties.headers["x-first-death-reason"]
         event = dead_event(command=msg, reason=reason)
+        dead_letters.inc(message=message_type.__name__)
 
         log.info("Consuming dead letter %s", event)
 
@@ -3,11 +3,20 @@ import logging
 from collections import defaultdict
 from functools import partial
 from inspect import signature
+from time import perf_counter
+
+from shared.metrics import Histogram
 
 from . import commands, deco, events
 
 log = logging.getLogger(__name__)
 
+handler_seconds = Histogram(
+    "bus_handler_seconds",
+    "Time spent in command handlers and event listeners, messages they raise not included",
+    labelnames=("message", "outcome"),
+)
+
 
 class MessageBus:
     def __init__(self, dependencies: dict = None, factories: dict = None) -> None:
@@ -47,7 +56,16 @@ class MessageBus:
 
     async def run_message(self, func, message, dependencies, factories):
         built_factories = {key: factory() for key, factory in factories.items()}
-        await func(message, **dependencies, **built_factories)
+
+        started = perf_counter()
+        outcome = "error"
+        try:
+            await func(message, **dependencies, **built_factories)
+            outcome = "ok"
+        finally:
+            handler_seconds.observe(
+                perf_counter() - started, message=type(message).__name__, outcome=outcome
+            )
 
         if uow := built_factories.get("uow"):
             for message in uow.messages:
@@ -63,6 +63,20 @@ class Restore(Command):
     pass
 
 
+@dataclass(frozen=True)
+class EnforceRetention(Command):
+    data_budget: int = None  # bytes of parsed demo data kept in the database
+    archive_budget: int = None  # bytes of demo archives kept in the bucket
+    batch_size: int = 100
+
+
+@dataclass(frozen=True)
+@publish()
+@consume()
+class DeleteDemoArchives(Command):
+    archives: list  # [origin, identifier] pairs
+
+
 @dataclass(frozen=True)
 class Record(Command):
     job_id: UUID
@@ -100,6 +114,7 @@ class RequestRecording(Command):
     crosshair_code: str
     use_demo_crosshair: bool
     hq: bool
+    playback_seconds: float = None  # estimated by domain.sequencer, used for timeouts
 
 
 @dataclass(frozen=True)
@@ -13,6 +13,8 @@ class JobSelectable(DTO):
     job_id: UUID
     job_inter: bytes
     match: object
+    demo_id: int
+    demo_format: str
 
 
 @dataclass(frozen=True, repr=False)
@@ -39,6 +41,12 @@ class JobRecording(DTO):
     job_id: UUID
     job_inter: bytes
     infront: int
+    eta: float = None
+
+
+@dataclass(frozen=True)
+class DemosDeleted(DTO):
+    demo_ids: list[int]
 
 
 @dataclass(frozen=True)
@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+from datetime import datetime
 from uuid import UUID
 
 from messages.deco import consume, publish
@@ -52,6 +53,14 @@ class JobAborted(Event):
     job_id: UUID
 
 
+@dataclass(frozen=True)
+class JobStateChanged(Event):
+    job_id: UUID
+    user_id: int
+    started_at: datetime
+    state: str  # JobState name
+
+
 # demoparse
 
 
@@ -65,6 +74,7 @@ class DemoParseSuccess(Event):
     identifier: str
     data: str
     version: int
+    archive_size: int = None  # None when the archive wasn't (re)uploaded
 
 
 @dataclass(frozen=True, repr=False)
@@ -100,6 +110,7 @@ class DemoParseDL(Event):
 class RecordingProgression(Event):
     job_id: str
     infront: int | None  # > 0: queued, == 0: recording, is None: send from commands.Record handler
+    eta: float = None  # seconds until the recording is done, see shared.estimator
 
 
 @dataclass(frozen=True)
@@ -107,6 +118,7 @@ class RecordingProgression(Event):
 @consume()
 class RecorderSuccess(Event):
     job_id: str
+    timings: dict = None  # stage -> seconds, see shared.estimator.STAGES
 
 
 @dataclass(frozen=True)
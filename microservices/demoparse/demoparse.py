@@ -4,8 +4,10 @@ import sys
 sys.path.append("../..")
 
 import asyncio
+import codecs
 import logging
 import os
+from concurrent.futures import ProcessPoolExecutor
 
 import aioboto3
 import aiohttp
@@ -14,29 +16,57 @@ import config
 from messages import events
 from messages.broker import Broker, MessageError
 from messages.bus import MessageBus
-from messages.commands import RequestDemoParse, RequestPresignedUrl
+from messages.commands import DeleteDemoArchives, RequestDemoParse, RequestPresignedUrl
 from messages.deco import handler
+from shared import metrics
 from shared.const import CSGO_DEMOPARSE_VERSION
+from shared.download import DecompressError, download_demo
 from shared.log import logging_config
-from shared.utils import (
-    CurlError,
-    RunError,
-    decompress,
-    delete_file,
-    download_file,
-    make_folder,
-    run,
-    sentry_init,
-    timer,
-)
+from shared.utils import CurlError, delete_file, make_folder, sentry_init, timer
+from shared.workerpool import WorkerError, WorkerPool, WorkerTimeout
 
 CHUNK_SIZE = 4 * 1024 * 1024
 
+# the parser writes a few MB of json for a normal demo, anything near this is broken
+PARSE_MAX_OUTPUT = 256 * 1024 * 1024
+
+# demos handled at once, which is also as many parsers as can ever be busy
+PREFETCH_COUNT = 2
+
+# parser workers are replaced after this many demos, or once they grow past this rss
+PARSER_MAX_JOBS = 50
+PARSER_MAX_RSS = 1024 * 1024 * 1024
+
+# most keys a single s3 DeleteObjects request takes
+DELETE_BATCH_SIZE = 1000
+
 logging_config(config.DEBUG)
 log = logging.getLogger(__name__)
 
+stage_seconds = metrics.Histogram(
+    "demoparse_stage_seconds",
+    "Time spent downloading (and extracting), parsing and uploading demos",
+    labelnames=("stage",),
+    buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 45.0, 60.0, 120.0),
+)
+
 session = aiohttp.ClientSession()
 
+# bzip2 blocks are decompressed in parallel, which only pays off with cores to spare
+executor = ProcessPoolExecutor() if (os.cpu_count() or 1) > 1 else None
+
+# long lived node parsers, so parsing a demo doesn't pay for starting node every time
+parsers = WorkerPool(
+    "parser",
+    "node",
+    "parse/index.js",
+    "--worker",
+    size=min(os.cpu_count() or 1, PREFETCH_COUNT),
+    max_jobs=PARSER_MAX_JOBS,
+    max_rss=PARSER_MAX_RSS,
+    timeout=32.0,
+)
+
 if os.name == "nt":
     splitter = "\r\n"
 else:
@@ -82,6 +112,20 @@ class DemoStorage:
             async with self.make_client() as client:
                 await client.upload_fileobj(fp, self.bucket, key)
 
+    async def delete_demos(self, archives):
+        keys = [self._build_key(origin, identifier) for origin, identifier in archives]
+
+        async with self.make_client() as client:
+            for i in range(0, len(keys), DELETE_BATCH_SIZE):
+                batch = keys[i : i + DELETE_BATCH_SIZE]
+                response = await client.delete_objects(
+                    Bucket=self.bucket,
+                    Delete=dict(Objects=[dict(Key=key) for key in batch], Quiet=True),
+                )
+
+                for error in response.get("Errors", []):
+                    log.error("Failed deleting %s: %s", error.get("Key"), error.get("Message"))
+
     async def get_url(self, origin: str, identifier: str, expires_in: int):
         async with self.make_client() as client:
             return await client.generate_presigned_url(
@@ -92,10 +136,25 @@ class DemoStorage:
 
 
 async def parse_demo(demofile) -> str:
-    code, stdout, stderr = await run("node", "parse/index.js", demofile, timeout=32.0)
-    if code != 0:
-        raise RunError(code=code)  # node code lmao
-    return stdout
+    # decoded as it comes in, so the output is never held as bytes and str at once
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    parts = []
+
+    try:
+        timings = await parsers.run(
+            dict(path=str(demofile)),
+            consumer=lambda chunk: parts.append(decoder.decode(chunk)),
+            max_output=PARSE_MAX_OUTPUT,
+        )
+    except (WorkerTimeout, WorkerError) as exc:
+        log.error("Parser failed: %s", exc)
+        raise
+
+    log.info(
+        "Parser timings: %s", ", ".join(f"{stage} {took:.2f}s" for stage, took in timings.items())
+    )
+    parts.append(decoder.decode(b"", final=True))
+    return "".join(parts)
 
 
 @handler(RequestDemoParse)
@@ -126,15 +185,27 @@ async def request_demo_parse(command: RequestDemoParse, publish, upload_demo, ge
         log.info("Setting download_url to own s3 presigned url")
         download_url = await get_url(origin, identifier, 60 * 60)
 
-    # if archive and demo does not exist, download the archive
+    # download the archive, extracting the demo as it comes in.
+    # the archive itself is kept for the upload
     log.info("downloading %s", archive_path)
-    end = timer("download")
+    end = timer("download and extraction")
 
-    # if not archive_path.is_file():
     try:
-        await download_file(download_url, archive_path, timeout=45.0)
+        # used to be 45 seconds for the download and another 32 for the extraction
+        with stage_seconds.time(stage="download"):
+            await download_demo(
+                session,
+                download_url,
+                demo_path,
+                archive=archive_path,
+                compression=ext,
+                timeout=60.0,
+                executor=executor,
+            )
     except asyncio.TimeoutError as exc:
         raise MessageError("Fetching demo timed out.") from exc
+    except DecompressError as exc:
+        raise MessageError("Failed extracting demo archive.") from exc
     except CurlError as exc:
         raise MessageError(
             ("Demo not found (404)." if exc.http_code == 404 else "Failed fetching demo.") + "\n\n"
@@ -144,32 +215,26 @@ async def request_demo_parse(command: RequestDemoParse, publish, upload_demo, ge
 
     log.info(end())
 
-    log.info("extracting %s", demo_path)
-    end = timer("extraction")
-
-    try:
-        await decompress(archive_path, demo_path)
-    except (asyncio.TimeoutError, RunError) as exc:
-        raise MessageError("Failed extracting demo archive.") from exc
-
-    log.info(end())
-
     async def parser():
         log.info("parsing %s", demo_path)
         end = timer("parsing")
-        result = await parse_demo(demo_path)
+        with stage_seconds.time(stage="parse"):
+            result = await parse_demo(demo_path)
         log.info(end())
         return result
 
     async def uploader():
         log.info("uploading %s", archive_path)
         end = timer("upload")
-        await upload_demo(archive_path, origin, identifier)
+        with stage_seconds.time(stage="upload"):
+            await upload_demo(archive_path, origin, identifier)
         log.info(end())
 
     tasks = [asyncio.create_task(parser())]
+    archive_size = None
 
     if command.data_version is None:
+        archive_size = archive_path.stat().st_size
         tasks.append(asyncio.create_task(uploader()))
     else:
         log.info("Skipping demo upload since data_version=%s", command.data_version)
@@ -194,10 +259,17 @@ async def request_demo_parse(command: RequestDemoParse, publish, upload_demo, ge
             identifier=identifier,
             data=data,
             version=CSGO_DEMOPARSE_VERSION,
+            archive_size=archive_size,
         )
     )
 
 
+@handler(DeleteDemoArchives)
+async def delete_demo_archives(command: DeleteDemoArchives, delete_demos):
+    log.info("Deleting %s demo archives", len(command.archives))
+    await delete_demos(command.archives)
+
+
 @handler(RequestPresignedUrl)
 async def request_presigned_url(command: RequestPresignedUrl, publish, get_url):
     presigned_url = await get_url(command.origin, command.identifier, command.expires_in)
@@ -208,6 +280,12 @@ async def main():
     if config.SENTRY_DSN:
         sentry_init(config.SENTRY_DSN)
 
+    metrics.set_service("demoparse")
+    if config.METRICS_PORT:
+        await metrics.start_server(config.METRICS_PORT)
+
+    await parsers.start()
+
     logging.getLogger("aio_pika").setLevel(logging.INFO)
     logging.getLogger("aiormq.connection").setLevel(logging.INFO)
     logging.getLogger("botocore").setLevel(logging.INFO)
@@ -224,9 +302,14 @@ async def main():
 
     bus = MessageBus()
     broker = Broker(bus)
-    bus.add_dependencies(publish=broker.publish, upload_demo=s3.upload_demo, get_url=s3.get_url)
+    bus.add_dependencies(
+        publish=broker.publish,
+        upload_demo=s3.upload_demo,
+        get_url=s3.get_url,
+        delete_demos=s3.delete_demos,
+    )
     bus.register_decos()
-    await broker.start(config.RABBITMQ_HOST, prefetch_count=2)
+    await broker.start(config.RABBITMQ_HOST, prefetch_count=PREFETCH_COUNT)
 
     log.info("Ready to parse!")
 
@@ -1,173 +1,239 @@
 var fs = require('fs');
+var readline = require('readline');
 var demofile = require('demofile');
 
-var r = { convars: new Map(), stringtables: new Array(), events: new Array() };
-const demoFile = new demofile.DemoFile();
-
-var matchStarted = false;
-var inWarmup = true;
-var seen = new Set();
-var seenTeam = new Set();
-var clearSeenTeam = false;
-
-function addEvent(data) {
-  // if (data["event"] == "player_death") {
-  //   return;
-  // }
-  // console.log(data);
-  r['events'].push(data);
-}
+function parseDemo(path) {
+  return new Promise((resolve, reject) => {
+    var r = { convars: new Map(), stringtables: new Array(), events: new Array() };
+    const demoFile = new demofile.DemoFile();
+
+    var matchStarted = false;
+    var inWarmup = true;
+    var seen = new Set();
+    var seenTeam = new Set();
+    var clearSeenTeam = false;
+
+    function addEvent(data) {
+      // if (data["event"] == "player_death") {
+      //   return;
+      // }
+      // console.log(data);
+      r['events'].push(data);
+    }
+
+    function addConVar(k, v) {
+      r['convars'][k] = v;
+    }
+
+    function addStringTable(data) {
+      // console.log(data);
+      r['stringtables'].push(data);
+    }
+
+    function setPlayerTeam(player, teamnum) {
+      if (player.isFakePlayer) return;
+
+      if (seenTeam.has(player.steamId)) return;
+      seenTeam.add(player.steamId);
+
+      addEvent({
+        "event": "player_team",
+        "userid": player.userId,
+        "team": teamnum,
+      });
+    }
+
+    demoFile.on('start', e => {
+      r['demoheader'] = {
+        mapname: demoFile.header.mapName,
+        tickrate: demoFile.tickRate,
+        protocol: demoFile.header.protocol,
+      }
+    });
 
-function addConVar(k, v) {
-  r['convars'][k] = v;
-}
+    demoFile.gameEvents.on('player_team', e => {
+      const player = demoFile.entities.getByUserId(e.userid);
+      if (!player) return;
+      if (e.disconnect || e.isbot) return;
+      setPlayerTeam(player, e.team);
+    });
 
-function addStringTable(data) {
-  // console.log(data);
-  r['stringtables'].push(data);
-}
+    demoFile.gameEvents.on('player_spawn', e => {
+      if (!e.player) return;
+      setPlayerTeam(e.player, e.teamnum);
+    });
 
-function setPlayerTeam(player, teamnum) {
-  if (player.isFakePlayer) return;
+    demoFile.conVars.on('change', e => {
+      if (e.name == 'mp_maxrounds') {
+        addConVar(e.name, e.value);
+      }
+    });
 
-  if (seenTeam.has(player.steamId)) return;
-  seenTeam.add(player.steamId);
+    demoFile.stringTables.on('update', e => {
+      var tableName = e.table.name;
+
+      if (tableName == 'userinfo' && e.userData != null) {
+        if (e.userData.fakePlayer) return;
+        if (seen.has(e.userData.userId)) return;
+        seen.add(e.userData.userId)
+
+        var xuid = e.userData.xuid;
+        addStringTable({
+          table: tableName,
+          xuid: [xuid.low, xuid.high],
+          name: e.userData.name,
+          userid: e.userData.userId,
+        });
+      }
+    });
 
-  addEvent({
-    "event": "player_team",
-    "userid": player.userId,
-    "team": teamnum,
-  });
-}
+    demoFile.gameEvents.on('round_announce_last_round_half', e => {
+      addEvent({
+        event: 'round_announce_last_round_half',
+      });
+      clearSeenTeam = true;
+    });
 
-demoFile.on('start', e => {
-  r['demoheader'] = {
-    mapname: demoFile.header.mapName,
-    tickrate: demoFile.tickRate,
-    protocol: demoFile.header.protocol,
-  }
-});
-
-demoFile.gameEvents.on('player_team', e => {
-  const player = demoFile.entities.getByUserId(e.userid);
-  if (!player) return;
-  if (e.disconnect || e.isbot) return;
-  setPlayerTeam(player, e.team);
-});
-
-demoFile.gameEvents.on('player_spawn', e => {
-  if (!e.player) return;
-  setPlayerTeam(e.player, e.teamnum);
-});
-
-demoFile.conVars.on('change', e => {
-  if (e.name == 'mp_maxrounds') {
-    addConVar(e.name, e.value);
-  }
-});
-
-demoFile.stringTables.on('update', e => {
-  var tableName = e.table.name;
-
-  if (tableName == 'userinfo' && e.userData != null) {
-    if (e.userData.fakePlayer) return;
-    if (seen.has(e.userData.userId)) return;
-    seen.add(e.userData.userId)
-
-    var xuid = e.userData.xuid;
-    addStringTable({
-      table: tableName,
-      xuid: [xuid.low, xuid.high],
-      name: e.userData.name,
-      userid: e.userData.userId,
+    demoFile.gameEvents.on('round_announce_match_point', e => {
+      addEvent({
+        event: 'round_announce_match_point',
+      });
     });
-  }
-});
 
-demoFile.gameEvents.on('round_announce_last_round_half', e => {
-  addEvent({
-    event: 'round_announce_last_round_half',
-  });
-  clearSeenTeam = true;
-});
+    demoFile.gameEvents.on('round_announce_match_start', e => {
+      addEvent({
+        event: 'round_announce_match_start',
+      });
 
-demoFile.gameEvents.on('round_announce_match_point', e => {
-  addEvent({
-    event: 'round_announce_match_point',
-  });
-});
+      inWarmup = false;
+      matchStarted = true;
+      seenTeam.clear();
+    });
 
-demoFile.gameEvents.on('round_announce_match_start', e => {
-  addEvent({
-    event: 'round_announce_match_start',
-  });
+    demoFile.gameEvents.on('round_announce_warmup', e => {
+      addEvent({
+        event: 'round_announce_warmup',
+      });
 
-  inWarmup = false;
-  matchStarted = true;
-  seenTeam.clear();
-});
+      inWarmup = true;
+    });
 
-demoFile.gameEvents.on('round_announce_warmup', e => {
-  addEvent({
-    event: 'round_announce_warmup',
-  });
+    demoFile.gameEvents.on('round_end', e => {
+      addEvent({
+        event: 'round_end',
+      });
+    });
 
-  inWarmup = true;
-});
 
-demoFile.gameEvents.on('round_end', e => {
-  addEvent({
-    event: 'round_end',
-  });
-});
+    demoFile.gameEvents.on('round_officially_ended', e => {
+      addEvent({
+        event: 'round_officially_ended',
+      });
 
+      if (clearSeenTeam) {
+        seenTeam.clear();
+        clearSeenTeam = false;
+      }
+    });
 
-demoFile.gameEvents.on('round_officially_ended', e => {
-  addEvent({
-    event: 'round_officially_ended',
-  });
+    demoFile.gameEvents.on('round_start', e => {
+      addEvent({
+        event: 'round_start',
+        round: demoFile.gameRules.roundsPlayed + 1,
+      });
+    });
 
-  if (clearSeenTeam) {
-    seenTeam.clear();
-    clearSeenTeam = false;
-  }
-});
+    demoFile.gameEvents.on("player_death", e => {
+      if (!matchStarted || inWarmup) return;
 
-demoFile.gameEvents.on('round_start', e => {
-  addEvent({
-    event: 'round_start',
-    round: demoFile.gameRules.roundsPlayed + 1,
-  });
-});
+      if (e.attacker == e.userid) return;
+      if (e.attacker == 0) return;
 
-demoFile.gameEvents.on("player_death", e => {
-  if (!matchStarted || inWarmup) return;
+      const attacker = demoFile.entities.getByUserId(e.attacker);
+      if (attacker == null) return; // I've observed this happen ONCE lmao
 
-  if (e.attacker == e.userid) return;
-  if (e.attacker == 0) return;
+      var pos = attacker.position;
 
-  const attacker = demoFile.entities.getByUserId(e.attacker);
-  if (attacker == null) return; // I've observed this happen ONCE lmao
+      addEvent({
+        event: 'player_death',
+        tick: demoFile.currentTick,
+        attacker: e.attacker,
+        victim: e.userid,
+        weapon: e.weapon,
+        headshot: e.headshot,
+        pos: Object.values(pos).map(k => ~~k),
+      });
+    });
 
-  var pos = attacker.position;
+    demoFile.on('end', e => {
+      try {
+        var teamOne = demoFile.teams[2];
+        var teamTwo = demoFile.teams[3];
+        r['score'] = [teamOne.score, teamTwo.score];
+        resolve(r);
+      } catch (err) {
+        reject(e.error || err);
+      }
+    });
 
-  addEvent({
-    event: 'player_death',
-    tick: demoFile.currentTick,
-    attacker: e.attacker,
-    victim: e.userid,
-    weapon: e.weapon,
-    pos: Object.values(pos).map(k => ~~k),
+    var stream = fs.createReadStream(path);
+    stream.on('error', reject);
+    demoFile.parseStream(stream);
   });
-});
+}
 
-demoFile.on('end', e => {
-  var teamOne = demoFile.teams[2];
-  var teamTwo = demoFile.teams[3];
-  r['score'] = [teamOne.score, teamTwo.score];
-  console.log(JSON.stringify(r, null, space = 0));
-})
+function seconds(start) {
+  var [s, ns] = process.hrtime(start);
+  return s + ns / 1e9;
+}
 
+function write(data) {
+  return new Promise(resolve => {
+    if (process.stdout.write(data)) resolve();
+    else process.stdout.once('drain', resolve);
+  });
+}
 
-var demo = process.argv[2];
-demoFile.parseStream(fs.createReadStream(demo));
+// answers the json requests on stdin, one per line, with a json header line and
+// header.length bytes of body, until stdin closes
+async function worker() {
+  // stdout belongs to the answers, anything logged goes to stderr instead
+  console.log = console.error;
+
+  for await (const line of readline.createInterface({ input: process.stdin })) {
+    var request = JSON.parse(line);
+    var header = { id: request.id, ok: true, timings: {} };
+    var body = Buffer.alloc(0);
+
+    if (!request.ping) {
+      try {
+        var start = process.hrtime();
+        var result = await parseDemo(request.path);
+        header.timings.parse = seconds(start);
+
+        start = process.hrtime();
+        body = Buffer.from(JSON.stringify(result, null, space = 0));
+        header.timings.serialize = seconds(start);
+      } catch (err) {
+        header.ok = false;
+        header.error = String(err && err.stack || err);
+      }
+    }
+
+    header.length = body.length;
+    header.rss = process.memoryUsage().rss;
+    await write(Buffer.concat([Buffer.from(JSON.stringify(header) + '\n'), body]));
+  }
+}
+
+if (process.argv[2] == '--worker') {
+  worker();
+} else {
+  parseDemo(process.argv[2]).then(
+    r => console.log(JSON.stringify(r, null, space = 0)),
+    err => {
+      console.error(err);
+      process.exit(1);
+    },
+  );
+}
@@ -6,9 +6,10 @@ import asyncio
 import http
 import logging
 from collections import defaultdict
-from dataclasses import asdict
+from dataclasses import asdict, replace
 from functools import partial
 from json import dumps, loads
+from time import monotonic
 
 import config
 from websockets import server
@@ -18,12 +19,23 @@ from websockets.exceptions import ConnectionClosed
 from messages import commands, events
 from messages.broker import Broker, MessageError
 from messages.bus import MessageBus
+from shared import metrics
+from shared.estimator import RecordingEstimator
 from shared.log import logging_config
 from shared.utils import sentry_init
 
 logging_config(config.DEBUG)
 log = logging.getLogger(__name__)
 
+recorders = metrics.Gauge("gateway_recorders", "Recorder clients connected")
+recording = metrics.Gauge("gateway_recording", "Jobs being recorded")
+recording_stage_seconds = metrics.Histogram(
+    "recording_stage_seconds",
+    "Time spent in each stage of a recording, as reported by the recorder",
+    labelnames=("stage",),
+    buckets=(1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 45.0, 60.0, 90.0, 120.0, 180.0),
+)
+
 
 class ClientMissingError(Exception):
     pass
@@ -41,6 +53,10 @@ class GatewayServer:
         self.client_jobs: dict[str, set] = defaultdict(set)
         self.reported_recording_job_ids = set()
 
+        # job_id -> (command, started, estimated seconds) of jobs handed to a recorder
+        self.recording: dict[str, tuple] = {}
+        self.estimator = RecordingEstimator()
+
         self.bus.add_command_handler(commands.RequestRecording, self.request_recording)
 
         self.message_type_lookup: dict[str, events.Event] = {
@@ -150,6 +166,22 @@ class GatewayServer:
         except KeyError:
             pass
 
+        self.recording.pop(job_id, None)
+
+    def remaining(self, job_id) -> float:
+        _, started, estimate = self.recording[job_id]
+        return max(0.0, estimate - (monotonic() - started))
+
+    def queue_eta(self, game: str, idle: int) -> float | None:
+        # every recorder instance is either recording or waiting for a job
+        busy = [
+            self.remaining(job_id)
+            for job_id, (command, _, _) in self.recording.items()
+            if command.game == game
+        ]
+
+        return self.estimator.eta(list(self.queues[game]._queue), busy, len(busy) + idle)
+
     async def client_waiting(self, event: events.GatewayClientWaiting):
         command: commands.RequestRecording
 
@@ -168,6 +200,11 @@ class GatewayServer:
             return
 
         self.client_jobs[event.client_name].add(command.job_id)
+        self.recording[command.job_id] = (
+            command,
+            monotonic(),
+            self.estimator.estimate(command),
+        )
 
     async def request_recording(self, command: commands.RequestRecording, retry=True):
         if not self.waiter.is_set():
@@ -189,7 +226,11 @@ class GatewayServer:
                 await self.publish(events.RecordingProgression(command.job_id, None))
             elif queue_size >= getter_count:
                 await self.publish(
-                    events.RecordingProgression(command.job_id, queue_size - getter_count + 1)
+                    events.RecordingProgression(
+                        command.job_id,
+                        queue_size - getter_count + 1,
+                        eta=self.queue_eta(game, getter_count),
+                    )
                 )
 
         if retry:
@@ -204,6 +245,13 @@ class GatewayServer:
             await future
 
     async def recorder_success(self, event: events.RecorderSuccess):
+        entry = self.recording.get(event.job_id)
+        if entry is not None and event.timings:
+            self.estimator.observe(entry[0], event.timings)
+
+        for stage, seconds in (event.timings or {}).items():
+            recording_stage_seconds.observe(seconds, stage=stage)
+
         await self.publish(event)
         future = self.get_future(event.job_id)
         future.set_result(None)
@@ -215,6 +263,9 @@ class GatewayServer:
         self.forget_job(event.job_id)
 
     async def recorder_progression(self, event: events.RecordingProgression):
+        if event.infront == 0 and event.job_id in self.recording:
+            event = replace(event, eta=self.remaining(event.job_id))
+
         await self.publish(event)
 
 
@@ -241,11 +292,17 @@ async def main():
     if not config.DEBUG:
         logging.getLogger("websockets").setLevel(logging.INFO)
 
+    metrics.set_service("gateway")
+    if config.METRICS_PORT:
+        await metrics.start_server(config.METRICS_PORT)
+
     waiter = asyncio.Event()
 
     bus = MessageBus()
     broker = Broker(bus, publish_commands={commands.RequestTokens}, consume_events={events.Tokens})
     g = GatewayServer(bus, broker.publish, waiter)
+    recorders.set_function(lambda: len(g.clients))
+    recording.set_function(lambda: len(g.recording))
     await broker.start(config.RABBITMQ_HOST)
     g.post_add_listeners()  # omggggg so fucking dumb
 
@@ -15,6 +15,7 @@ from aiohttp import web
 from messages import commands, events
 from messages.broker import Broker
 from messages.bus import MessageBus
+from shared import metrics
 from shared.const import BOT_PERMISSIONS, BOT_SCOPES
 from shared.log import logging_config
 from shared.utils import sentry_init
@@ -24,6 +25,13 @@ CHUNK_SIZE = 4 * 1024 * 1024
 logging_config(config.DEBUG)
 log = logging.getLogger(__name__)
 
+stage_seconds = metrics.Histogram(
+    "uploader_stage_seconds",
+    "Time spent waiting for upload data and uploading videos to discord",
+    labelnames=("stage",),
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0),
+)
+
 
 async def perform_upload(
     client: disnake.Client, job_id: str, upload_data: events.UploadData, binary_data: bytes
@@ -106,15 +114,17 @@ async def upload(
     if token is None or token not in tokens:
         return web.Response(status=401)
 
-    task = bus.wait_for(events.UploadData, check=lambda e: e.job_id == job_id, timeout=32.0)
-    await broker.publish(commands.RequestUploadData(job_id))
-    upload_data: events.UploadData | None = await task
+    with stage_seconds.time(stage="upload_data"):
+        task = bus.wait_for(events.UploadData, check=lambda e: e.job_id == job_id, timeout=32.0)
+        await broker.publish(commands.RequestUploadData(job_id))
+        upload_data: events.UploadData | None = await task
 
     if upload_data is None:
         await broker.publish(events.UploaderFailure(job_id, reason="Unable to upload."))
         return web.Response(status=503)
 
-    await perform_upload(client, job_id, upload_data, await request.read())
+    with stage_seconds.time(stage="upload"):
+        await perform_upload(client, job_id, upload_data, await request.read())
 
     await broker.publish(events.UploaderSuccess(job_id))
     return web.Response(status=200)
@@ -124,6 +134,8 @@ async def main(injectables):
     if config.SENTRY_DSN:
         sentry_init(config.SENTRY_DSN)
 
+    metrics.set_service("uploader")
+
     logging.getLogger("aio_pika").setLevel(logging.INFO)
     logging.getLogger("aiormq.connection").setLevel(logging.INFO)
 
@@ -166,5 +178,10 @@ if __name__ == "__main__":
     loop = asyncio.get_event_loop()
     loop.run_until_complete(main(injectables))
     app = web.Application(client_max_size=30 * 1024 * 1024)
-    app.add_routes([web.post("/uploader", partial(upload, **injectables))])
+    app.add_routes(
+        [
+            web.post("/uploader", partial(upload, **injectables)),
+            web.get("/metrics", metrics.aiohttp_handler),
+        ]
+    )
     web.run_app(app, host="0.0.0.0", port=9090, loop=loop)
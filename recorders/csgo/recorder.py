@@ -13,6 +13,7 @@ from dataclasses import asdict
 from distutils.dir_util import copy_tree
 from json import dumps, loads
 from pathlib import Path
+from time import monotonic
 from urllib import parse
 from uuid import uuid4
 
@@ -29,13 +30,17 @@ from websockets.exceptions import ConnectionClosed
 from messages import commands, events
 from messages.broker import MessageError
 from messages.bus import MessageBus
+from shared.download import (
+    DecompressError,
+    compression_from_suffix,
+    decompress_file,
+    download_demo,
+)
 from shared.log import logging_config
 from shared.utils import (
     RunError,
-    decompress,
     delete_file,
     delete_folder,
-    download_file,
     make_folder,
     rename_file,
     run,
@@ -66,10 +71,12 @@ async def record(
     csgo: CSGO,
     demo: Path,
     command: commands.RequestRecording,
+    timings: dict,
 ):
     output = config.TEMP_DIR / f"{command.job_id}.mp4"
     capture_dir = config.TEMP_DIR
     video_filters = config.VIDEO_FILTERS if command.color_filter else None
+    started = monotonic()
 
     if not demo.is_file():
         raise ValueError(f"Demo {demo} does not exist.")
@@ -142,7 +149,14 @@ async def record(
 
         return False
 
-    take_folder_task = asyncio.create_task(csgo.wait_for(check=folder_checker, timeout=250.0))
+    # long reels get more time than the default, with plenty of headroom over the estimate
+    timeout = 240.0
+    if command.playback_seconds is not None:
+        timeout = max(timeout, command.playback_seconds * 3)
+
+    take_folder_task = asyncio.create_task(
+        csgo.wait_for(check=folder_checker, timeout=timeout + 10.0)
+    )
 
     await csgo.playdemo(
         demo=demo.absolute(),
@@ -150,7 +164,7 @@ async def record(
     )
 
     try:
-        await csgo.wait_for(check=checker, timeout=240.0)
+        await csgo.wait_for(check=checker, timeout=timeout)
     except:
         raise
     finally:
@@ -161,6 +175,9 @@ async def record(
 
     delete_file(script_file)
 
+    timings["record"] = monotonic() - started
+    started = monotonic()
+
     parts = list()
     coros = []
 
@@ -212,6 +229,8 @@ async def record(
     for take_folder in take_folders:
         delete_folder(take_folder)
 
+    timings["mux"] = monotonic() - started
+
     return output
 
 
@@ -335,30 +354,58 @@ async def handle_recording_request(
     cleanup_files.append(demo_path)
     cleanup_files.append(temp_archive_path)
 
+    # stage -> seconds, reported back so the gateway can estimate queue times
+    timings = dict()
+    started = monotonic()
+
+    compression = compression_from_suffix(archive_path)
+
     if not archive_path.is_file():
+        # the demo is decompressed as it downloads, and the archive is kept for later jobs
         try:
             log.info("Download demo archive...")
-            await download_file(command.demo_url, temp_archive_path, timeout=32.0)
+            await download_demo(
+                session,
+                command.demo_url,
+                demo_path,
+                archive=temp_archive_path,
+                compression=compression,
+                timeout=48.0,
+                executor=executor,
+            )
+        except DecompressError as exc:
+            raise MessageError("Failed extracting demo archive.") from exc
         except (asyncio.TimeoutError, RunError) as exc:
             raise MessageError("Failed downloading demo archive.") from exc
 
         if not archive_path.is_file():
             rename_file(temp_archive_path, archive_path)
 
-    # decompress temp archive to temp demo file
-    log.info("Decompressing archive...")
-    try:
-        await decompress(archive_path, demo_path)
-    except (asyncio.TimeoutError, RunError) as exc:
-        # if we fail decompressing, delete the archive as well
-        cleanup_files.append(archive_path)
-        raise MessageError("Failed extracting demo archive.") from exc
+        # extraction happened inline. both stages are always reported, so the
+        # estimator's rates average over fresh downloads and cached archives alike
+        timings["download"] = monotonic() - started
+        timings["decompress"] = 0.0
+    else:
+        # decompress cached archive to temp demo file
+        log.info("Decompressing archive...")
+        try:
+            await asyncio.wait_for(
+                decompress_file(archive_path, demo_path, compression, executor), timeout=32.0
+            )
+        except (asyncio.TimeoutError, RunError) as exc:
+            # if we fail decompressing, delete the archive as well
+            cleanup_files.append(archive_path)
+            raise MessageError("Failed extracting demo archive.") from exc
+
+        timings["download"] = 0.0
+        timings["decompress"] = monotonic() - started
 
     log.info("CSGO instance: %s", csgo)
-    video_file = await record(csgo, demo_path, command)
+    video_file = await record(csgo, demo_path, command, timings)
     cleanup_files.append(video_file)
 
     log.info("Uploading to uploader service...")
+    started = monotonic()
 
     try:
         async with session.post(
@@ -375,6 +422,9 @@ async def handle_recording_request(
     except (asyncio.TimeoutError, aiohttp.ClientConnectionError) as exc:
         raise RecordingError("Upload service did not respond to the upload request.") from exc
 
+    timings["upload"] = monotonic() - started
+    return timings
+
 
 class GatewayClient:
     def __init__(self, sandboxed: bool) -> None:
@@ -543,13 +593,13 @@ class GatewayClient:
 
             try:
                 await self.send(events.RecordingProgression(command.job_id, infront=0))
-                await handle_recording_request(command, self.session, instance)
+                timings = await handle_recording_request(command, self.session, instance)
             except Exception as exc:
                 log.exception(exc)
                 reason = str(exc) if isinstance(exc, RecordingError) else "Recorder failed."
                 await self.send(events.RecorderFailure(job_id=command.job_id, reason=reason))
             else:
-                await self.send(events.RecorderSuccess(job_id=command.job_id))
+                await self.send(events.RecorderSuccess(job_id=command.job_id, timings=timings))
             finally:
                 self.recording_job_ids.remove(command.job_id)
 
@@ -92,18 +92,25 @@ def make_script(
     c.tick(start_tick)
     c.run("mirv_streams record start")
 
-    for start, end in skips:
+    # skips are (start, end) or (start, end, method), see domain.sequencer
+    for start, end, *method in skips:
+        method = method[0] if method else "ff"
+
         c.tick(start)
         c.run("mirv_streams record end")
 
-        # only ff if there's at least three seconds to ff
-        if end - start > tickrate * 3:
-            c.delta(tickrate * 0.5)
-            c.run("mirv_time drive 8.0")
-
-        # reset drive one second before next segment
-        c.tick(end - tickrate)
-        c.run("mirv_time drive 1.0")
+        if method == "goto":
+            # land a second early so the game state has settled when recording starts
+            c.skip(end - tickrate)
+        else:
+            # only ff if there's at least three seconds to ff
+            if end - start > tickrate * 3:
+                c.delta(tickrate * 0.5)
+                c.run("mirv_time drive 8.0")
+
+            # reset drive one second before next segment
+            c.tick(end - tickrate)
+            c.run("mirv_time drive 1.0")
 
         c.tick(end)
         c.run("mirv_streams record start")
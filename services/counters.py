@@ -0,0 +1,94 @@
+import asyncio
+import logging
+from collections import defaultdict, deque
+from datetime import datetime, timedelta
+from time import monotonic
+from uuid import UUID
+
+from adapters.repo import INTERACTION_MINUTES
+from shared.utils import utcnow
+
+# changes this recent are replayed on top of a reconcile result,
+# covering both the query itself and replica lag
+RECONCILE_GRACE = 10.0
+
+log = logging.getLogger(__name__)
+
+
+class RecordingCounter:
+    """Per-user count of RECORDING jobs started within the interaction window.
+
+    Kept up to date from JobStateChanged events, so the job limit check is a dict lookup
+    instead of a COUNT(*). Since events can be missed (restarts, jobs changed by hand in the db),
+    it is periodically rebuilt from the database with reconcile()."""
+
+    def __init__(self, minutes: int = INTERACTION_MINUTES) -> None:
+        self.window = timedelta(minutes=minutes)
+
+        self._jobs: dict[UUID, tuple[int, datetime]] = dict()
+        self._users: dict[int, set[UUID]] = defaultdict(set)
+        self._journal = deque()
+
+    def update(self, job_id: UUID, user_id: int, started_at: datetime, recording: bool):
+        now = monotonic()
+        self._journal.append((now, job_id, user_id, started_at, recording))
+
+        while self._journal and now - self._journal[0][0] > RECONCILE_GRACE:
+            self._journal.popleft()
+
+        self._apply(job_id, user_id, started_at, recording)
+
+    def _apply(self, job_id, user_id, started_at, recording):
+        if recording:
+            self._jobs[job_id] = (user_id, started_at)
+            self._users[user_id].add(job_id)
+            return
+
+        entry = self._jobs.pop(job_id, None)
+        if entry is None:
+            return
+
+        jobs = self._users[entry[0]]
+        jobs.discard(job_id)
+        if not jobs:
+            del self._users[entry[0]]
+
+    def count(self, user_id: int) -> int:
+        job_ids = self._users.get(user_id)
+        if not job_ids:
+            return 0
+
+        cutoff = utcnow() - self.window
+        return sum(1 for job_id in job_ids if self._jobs[job_id][1] > cutoff)
+
+    async def reconcile(self, fetch):
+        """Rebuilds the counter from fetch(), which returns (id, user_id, started_at) rows"""
+
+        started = monotonic()
+        rows = await fetch()
+
+        self._jobs.clear()
+        self._users.clear()
+
+        for job_id, user_id, started_at in rows:
+            self._apply(job_id, user_id, started_at, True)
+
+        replayed = 0
+        for changed_at, *change in self._journal:
+            if changed_at >= started - RECONCILE_GRACE:
+                self._apply(*change)
+                replayed += 1
+
+        log.debug("Reconciled recording counter: %s rows, %s replayed", len(rows), replayed)
+
+    async def reconcile_forever(self, fetch, interval: float = 60.0):
+        while True:
+            try:
+                await self.reconcile(fetch)
+            except Exception:
+                log.exception("Failed reconciling recording counter")
+
+            await asyncio.sleep(interval)
+
+
+recording_counter = RecordingCounter()
@@ -1,5 +1,6 @@
 import asyncio
 import logging
+from collections import defaultdict
 from json import loads
 from uuid import UUID
 
@@ -7,19 +8,30 @@ from adapters.faceit import HTTPException, NotFound
 from domain import sequencer
 from domain.domain import Demo, Job, UserSettings, calculate_bitrate
 from domain.enums import DemoGame, DemoOrigin, DemoState, JobState, RecordingType
-from domain.match import Match
+from domain.match import Match, annotate_places
 from messages import commands, dto, events
 from messages.deco import handler, listener
 from services import views
+from services.counters import recording_counter
 from services.uow import SqlUnitOfWork
 from shared.const import CSGO_DEMOPARSE_VERSION
 from shared.lockstore import LockStore
+from shared.metrics import Counter
 from shared.utils import utcnow
 
 DEMO_LOCK = asyncio.Lock()
-demo_locks = LockStore()
+demo_locks = LockStore("demo")
 log = logging.getLogger(__name__)
 
+evicted_demos = Counter("demo_evicted_total", "Demos evicted by retention", labelnames=("kind",))
+evicted_bytes = Counter(
+    "demo_evicted_bytes_total", "Bytes freed by retention", labelnames=("kind",)
+)
+reparse_after_eviction = Counter(
+    "demo_reparse_after_eviction_total",
+    "Demos that had to be reparsed because retention dropped their data",
+)
+
 
 class ServiceError(Exception):
     pass
@@ -29,7 +41,6 @@ class ServiceError(Exception):
 async def create_job(
     command: commands.CreateJob,
     uow: SqlUnitOfWork,
-    publish,
     sharecode_resolver,
     faceit_resolver,
 ):
@@ -128,7 +139,7 @@ async def create_job(
                         )
 
             # at this point we've created a demo, and can use the LockStore
-            async with demo_locks.get((demo.origin, demo.identifier)):
+            async with demo_locks.get((demo.origin, demo.identifier), holder="create_job"):
                 if not new_demo and demo.state is DemoState.DELETED:
                     raise ServiceError("Demo has been deleted.")
 
@@ -159,23 +170,28 @@ async def create_job(
                     log.info(
                         "passing to handle_demo_step: new_demo=%s state=%s", new_demo, demo.state
                     )
-                    await handle_demo_step(demo, publish=publish)
+                    handle_demo_step(demo, uow)
 
                 await uow.commit()
 
 
-async def handle_demo_step(demo: Demo, publish):
-    if not demo.is_up_to_date():
-        # the demo version is not what we expect
-        # this can be one of two reasons:
+def handle_demo_step(demo: Demo, uow: SqlUnitOfWork):
+    if not demo.is_selectable():
+        # the demo data is not what we expect
+        # this can be one of three reasons:
         # 1. the demo has not been parsed yet
         # 2. the demo has been parsed but is out of date
-        # in both cases we need to send it on to the demoparser
+        # 3. the demo data was evicted by retention
+        # in all cases we need to send it on to the demoparser
         log.info("Demo %s needs to be parsed", demo.id)
 
+        if demo.is_evicted():
+            reparse_after_eviction.inc()
+
         demo.processing()
 
-        await publish(
+        # goes out once (and only if) the caller commits
+        uow.outbox.add(
             commands.RequestDemoParse(
                 origin=demo.origin.name,
                 identifier=demo.identifier,
@@ -211,29 +227,66 @@ async def job_waiting(event: events.JobWaiting, uow: SqlUnitOfWork):
         uow.add_message(dto.JobWaiting(event.job_id, inter))
 
 
+async def load_match(demo: Demo, uow: SqlUnitOfWork, match_cache) -> Match:
+    # parsed matches survive restarts in the cache, so only parse (and load the data) on a miss
+    match = match_cache.get(demo.id)
+    if match is not None:
+        return match
+
+    await uow.demos.ensure_data(demo)
+
+    match = Match.from_demo(demo)
+    match.parse()
+
+    match_cache.put(demo.id, match)
+    return match
+
+
+async def add_selectable(demo: Demo, jobs: list[Job], uow: SqlUnitOfWork, match_cache):
+    # parses the demo once no matter how many jobs are waiting on it
+    match = await load_match(demo, uow, match_cache)
+
+    demo_format = views.format_demo(demo.origin.name, demo.map, demo.score, demo.time)
+
+    for job in jobs:
+        uow.add_message(dto.JobSelectable(job.id, job.inter_payload, match, demo.id, demo_format))
+
+
 @listener(events.JobSelecting)
-async def job_selecting(event: events.JobSelecting, uow: SqlUnitOfWork):
+async def job_selecting(event: events.JobSelecting, uow: SqlUnitOfWork, match_cache):
     async with uow:
         job = await uow.jobs.get(event.job_id)
         if job is None:
             return
 
-        match = Match.from_demo(job.demo)
-        match.parse()
+        await add_selectable(job.demo, [job], uow, match_cache)
 
-        uow.add_message(dto.JobSelectable(job.id, job.inter_payload, match))
+
+@listener(events.JobStateChanged)
+async def job_state_changed(event: events.JobStateChanged):
+    recording_counter.update(
+        job_id=event.job_id,
+        user_id=event.user_id,
+        started_at=event.started_at,
+        recording=event.state == JobState.RECORDING.name,
+    )
 
 
 @listener(events.DemoReady)
-async def demo_ready(event: events.DemoReady, uow: SqlUnitOfWork):
+async def demo_ready(event: events.DemoReady, uow: SqlUnitOfWork, match_cache):
     async with uow:
         jobs = await uow.jobs.waiting_for_demo(demo_id=event.demo_id)
+        if not jobs:
+            return
 
         for job in jobs:
-            job.selecting()
+            job.selecting(notify=False)
 
         await uow.commit()
 
+        # jobs are joined with their demo, so they all share the same instance
+        await add_selectable(jobs[0].demo, jobs, uow, match_cache)
+
 
 @listener(events.DemoFailure)
 async def demo_failure(event: events.DemoFailure, uow: SqlUnitOfWork):
@@ -248,15 +301,17 @@ async def demo_failure(event: events.DemoFailure, uow: SqlUnitOfWork):
 
 @listener(events.JobFailed)
 async def job_failure(event: events.JobFailed, uow: SqlUnitOfWork):
-    inter_payload = await views.job_inter(event.job_id, uow)
+    async with uow:
+        inter_payload = await uow.jobs.get_inter(event.job_id)
+
     uow.add_message(dto.JobFailed(event.job_id, inter_payload, event.reason))
 
 
 @listener(events.DemoParseSuccess)
-async def demoparse_success(event: events.DemoParseSuccess, uow: SqlUnitOfWork, publish):
+async def demoparse_success(event: events.DemoParseSuccess, uow: SqlUnitOfWork, place_resolver):
     ident = (DemoOrigin[event.origin], event.identifier)
 
-    async with demo_locks.get(ident):
+    async with demo_locks.get(ident, holder="demoparse_success"):
         async with uow:
             demo = await uow.demos.from_identifier(*ident)
             if demo is None:
@@ -268,9 +323,14 @@ async def demoparse_success(event: events.DemoParseSuccess, uow: SqlUnitOfWork,
                 return
 
             if event.version != CSGO_DEMOPARSE_VERSION:
-                await handle_demo_step(demo=demo, publish=publish)
+                handle_demo_step(demo, uow)
             else:
-                demo.set_demo_data(loads(event.data), event.version)
+                data = loads(event.data)
+
+                # resolved once here instead of every time a round table is rendered
+                annotate_places(data, place_resolver)
+
+                demo.set_demo_data(data, event.version, event.archive_size)
                 demo.ready()
 
             await uow.commit()
@@ -280,7 +340,7 @@ async def demoparse_success(event: events.DemoParseSuccess, uow: SqlUnitOfWork,
 async def demoparse_failure(event: events.DemoParseFailure, uow: SqlUnitOfWork):
     ident = (DemoOrigin[event.origin], event.identifier)
 
-    async with demo_locks.get(ident):
+    async with demo_locks.get(ident, holder="demoparse_failure"):
         async with uow:
             demo: Demo = await uow.demos.from_identifier(*ident)
             if demo is None:
@@ -300,7 +360,7 @@ async def demoparse_died(event: events.DemoParseDL, uow: SqlUnitOfWork):
     command: commands.RequestDemoParse = event.command
     ident = (DemoOrigin[command.origin], command.identifier)
 
-    async with demo_locks.get(ident):
+    async with demo_locks.get(ident, holder="demoparse_died"):
         async with uow:
             command: commands.RequestDemoParse = event.command
             reason = event.reason
@@ -340,7 +400,14 @@ async def get_presigned_url_dto(
 
 
 @handler(commands.Record)
-async def record(command: commands.Record, uow: SqlUnitOfWork, publish, wait_for, video_upload_url):
+async def record(
+    command: commands.Record,
+    uow: SqlUnitOfWork,
+    publish,
+    wait_for,
+    video_upload_url,
+    match_cache,
+):
     # a lot of the stuff in here is not orchestration
     # it should be majorly refactored
     async with uow:
@@ -352,8 +419,7 @@ async def record(command: commands.Record, uow: SqlUnitOfWork, publish, wait_for
 
         demo = job.demo
 
-        match = Match.from_demo(demo)
-        match.parse()
+        match = await load_match(demo, uow, match_cache)
 
         # get all player kills
         player = match.get_player_by_xuid(command.player_xuid)
@@ -373,11 +439,9 @@ async def record(command: commands.Record, uow: SqlUnitOfWork, publish, wait_for
 
         job.video_title = " ".join([info[0], player.name, info[1]])
 
-        start_tick, end_tick, skips, total_seconds = sequencer.single_highlight(
-            match.tickrate, kills
-        )
+        plan = sequencer.plan_highlights(match.tickrate, kills)
 
-        video_bitrate = calculate_bitrate(total_seconds)
+        video_bitrate = calculate_bitrate(plan.seconds)
 
         job_id = str(job.id)
 
@@ -389,9 +453,10 @@ async def record(command: commands.Record, uow: SqlUnitOfWork, publish, wait_for
             upload_url=video_upload_url,
             player_xuid=command.player_xuid,
             tickrate=match.tickrate,
-            start_tick=start_tick,
-            end_tick=end_tick,
-            skips=skips,
+            start_tick=plan.start_tick,
+            end_tick=plan.end_tick,
+            skips=plan.skips,
+            playback_seconds=plan.wall_seconds,
             fps=60,
             video_bitrate=video_bitrate,
             audio_bitrate=192,
@@ -424,9 +489,8 @@ async def record(command: commands.Record, uow: SqlUnitOfWork, publish, wait_for
             events.RecordingProgression, check=lambda e: e.job_id == job_id, timeout=4.0
         )
 
-        await publish(commands.RequestRecording(**data))
-
-        # I think this is a sensible place to put the commit
+        # only sent once the job is committed as recording
+        uow.outbox.add(commands.RequestRecording(**data))
         await uow.commit()
 
         progression: events.RecordingProgression | None = await task
@@ -477,7 +541,7 @@ async def recording_progression(event: events.RecordingProgression, uow: SqlUnit
         if inter_payload is None:
             return
 
-        uow.add_message(dto.JobRecording(job_id, inter_payload, event.infront))
+        uow.add_message(dto.JobRecording(job_id, inter_payload, event.infront, event.eta))
 
 
 @listener(events.UploaderSuccess)
@@ -488,9 +552,10 @@ async def uploader_success(event: events.UploaderSuccess, uow: SqlUnitOfWork):
             return
 
         job.success()
-        uow.add_message(dto.JobSuccess(job.id, job.inter_payload))
         await uow.commit()
 
+    uow.add_message(dto.JobSuccess(job.id, job.inter_payload))
+
 
 @listener(events.UploaderFailure)
 async def upload_failure(event: events.UploaderFailure, uow: SqlUnitOfWork):
@@ -526,15 +591,86 @@ async def validate_upload(command: commands.RequestUploadData, uow: SqlUnitOfWor
 
 
 @handler(commands.Restore)
-async def restore(command: commands.Restore, uow: SqlUnitOfWork):
-    # restores jobs and demos that were cut off during last restart
+async def restore(command: commands.Restore, uow: SqlUnitOfWork, match_cache):
+    # restores jobs and demos that were cut off during last restart.
+    # demo data is only loaded for matches that aren't cached
     async with uow:
-        jobs = await uow.jobs.get_restart()
+        jobs = await uow.jobs.get_restart(defer_data=True)
+
+        by_demo = defaultdict(list)
         for job in jobs:
-            job.selecting()
+            by_demo[job.demo.id].append(job)
+
+        for demo_jobs in by_demo.values():
+            await add_selectable(demo_jobs[0].demo, demo_jobs, uow, match_cache)
+
+
+async def evict_archives(budget: int, batch_size: int, uow: SqlUnitOfWork, deleted_ids: list):
+    async with uow:
+        rows = await uow.demos.evictable_archives(budget, batch_size)
+        deleted = set(await uow.demos.bulk_set_deleted([row.id for row in rows]))
+        evicted = [row for row in rows if row.id in deleted]
+
+        # the demos are marked as deleted in the same transaction,
+        # so nothing will try to reparse from the archives once they're gone
+        if evicted:
+            uow.outbox.add(
+                commands.DeleteDemoArchives(
+                    archives=[[row.origin, row.identifier] for row in evicted]
+                )
+            )
+
+        await uow.commit()
+
+    if evicted:
+        log.info("Retention deleting %s demo archives", len(evicted))
+
+        evicted_demos.inc(len(evicted), kind="archive")
+        evicted_bytes.inc(sum(row.size for row in evicted), kind="archive")
+        deleted_ids.extend(row.id for row in evicted)
 
+    return len(rows)
+
+
+async def evict_data(budget: int, batch_size: int, uow: SqlUnitOfWork):
+    async with uow:
+        rows = await uow.demos.evictable_data(budget, batch_size)
+        cleared = set(await uow.demos.bulk_clear_data([row.id for row in rows]))
         await uow.commit()
 
+    evicted = [row for row in rows if row.id in cleared]
+    if evicted:
+        log.info("Retention clearing data of %s demos", len(evicted))
+
+        evicted_demos.inc(len(evicted), kind="data")
+        evicted_bytes.inc(sum(row.size for row in evicted), kind="data")
+
+    return len(rows)
+
+
+@handler(commands.EnforceRetention)
+async def enforce_retention(command: commands.EnforceRetention, uow: SqlUnitOfWork):
+    # evicts in batches, each in its own transaction, until a batch comes back short.
+    # archives go first, deleting a demo also drops its data
+    deleted = []
+
+    if command.archive_budget is not None:
+        while (
+            await evict_archives(command.archive_budget, command.batch_size, uow, deleted)
+            == command.batch_size
+        ):
+            pass
+
+    if command.data_budget is not None:
+        while await evict_data(command.data_budget, command.batch_size, uow) == command.batch_size:
+            pass
+
+    # the uow only hands on the messages of its last transaction,
+    # so the deleted demos of every batch are announced at the end
+    if deleted:
+        async with uow:
+            uow.add_message(dto.DemosDeleted(demo_ids=deleted))
+
 
 @handler(commands.UpdateUserSettings)
 async def update_user_settings(command: commands.UpdateUserSettings, uow: SqlUnitOfWork):
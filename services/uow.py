@@ -1,9 +1,19 @@
 from collections import deque
+from time import perf_counter
 
 from sqlalchemy.ext.asyncio import AsyncSession, AsyncSessionTransaction
 
+from adapters import outbox
 from adapters.orm import Session
 from adapters.repo import DemoRepository, JobRepository, UserRepository
+from shared.metrics import Gauge, Histogram
+
+uow_seconds = Histogram(
+    "uow_seconds",
+    "Time units of work held a session and transaction for, by how they ended",
+    labelnames=("outcome",),
+)
+uow_open = Gauge("uow_open", "Units of work currently open")
 
 
 class SqlUnitOfWork:
@@ -11,8 +21,10 @@ class SqlUnitOfWork:
     transaction: AsyncSessionTransaction
     jobs: JobRepository
     demos: DemoRepository
+    outbox: outbox.OutboxRepository
 
     async def __aenter__(self):
+        self._started = perf_counter()
         self.session: AsyncSession = Session()
 
         self.messages = []
@@ -22,8 +34,10 @@ class SqlUnitOfWork:
         self.jobs = JobRepository(self.session)
         self.demos = DemoRepository(self.session)
         self.users = UserRepository(self.session)
+        self.outbox = outbox.OutboxRepository(self.session)
 
         self.transaction: AsyncSessionTransaction = await self.session.begin()
+        uow_open.inc()
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
@@ -44,6 +58,10 @@ class SqlUnitOfWork:
 
         await self.session.close()
 
+        uow_open.dec()
+        outcome = "commit" if self.committed else "rollback" if exc_type else "close"
+        uow_seconds.observe(perf_counter() - self._started, outcome=outcome)
+
     def add_message(self, event):
         self.messages.append(event)
 
@@ -51,5 +69,12 @@ class SqlUnitOfWork:
         await self.session.flush()
 
     async def commit(self):
+        has_outbox = bool(self.outbox.messages)
+        if has_outbox:
+            await self.outbox.flush()
+
         await self.transaction.commit()
         self.committed = True
+
+        if has_outbox:
+            outbox.pending.set()
@@ -1,41 +1,70 @@
+from datetime import datetime, timedelta
 from uuid import UUID
 
 from sqlalchemy import text
 
+from adapters.orm import read_engine
+from adapters.repo import INTERACTION_MINUTES
 from domain.domain import UserSettings
+from services.counters import recording_counter
 from services.uow import SqlUnitOfWork
+from shared.metrics import Histogram
+from shared.utils import utcnow
 
+# most of these are hit on the interactive path (autocomplete, job limit checks, buttons)
+# so they skip the uow entirely: no repositories, no transaction, no identity map,
+# just a single statement on a pooled (possibly replica) connection.
+# that also means they can lag slightly behind, don't use them for anything that writes
 
-async def job_inter(job_id: UUID, uow: SqlUnitOfWork):
-    async with uow:
-        return await uow.jobs.get_inter(job_id)
+view_latency = Histogram("view_seconds", "Latency of read-only view queries", labelnames=("view",))
 
 
-async def get_user_demo_formats(user_id: int, uow: SqlUnitOfWork):
-    async with uow:
-        stmt = text(
-            "SELECT d.id, d.game, d.origin, d.time, d.map, d.score, d.downloaded_at "
-            "FROM demo AS d JOIN job AS j ON j.demo_id=d.id "
-            "WHERE j.user_id=:user_id AND (d.state='READY' OR (d.state='FAILED' AND d.data_version IS NOT NULL)) "
-            "ORDER BY j.started_at DESC"
-        ).bindparams(user_id=user_id)
-        result = await uow.session.execute(stmt)
-        rows = result.all()
+async def _fetch(view: str, stmt):
+    with view_latency.time(view=view):
+        async with read_engine.connect() as conn:
+            # async results are buffered, so this is fine to use after the connection is returned
+            return await conn.execute(stmt)
 
-        def formatter(row):
-            time_str = row.time.strftime(f" %Y/%m/%d at %I:%M") if row.time else ""
-            score_str = "-".join(str(val) for val in row.score)
-            return f"[{row.origin}] {row.map} {score_str}{time_str}"
 
-        return {row.id: formatter(row) for row in rows}
+def format_demo(origin: str, map: str, score: list, time: datetime = None):
+    time_str = time.strftime(f" %Y/%m/%d at %I:%M") if time else ""
+    score_str = "-".join(str(val) for val in score)
+    return f"[{origin}] {map} {score_str}{time_str}"
 
 
-async def user_recording_count(user_id: int, uow: SqlUnitOfWork):
-    async with uow:
-        return await uow.jobs.recording_count(user_id=user_id)
+async def get_user_demo_formats(user_id: int, limit: int = None):
+    """Returns {demo id: description} for the users usable demos, most recently used first"""
+
+    stmt = text(
+        "SELECT d.id, d.origin, d.time, d.map, d.score "
+        "FROM demo AS d JOIN job AS j ON j.demo_id=d.id "
+        "WHERE j.user_id=:user_id AND (d.state='READY' OR (d.state='FAILED' AND d.data_version IS NOT NULL)) "
+        "GROUP BY d.id "
+        "ORDER BY MAX(j.started_at) DESC "
+        "LIMIT :limit"
+    ).bindparams(user_id=user_id, limit=limit)
+
+    result = await _fetch("user_demo_formats", stmt)
+
+    return {row.id: format_demo(row.origin, row.map, row.score, row.time) for row in result.all()}
+
+
+async def user_recording_count(user_id: int):
+    # kept in memory from job state events, see services.counters
+    return recording_counter.count(user_id)
+
+
+async def recording_jobs(minutes: int = INTERACTION_MINUTES):
+    stmt = text(
+        "SELECT id, user_id, started_at FROM job WHERE state='RECORDING' AND started_at > :since"
+    ).bindparams(since=utcnow() - timedelta(minutes=minutes))
+
+    result = await _fetch("recording_jobs", stmt)
+    return result.all()
 
 
 async def get_user_settings(user_id: int, tier: int, uow: SqlUnitOfWork):
+    # creates the settings row if missing, so this one stays on the uow
     async with uow:
         user = await uow.users.get_user(user_id)
         if user is None:
@@ -46,17 +75,15 @@ async def get_user_settings(user_id: int, tier: int, uow: SqlUnitOfWork):
         return user.filled(tier), UserSettings.value_tiers
 
 
-async def get_demo_origin_and_identifier(demo_id: int, uow: SqlUnitOfWork):
-    async with uow:
-        stmt = text("SELECT origin, identifier FROM demo WHERE id=:demo_id").bindparams(
-            demo_id=demo_id
-        )
-        result = await uow.session.execute(stmt)
-        return result.first()
+async def get_demo_origin_and_identifier(demo_id: int):
+    stmt = text("SELECT origin, identifier FROM demo WHERE id=:demo_id").bindparams(demo_id=demo_id)
 
+    result = await _fetch("demo_origin_and_identifier", stmt)
+    return result.first()
 
-async def get_job_demo_id(job_id: UUID, uow: SqlUnitOfWork):
-    async with uow:
-        stmt = text("SELECT demo_id FROM job WHERE id=:job_id").bindparams(job_id=job_id)
-        result = await uow.session.execute(stmt)
-        return result.scalar()
+
+async def get_job_demo_id(job_id: UUID):
+    stmt = text("SELECT demo_id FROM job WHERE id=:job_id").bindparams(job_id=job_id)
+
+    result = await _fetch("job_demo_id", stmt)
+    return result.scalar()
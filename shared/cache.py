@@ -0,0 +1,184 @@
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass
+from time import monotonic
+from typing import Awaitable, Callable, Generic, Hashable, TypeVar
+
+from shared.metrics import Counter
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+cache_events = Counter(
+    "cache_events_total",
+    "Cache lookups by outcome (hit, miss), and entries dropped (evicted, expired)",
+    labelnames=("cache", "event"),
+)
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class Cache(Generic[K, V]):
+    """In-memory cache holding at most maxsize entries, each for at most ttl seconds.
+
+    Lookups keep entries fresh in least recently used order, and inserting into a
+    full cache evicts the least recently used one. Expired entries are dropped on
+    every access, inserts included, so keys that are never asked for again don't
+    stay around. get_or_load runs a single load per key however many callers ask
+    for it at once."""
+
+    def __init__(
+        self,
+        name: str,
+        maxsize: int,
+        ttl: float = None,
+        clock: Callable[[], float] = monotonic,
+    ) -> None:
+        if maxsize < 1:
+            raise ValueError("Cache needs room for at least one entry")
+
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.stats = CacheStats()
+
+        # key -> value, least recently used first
+        self._values: OrderedDict[K, V] = OrderedDict()
+        # key -> when it expires, soonest first as every entry lives for the same ttl
+        self._expires: OrderedDict[K, float] = OrderedDict()
+        self._loading: dict[K, asyncio.Future] = dict()
+
+    def _count(self, event: str, amount: int = 1):
+        setattr(self.stats, event, getattr(self.stats, event) + amount)
+        cache_events.inc(amount, cache=self.name, event=event)
+
+    def _expire(self):
+        if self.ttl is None:
+            return
+
+        now = self.clock()
+        expired = 0
+
+        while self._expires:
+            key, expires = next(iter(self._expires.items()))
+            if expires > now:
+                break
+
+            del self._expires[key]
+            del self._values[key]
+            expired += 1
+
+        if expired:
+            self._count("expirations", expired)
+
+    def __len__(self) -> int:
+        self._expire()
+        return len(self._values)
+
+    def __contains__(self, key: K) -> bool:
+        self._expire()
+        return key in self._values
+
+    def get(self, key: K, default: V = None) -> V:
+        self._expire()
+
+        if key not in self._values:
+            self._count("misses")
+            return default
+
+        self._count("hits")
+        self._values.move_to_end(key)
+        return self._values[key]
+
+    def set(self, key: K, value: V):
+        self._expire()
+
+        self._values[key] = value
+        self._values.move_to_end(key)
+
+        if self.ttl is not None:
+            self._expires[key] = self.clock() + self.ttl
+            self._expires.move_to_end(key)
+
+        while len(self._values) > self.maxsize:
+            old_key, _ = self._values.popitem(last=False)
+            self._expires.pop(old_key, None)
+            self._count("evictions")
+
+    def peek(self, key: K, default: V = None) -> V:
+        """get without counting a lookup or refreshing the entry"""
+
+        self._expire()
+        return self._values.get(key, default)
+
+    def values(self) -> list[V]:
+        """Every cached value, without counting lookups or refreshing entries"""
+
+        self._expire()
+        return list(self._values.values())
+
+    def pop(self, key: K, default: V = None) -> V:
+        self._expires.pop(key, None)
+        return self._values.pop(key, default)
+
+    def clear(self):
+        self._values.clear()
+        self._expires.clear()
+
+    async def get_or_load(self, key: K, loader: Callable[[], Awaitable[V]]) -> V:
+        """Returns the cached value of key, or caches and returns what loader gives.
+
+        Callers asking for a key that is already loading wait for that load instead
+        of starting their own. Failed loads aren't cached, every waiter gets the error.
+        If the caller running the load is cancelled, its waiters start a load of their own."""
+
+        self._expire()
+
+        if key in self._values:
+            self._count("hits")
+            self._values.move_to_end(key)
+            return self._values[key]
+
+        self._count("misses")
+
+        future = self._loading.get(key)
+        if future is not None:
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # only the load was cancelled, not us
+                if future.cancelled() and not asyncio.current_task().cancelling():
+                    return await self.get_or_load(key, loader)
+                raise
+
+        future = self._loading[key] = asyncio.get_running_loop().create_future()
+
+        try:
+            value = await loader()
+        except Exception as exc:
+            future.set_exception(exc)
+            # retrieve it so waiterless failures aren't logged as never retrieved
+            future.exception()
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        else:
+            future.set_result(value)
+        finally:
+            del self._loading[key]
+
+        self.set(key, value)
+        return value
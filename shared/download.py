@@ -0,0 +1,520 @@
+import asyncio
+import bz2
+import logging
+import re
+import zlib
+from collections import deque
+from concurrent.futures import Executor
+from contextlib import aclosing
+from pathlib import Path
+from time import monotonic
+
+import aiohttp
+
+from shared import parallel_bz2
+from shared.metrics import Counter, Histogram
+from shared.parallel_bz2 import ParallelBz2Decompressor, ParallelBz2Error
+from shared.utils import CurlError, RunError, delete_file
+
+log = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+CONNECT_TIMEOUT = 8.0
+
+# servers that take Range requests get this much fetched per request, CONNECTIONS at a time
+SEGMENT_SIZE = 8 * 1024 * 1024
+CONNECTIONS = 4
+
+# a segment that stalls for READ_TIMEOUT or breaks off is resumed where it stopped
+READ_TIMEOUT = 10.0
+RETRIES = 3
+RETRY_DELAY = 0.5
+
+# curl exit codes, errors look the same as they did when downloads forked curl
+CURLE_COULDNT_CONNECT = 7
+CURLE_PARTIAL_FILE = 18
+CURLE_OPERATION_TIMEDOUT = 28
+CURLE_RECV_ERROR = 56
+
+CONTENT_RANGE = re.compile(r"bytes (\d+)-(\d+)/(\d+|\*)")
+
+# archives are fetched byte for byte like curl did. aiohttp asks for gzip and decodes
+# it on the fly, which would hand a .dem.gz served as gzip encoded to the
+# decompressors already decompressed, and throw off the size checks
+NO_ENCODING = {"Accept-Encoding": "identity"}
+
+# errors after connecting, which resuming the segment may get past
+TRANSIENT_ERRORS = (
+    aiohttp.ClientPayloadError,
+    aiohttp.ServerDisconnectedError,
+    aiohttp.ServerTimeoutError,
+)
+
+download_bytes = Counter(
+    "download_bytes_total",
+    "Bytes downloaded, as received (raw) and after decompression (decompressed)",
+    labelnames=("stage",),
+)
+download_seconds = Histogram(
+    "download_seconds",
+    "Wall time of streaming downloads, decompression included",
+    buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 45.0, 60.0, 120.0),
+)
+download_throughput = Histogram(
+    "download_throughput_mbps",
+    "Raw megabytes per second of streaming downloads",
+    buckets=(0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 50.0, 100.0, 200.0),
+)
+download_resumes = Counter(
+    "download_resumes_total",
+    "Download segments resumed after a transient error",
+)
+
+
+class DecompressError(RunError):
+    pass
+
+
+def compression_from_suffix(path: Path) -> str | None:
+    return dict(gz="gz", bz2="bz2").get(Path(path).suffix.lstrip("."))
+
+
+class Decompressor:
+    """Incremental gzip/bzip2 decompression.
+
+    Handles archives made of several concatenated streams, like the command line
+    tools do, by starting a new decompressor whenever one reaches its end."""
+
+    def __init__(self, compression: str) -> None:
+        if compression not in ("gz", "bz2"):
+            raise DecompressError(f"Unknown compression {compression}")
+
+        self.compression = compression
+        self._obj = self._new()
+
+    def _new(self):
+        if self.compression == "bz2":
+            return bz2.BZ2Decompressor()
+
+        # 16 + MAX_WBITS expects a gzip header and trailer
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def decompress(self, data: bytes) -> bytes:
+        out = []
+
+        try:
+            while data:
+                if self._obj.eof:
+                    self._obj = self._new()
+
+                out.append(self._obj.decompress(data))
+                data = self._obj.unused_data if self._obj.eof else b""
+        except (OSError, EOFError, zlib.error) as exc:
+            raise DecompressError(f"Corrupt {self.compression} archive") from exc
+
+        return b"".join(out)
+
+    def flush(self) -> bytes:
+        if not self._obj.eof:
+            raise DecompressError(f"Truncated {self.compression} archive")
+
+        return b""
+
+
+class DemoSink:
+    """Writes downloaded chunks to file, decompressed if compression is set,
+    and optionally the raw chunks to archive as well.
+
+    With an archive and an executor to run them on, bzip2 blocks are decompressed
+    in parallel by shared.parallel_bz2. If that fails the rest is only archived,
+    and finish decompresses the archive serially instead."""
+
+    def __init__(
+        self,
+        file: Path,
+        archive: Path = None,
+        compression: str = None,
+        executor: Executor = None,
+    ) -> None:
+        if compression == "bz2" and archive is not None and executor is not None:
+            self.decompressor = ParallelBz2Decompressor(executor)
+        elif compression:
+            self.decompressor = Decompressor(compression)
+        else:
+            self.decompressor = None
+
+        self.compression = compression
+        self.written = 0
+        self._serial = False
+
+        self._file = open(file, "wb")
+        self._archive = open(archive, "wb") if archive is not None else None
+
+    def write(self, chunk: bytes):
+        if self._archive is not None:
+            self._archive.write(chunk)
+
+        if self._serial:
+            return
+
+        if self.decompressor is not None:
+            try:
+                chunk = self.decompressor.decompress(chunk)
+            except ParallelBz2Error:
+                log.warning("Parallel decompression failed, decompressing serially when done")
+                self._serial = True
+                return
+
+        self._file.write(chunk)
+        self.written += len(chunk)
+
+    def finish(self):
+        if self.decompressor is None:
+            return
+
+        if not self._serial:
+            try:
+                tail = self.decompressor.flush()
+            except ParallelBz2Error:
+                self._serial = True
+            else:
+                self._file.write(tail)
+                self.written += len(tail)
+                return
+
+        self._decompress_archive()
+
+    def _decompress_archive(self):
+        self._archive.flush()
+        self._file.seek(0)
+        self._file.truncate()
+        self.written = 0
+
+        decompressor = Decompressor(self.compression)
+        with open(self._archive.name, "rb") as f:
+            while chunk := f.read(CHUNK_SIZE):
+                chunk = decompressor.decompress(chunk)
+                self._file.write(chunk)
+                self.written += len(chunk)
+
+        decompressor.flush()
+
+    def close(self):
+        if isinstance(self.decompressor, ParallelBz2Decompressor):
+            self.decompressor.close()
+
+        self._file.close()
+        if self._archive is not None:
+            self._archive.close()
+
+
+async def pump(chunks, sink: DemoSink) -> int:
+    """Feeds chunks to sink in a thread, writing one chunk while the next one is read"""
+
+    loop = asyncio.get_running_loop()
+    pending = None
+
+    try:
+        async for chunk in chunks:
+            if pending is not None:
+                await pending
+
+            pending = loop.run_in_executor(None, sink.write, chunk)
+
+        if pending is not None:
+            await pending
+            pending = None
+
+    finally:
+        # don't let the caller close the sink under a write that's still running
+        if pending is not None:
+            await asyncio.wait([pending])
+            if not pending.cancelled():
+                pending.exception()
+
+    await loop.run_in_executor(None, sink.finish)
+    return sink.written
+
+
+def client_timeout(read_timeout: float) -> aiohttp.ClientTimeout:
+    return aiohttp.ClientTimeout(total=None, connect=CONNECT_TIMEOUT, sock_read=read_timeout)
+
+
+def check_status(resp: aiohttp.ClientResponse, *expected: int):
+    if resp.status not in expected:
+        raise CurlError(code=0, http_code=resp.status)
+
+
+def is_transient(exc: Exception) -> bool:
+    if isinstance(exc, CurlError):
+        return exc.http_code >= 500
+    return isinstance(exc, TRANSIENT_ERRORS)
+
+
+async def fetch_range(
+    session: aiohttp.ClientSession,
+    url: str,
+    start: int,
+    end: int,
+    received: bytes = b"",
+    retries: int = RETRIES,
+    read_timeout: float = READ_TIMEOUT,
+) -> bytes:
+    """Fetches bytes start to end of url, end included, resuming after what has been
+    received so far whenever a request breaks off, stalls or gets a 5xx"""
+
+    data = bytearray(received)
+    size = end - start + 1
+    attempt = 0
+
+    while len(data) < size:
+        try:
+            async with session.get(
+                url,
+                headers=dict(NO_ENCODING, Range=f"bytes={start + len(data)}-{end}"),
+                timeout=client_timeout(read_timeout),
+            ) as resp:
+                check_status(resp, 206)
+                async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                    data += chunk
+
+        except (CurlError, *TRANSIENT_ERRORS) as exc:
+            if not is_transient(exc) or attempt >= retries:
+                raise
+
+            log.warning("Range %s-%s of %s failed (%r), resuming", start, end, url, exc)
+        else:
+            # the server closing early without an error is resumed as well
+            if len(data) >= size or attempt >= retries:
+                break
+
+        attempt += 1
+        download_resumes.inc()
+        await asyncio.sleep(RETRY_DELAY * 2 ** (attempt - 1))
+
+    if len(data) != size:
+        raise CurlError(
+            f"Got {len(data)} bytes for a range of {size}", code=CURLE_PARTIAL_FILE, http_code=206
+        )
+
+    return bytes(data)
+
+
+async def stream_body(resp: aiohttp.ClientResponse):
+    received = 0
+    async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+        received += len(chunk)
+        yield chunk
+
+    if resp.content_length is not None and received != resp.content_length:
+        raise CurlError(
+            f"Got {received} of {resp.content_length} bytes",
+            code=CURLE_PARTIAL_FILE,
+            http_code=resp.status,
+        )
+
+
+async def download_chunks(
+    session: aiohttp.ClientSession,
+    url: str,
+    connections: int = CONNECTIONS,
+    segment_size: int = SEGMENT_SIZE,
+    read_timeout: float = READ_TIMEOUT,
+):
+    """Yields the body of url in order.
+
+    The first request asks for the first segment. Servers that answer with a 206
+    get the rest fetched a segment per request, connections of them at a time and
+    resumed when they break off, which also works for S3 presigned urls as those
+    only sign GETs. Anything else is streamed from the one response like before.
+    Either way the size is checked against what the server said it would be."""
+
+    first = bytearray()
+
+    async with session.get(
+        url,
+        headers=dict(NO_ENCODING, Range=f"bytes=0-{segment_size - 1}"),
+        timeout=client_timeout(read_timeout),
+    ) as resp:
+        check_status(resp, 200, 206)
+
+        if resp.status == 200:
+            async for chunk in stream_body(resp):
+                yield chunk
+            return
+
+        match = CONTENT_RANGE.fullmatch(resp.headers.get("Content-Range", ""))
+        ranged = match is not None and match[1] == "0" and match[3] != "*"
+
+        if ranged:
+            try:
+                async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                    first += chunk
+            except TRANSIENT_ERRORS as exc:
+                log.warning("First range of %s failed (%r), resuming", url, exc)
+
+    if not ranged:
+        # can't split it up without knowing the size, ask for all of it instead
+        async with session.get(
+            url, headers=NO_ENCODING, timeout=client_timeout(read_timeout)
+        ) as resp:
+            check_status(resp, 200)
+            async for chunk in stream_body(resp):
+                yield chunk
+        return
+
+    first_end, size = int(match[2]), int(match[3])
+    if len(first) != first_end + 1:
+        first = await fetch_range(
+            session, url, 0, first_end, received=first, read_timeout=read_timeout
+        )
+
+    segments = iter(
+        (start, min(start + segment_size, size) - 1)
+        for start in range(first_end + 1, size, segment_size)
+    )
+    fetching = deque()
+
+    def fetch_next():
+        while len(fetching) < connections and (segment := next(segments, None)):
+            fetching.append(
+                asyncio.create_task(fetch_range(session, url, *segment, read_timeout=read_timeout))
+            )
+
+    received = 0
+    try:
+        fetch_next()
+        data = bytes(first)
+
+        while True:
+            received += len(data)
+            for i in range(0, len(data), CHUNK_SIZE):
+                yield data[i : i + CHUNK_SIZE]
+
+            if not fetching:
+                break
+
+            data = await fetching.popleft()
+            fetch_next()
+
+    finally:
+        for task in fetching:
+            task.cancel()
+        await asyncio.gather(*fetching, return_exceptions=True)
+
+    if received != size:
+        raise CurlError(f"Got {received} of {size} bytes", code=CURLE_PARTIAL_FILE, http_code=206)
+
+
+async def download_demo(
+    session: aiohttp.ClientSession,
+    url: str,
+    file: Path,
+    archive: Path = None,
+    compression: str = None,
+    timeout: float = 8.0,
+    executor: Executor = None,
+    connections: int = CONNECTIONS,
+):
+    """Downloads url to file, decompressing it on the fly if compression is set.
+
+    The raw download is also written to archive if given, which lets bzip2 archives
+    be decompressed a block per process of executor as well. Servers that take Range
+    requests are downloaded connections segments at a time, see download_chunks.
+    Errors are what they were with curl: CurlError with the http code for anything
+    but a 200/206, a failed connection or a size that doesn't add up, and
+    asyncio.TimeoutError if no data comes in for timeout seconds. A download that
+    keeps making progress isn't cut off however long it takes, stalled segments are
+    resumed after READ_TIMEOUT. Corrupt archives raise DecompressError. Nothing is
+    left behind on failure."""
+
+    started = monotonic()
+    raw = 0
+    loop = asyncio.get_running_loop()
+
+    async def chunks(body, deadline: asyncio.Timeout):
+        nonlocal raw
+        async for chunk in body:
+            raw += len(chunk)
+            deadline.reschedule(loop.time() + timeout)
+            yield chunk
+
+    try:
+        async with asyncio.timeout(timeout) as deadline:
+            async with aclosing(download_chunks(session, url, connections)) as body:
+                sink = DemoSink(file, archive, compression, executor)
+                try:
+                    written = await pump(chunks(body, deadline), sink)
+                finally:
+                    sink.close()
+
+    except aiohttp.ClientConnectorError as exc:
+        cleanup(file, archive)
+        raise CurlError(str(exc), code=CURLE_COULDNT_CONNECT, http_code=0) from exc
+    except aiohttp.ServerTimeoutError as exc:
+        cleanup(file, archive)
+        raise CurlError(str(exc), code=CURLE_OPERATION_TIMEDOUT, http_code=0) from exc
+    except aiohttp.ClientError as exc:
+        cleanup(file, archive)
+        raise CurlError(str(exc), code=CURLE_RECV_ERROR, http_code=0) from exc
+    except BaseException:
+        cleanup(file, archive)
+        raise
+
+    seconds = monotonic() - started
+    download_bytes.inc(raw, stage="raw")
+    download_bytes.inc(written, stage="decompressed")
+    download_seconds.observe(seconds)
+    download_throughput.observe(raw / 1e6 / max(seconds, 1e-6))
+
+    log.info(
+        "Downloaded %s bytes (%s decompressed) in %.2f seconds, %.2f MB/s",
+        raw,
+        written,
+        seconds,
+        raw / 1e6 / max(seconds, 1e-6),
+    )
+
+
+async def decompress_file(
+    archive: Path, file: Path, compression: str = None, executor: Executor = None
+):
+    """Decompresses archive to file without forking gzip/bzip2, the archive is kept.
+
+    bzip2 archives are decompressed a block per process of executor if given."""
+
+    compression = compression or compression_from_suffix(archive)
+
+    if compression == "bz2" and executor is not None:
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, parallel_bz2.decompress_file, archive, file, executor)
+        except (OSError, EOFError) as exc:
+            cleanup(file)
+            raise DecompressError("Corrupt bz2 archive") from exc
+        except BaseException:
+            cleanup(file)
+            raise
+        return
+
+    async def chunks():
+        loop = asyncio.get_running_loop()
+        with open(archive, "rb") as f:
+            while chunk := await loop.run_in_executor(None, f.read, CHUNK_SIZE):
+                yield chunk
+
+    sink = DemoSink(file, compression=compression)
+    try:
+        await pump(chunks(), sink)
+    except BaseException:
+        sink.close()
+        cleanup(file)
+        raise
+    else:
+        sink.close()
+
+
+def cleanup(*files):
+    for file in files:
+        if file is not None:
+            delete_file(Path(file))
@@ -0,0 +1,111 @@
+import heapq
+
+# stage -> what its duration scales with, None for a fixed cost per job
+STAGES = dict(
+    download=None,
+    decompress=None,
+    record="playback",
+    mux="recorded",
+    upload="recorded",
+)
+
+# seconds per unit until real timings come in
+DEFAULT_RATES = dict(
+    download=5.0,
+    decompress=3.0,
+    record=1.5,
+    mux=0.2,
+    upload=0.1,
+)
+
+
+def recorded_seconds(tickrate: int, start_tick: int, end_tick: int, skips: list) -> float:
+    skipped = sum(end - start for start, end, *_ in skips)
+    return (end_tick - start_tick - skipped) / tickrate
+
+
+def schedule(durations: list, busy: list, workers: int) -> list:
+    """Finish times of jobs handed out in order to whichever worker frees up first.
+
+    busy holds the remaining time of jobs already running, one per occupied worker,
+    and is included in workers"""
+
+    if workers < 1:
+        raise ValueError("Need at least one worker to schedule on")
+
+    free_at = list(busy[:workers]) + [0.0] * max(0, workers - len(busy))
+    heapq.heapify(free_at)
+
+    finished = []
+    for duration in durations:
+        finish = heapq.heappop(free_at) + duration
+        heapq.heappush(free_at, finish)
+        finished.append(finish)
+
+    return finished
+
+
+class RecordingEstimator:
+    """Predicts how long a recording job occupies a recorder.
+
+    Every stage in STAGES has a rate, an exponentially weighted moving average of
+    seconds per unit of what the stage scales with: the playback wall time planned
+    by domain.sequencer for the recording itself, the recorded seconds for muxing
+    and uploading, and nothing for the per job download and decompression."""
+
+    def __init__(self, alpha: float = 0.2, rates: dict = None) -> None:
+        self.alpha = alpha
+        self.rates = dict(DEFAULT_RATES)
+        if rates:
+            self.rates.update(rates)
+
+    @staticmethod
+    def _units(command) -> dict:
+        recorded = recorded_seconds(
+            command.tickrate, command.start_tick, command.end_tick, command.skips
+        )
+
+        # commands from before the sequencer estimated playback
+        playback = command.playback_seconds
+        if playback is None:
+            playback = recorded
+
+        return dict(playback=playback, recorded=recorded)
+
+    def estimate_stages(self, command) -> dict:
+        units = self._units(command)
+        return {
+            stage: self.rates[stage] * (1.0 if unit is None else units[unit])
+            for stage, unit in STAGES.items()
+        }
+
+    def estimate(self, command) -> float:
+        """Seconds the recorder will be busy with command"""
+        return sum(self.estimate_stages(command).values())
+
+    def observe(self, command, timings: dict):
+        units = self._units(command)
+
+        for stage, seconds in timings.items():
+            unit = STAGES.get(stage, False)
+            if unit is False:
+                continue
+
+            amount = 1.0 if unit is None else units[unit]
+            if amount <= 0:
+                continue
+
+            rate = seconds / amount
+            self.rates[stage] += self.alpha * (rate - self.rates[stage])
+
+    def eta(self, queued: list, busy: list, workers: int) -> float | None:
+        """Seconds until the last queued command is done recording, with the ones
+        before it handed out first and busy being the remaining seconds of the running ones"""
+
+        if workers < 1:
+            return None
+
+        if not queued:
+            return max(busy, default=0.0)
+
+        return schedule([self.estimate(command) for command in queued], busy, workers)[-1]
@@ -1,33 +1,139 @@
 import asyncio
 import logging
-from collections import defaultdict
+from time import monotonic
 from typing import TypeVar
 
+from shared.metrics import Histogram
+
 K = TypeVar("K")
 log = logging.getLogger(__name__)
 
+LOCK_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+lock_wait_seconds = Histogram(
+    "lock_wait_seconds",
+    "Time spent waiting to acquire a LockStore lock",
+    labelnames=("store", "holder"),
+    buckets=LOCK_BUCKETS,
+)
+lock_hold_seconds = Histogram(
+    "lock_hold_seconds",
+    "Time a LockStore lock was held for",
+    labelnames=("store", "holder"),
+    buckets=LOCK_BUCKETS,
+)
+
+
+class LockTimeout(asyncio.TimeoutError):
+    pass
+
+
+class KeyLock:
+    """The lock of a key, and who holds and waits for it"""
+
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        self.holder: str = None
+        self.acquired_at: float = None
+        # one token per waiter -> (holder, waiting since)
+        self.waiters: dict[object, tuple[str, float]] = dict()
+
 
 class EphemeralLock:
-    def __init__(self, locks: dict[K, asyncio.Lock], key: K) -> None:
-        self.locks = locks
+    def __init__(
+        self, store: "LockStore", key: K, holder: str = "unknown", timeout: float = None
+    ) -> None:
+        self.store = store
         self.key = key
-        self.lock = None
+        self.holder = holder
+        self.timeout = timeout
+        self.entry: KeyLock = None
 
     async def __aenter__(self):
-        self.lock = self.locks[self.key]
-        if self.lock.locked():
-            log.warn("Lock acquire needs waiter for lock key %s", self.key)
-        await self.lock.acquire()
+        entry = self.store.locks.get(self.key)
+        if entry is None:
+            entry = self.store.locks[self.key] = KeyLock()
+        self.entry = entry
+
+        if entry.lock.locked():
+            log.debug("Lock key %s held by %s, %s waits", self.key, entry.holder, self.holder)
+
+        token = object()
+        started = monotonic()
+        entry.waiters[token] = (self.holder, started)
+
+        try:
+            async with asyncio.timeout(self.timeout):
+                await entry.lock.acquire()
+        except TimeoutError:
+            # who holds and waits for what, while the waiter still counts
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug(
+                    "%s locks as %s timed out: %s", self.store.name, self.holder, self.store.dump()
+                )
+            raise LockTimeout(
+                f"{self.holder} timed out after {self.timeout} seconds waiting for "
+                f"{self.store.name} lock {self.key}, held by {entry.holder}"
+            ) from None
+        finally:
+            del entry.waiters[token]
+            self.store._discard(self.key, entry)
+
+        lock_wait_seconds.observe(monotonic() - started, store=self.store.name, holder=self.holder)
+        entry.holder = self.holder
+        entry.acquired_at = monotonic()
 
     async def __aexit__(self, *junk):
-        self.lock.release()
-        if not self.lock._waiters:
-            del self.locks[self.key]
+        entry = self.entry
+        lock_hold_seconds.observe(
+            monotonic() - entry.acquired_at, store=self.store.name, holder=self.holder
+        )
+
+        entry.holder = entry.acquired_at = None
+        entry.lock.release()
+        self.store._discard(self.key, entry)
 
 
 class LockStore:
-    def __init__(self) -> None:
-        self.locks: dict[K, asyncio.Lock] = defaultdict(asyncio.Lock)
+    """Per key asyncio locks, that only exist while held or waited for.
+
+    Waiting and holding times go to the lock_wait_seconds and lock_hold_seconds
+    histograms, labelled with the name of the store and the holder given to get,
+    and dump lists who holds and waits for what right now."""
+
+    def __init__(self, name: str = "locks", timeout: float = None) -> None:
+        self.name = name
+        self.timeout = timeout
+        self.locks: dict[K, KeyLock] = dict()
+
+    def get(self, key: K, holder: str = "unknown", timeout: float = None):
+        """Lock for key, raising LockTimeout if it takes longer than timeout,
+        or the store's timeout if not given, to acquire"""
+
+        return EphemeralLock(self, key, holder, self.timeout if timeout is None else timeout)
+
+    def _discard(self, key: K, entry: KeyLock):
+        if not entry.lock.locked() and not entry.waiters and self.locks.get(key) is entry:
+            del self.locks[key]
+
+    def dump(self) -> list[dict]:
+        """Held and waited for locks, longest held first"""
+
+        now = monotonic()
+        dumped = []
+
+        for key, entry in self.locks.items():
+            waiters = [
+                dict(holder=holder, waiting=now - since)
+                for holder, since in sorted(entry.waiters.values(), key=lambda w: w[1])
+            ]
+            dumped.append(
+                dict(
+                    key=key,
+                    holder=entry.holder,
+                    held=None if entry.acquired_at is None else now - entry.acquired_at,
+                    waiters=waiters,
+                )
+            )
 
-    def get(self, key: K):
-        return EphemeralLock(self.locks, key)
+        return sorted(dumped, key=lambda lock: -(lock["held"] or 0.0))
@@ -0,0 +1,229 @@
+import asyncio
+import logging
+from bisect import bisect_left
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Callable
+
+log = logging.getLogger(__name__)
+
+# latency buckets in seconds, roughly the prometheus client defaults
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+registry = dict()
+
+# added to every sample, so metrics of all processes can be scraped into one place
+service_labels = dict()
+
+
+def set_service(name: str):
+    service_labels["service"] = name
+
+
+class Metric:
+    def __init__(self, name: str, documentation: str = "", labelnames: tuple = ()) -> None:
+        if name in registry:
+            raise ValueError(f"Metric {name} already registered")
+
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+        registry[name] = self
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Metric {self.name} expects labels {self.labelnames}, got {labels}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+
+class Counter(Metric):
+    def __init__(self, name: str, documentation: str = "", labelnames: tuple = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple, float] = dict()
+
+    def inc(self, amount: float = 1.0, **labels):
+        if amount < 0:
+            raise ValueError("Counters can only be incremented")
+
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def snapshot(self):
+        """Returns {label values: value}"""
+        return dict(self._values)
+
+
+class Gauge(Metric):
+    def __init__(self, name: str, documentation: str = "", labelnames: tuple = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple, float] = dict()
+        self._functions: dict[tuple, Callable[[], float]] = dict()
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float], **labels):
+        """Reads the value from function whenever the gauge is collected"""
+        self._functions[self._key(labels)] = function
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def snapshot(self):
+        """Returns {label values: value}"""
+        values = dict(self._values)
+        for key, function in self._functions.items():
+            values[key] = float(function())
+        return values
+
+
+class Histogram(Metric):
+    def __init__(
+        self,
+        name: str,
+        documentation: str = "",
+        labelnames: tuple = (),
+        buckets: tuple = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+        # label values -> [per bucket counts..., +Inf count], sum
+        self._counts: dict[tuple, list] = dict()
+        self._sums: dict[tuple, float] = dict()
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+
+        counts = self._counts.get(key)
+        if counts is None:
+            counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+            self._sums[key] = 0.0
+
+        counts[bisect_left(self.buckets, value)] += 1
+        self._sums[key] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - start, **labels)
+
+    def snapshot(self):
+        """Returns {label values: (cumulative bucket counts, sum, count)}"""
+
+        result = dict()
+        for key, counts in self._counts.items():
+            cumulative = []
+            total = 0
+            for count in counts:
+                total += count
+                cumulative.append(total)
+
+            result[key] = (cumulative, self._sums[key], total)
+
+        return result
+
+
+def _escape(value: str, quotes: bool = True) -> str:
+    value = value.replace("\\", "\\\\").replace("\n", "\\n")
+    return value.replace('"', '\\"') if quotes else value
+
+
+def _sample(name: str, labels: dict, value: float) -> str:
+    labels = {**service_labels, **labels}
+    if labels:
+        pairs = ",".join(f'{key}="{_escape(str(val))}"' for key, val in labels.items())
+        name = f"{name}{{{pairs}}}"
+
+    return f"{name} {value!r}"
+
+
+def render() -> str:
+    """Every registered metric in the Prometheus text exposition format"""
+
+    lines = []
+
+    for metric in registry.values():
+        kind = type(metric).__name__.lower()
+        lines.append(f"# HELP {metric.name} {_escape(metric.documentation, quotes=False)}")
+        lines.append(f"# TYPE {metric.name} {kind}")
+
+        for key, value in sorted(metric.snapshot().items()):
+            labels = dict(zip(metric.labelnames, key))
+
+            if not isinstance(metric, Histogram):
+                lines.append(_sample(metric.name, labels, value))
+                continue
+
+            cumulative, total, count = value
+            for bound, bucket_count in zip((*metric.buckets, "+Inf"), cumulative):
+                le = bound if isinstance(bound, str) else repr(float(bound))
+                lines.append(_sample(f"{metric.name}_bucket", {**labels, "le": le}, bucket_count))
+            lines.append(_sample(f"{metric.name}_sum", labels, total))
+            lines.append(_sample(f"{metric.name}_count", labels, count))
+
+    return "\n".join(lines) + "\n"
+
+
+async def _serve_request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request = (await asyncio.wait_for(reader.readline(), timeout=5.0)).decode("latin-1")
+
+        # the headers don't matter, but have to be read before answering
+        while True:
+            line = await asyncio.wait_for(reader.readline(), timeout=5.0)
+            if line in (b"\r\n", b"\n", b""):
+                break
+
+        parts = request.split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            status, content_type, body = "200 OK", CONTENT_TYPE, render().encode()
+        else:
+            status, content_type, body = "404 Not Found", "text/plain", b"Not found\n"
+
+        head = (
+            f"HTTP/1.1 {status}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n"
+        )
+        writer.write(head.encode() + body)
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_server(port: int, host: str = "0.0.0.0") -> asyncio.AbstractServer:
+    """Serves /metrics on a port of its own, for processes without a web server"""
+
+    server = await asyncio.start_server(_serve_request, host, port)
+    log.info("Serving metrics on %s:%s/metrics", host, port)
+    return server
+
+
+async def aiohttp_handler(request):
+    """/metrics for processes that already run an aiohttp app"""
+
+    from aiohttp import web
+
+    return web.Response(body=render().encode(), headers={"Content-Type": CONTENT_TYPE})
@@ -0,0 +1,188 @@
+"""Block-parallel bzip2 decompression.
+
+A bzip2 stream is a "BZh" header and a run of blocks, each starting with a 48-bit
+magic number that isn't aligned to a byte, followed by an end-of-stream magic and a
+combined CRC. Every block only depends on itself, so it can be cut out, wrapped in a
+header and trailer of its own and handed to a worker process, which is what
+pbzip2/lbzip2 do. The magic can show up in compressed data by chance, in which case
+the pieces either side of it fail to decompress and ParallelBz2Error is raised so
+the caller can fall back to decompressing the whole thing serially."""
+
+import bz2
+import logging
+from collections import deque
+from concurrent.futures import Executor, Future
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+
+BLOCK_MAGIC = 0x314159265359
+EOS_MAGIC = 0x177245385090
+MAGIC_BITS = 48
+MAGIC_MASK = (1 << MAGIC_BITS) - 1
+
+# 900k blocks, the largest there is, so any block fits
+HEADER = b"BZh9"
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class ParallelBz2Error(Exception):
+    pass
+
+
+def _patterns(magic: int) -> list:
+    """(bit offset, bytes the magic fully covers at that offset, index of the first of them)"""
+
+    patterns = []
+    for shift in range(8):
+        # the magic starting shift bits into the first of 7 bytes
+        window = (magic << (8 - shift)).to_bytes(7, "big")
+        first = 0 if shift == 0 else 1
+        patterns.append((shift, window[first:6], first))
+
+    return patterns
+
+
+PATTERNS = {magic: _patterns(magic) for magic in (BLOCK_MAGIC, EOS_MAGIC)}
+
+
+def find_markers(data: bytes, start: int = 0) -> list:
+    """Sorted (bit position, magic) of the block and end-of-stream markers in data
+    starting at byte start or later, with the 7 bytes around them available"""
+
+    markers = []
+    last = len(data) - 7
+
+    for magic, patterns in PATTERNS.items():
+        for shift, pattern, first in patterns:
+            at = data.find(pattern, start + first)
+
+            while at != -1 and at - first <= last:
+                byte = at - first
+                window = int.from_bytes(data[byte : byte + 7], "big")
+                if (window >> (8 - shift)) & MAGIC_MASK == magic:
+                    markers.append((byte * 8 + shift, magic))
+
+                at = data.find(pattern, at + 1)
+
+    return sorted(markers)
+
+
+def decompress_block(data: bytes, start: int, end: int) -> bytes:
+    """Decompresses the block between bits start and end of data, by making it a
+    stream of its own. The combined CRC of a single block stream is the block CRC
+    that follows the block magic."""
+
+    bits = end - start
+    block = (int.from_bytes(data, "big") >> (len(data) * 8 - end)) & ((1 << bits) - 1)
+    crc = (block >> (bits - MAGIC_BITS - 32)) & 0xFFFFFFFF
+
+    stream = (((block << MAGIC_BITS) | EOS_MAGIC) << 32) | crc
+    bits += MAGIC_BITS + 32
+    padding = -bits % 8
+
+    stream = (stream << padding).to_bytes((bits + padding) // 8, "big")
+    return bz2.decompress(HEADER + stream)
+
+
+class ParallelBz2Decompressor:
+    """Incremental decompression that hands every complete block to executor,
+    a process pool, and returns what they decompress to in order.
+
+    Drop-in for shared.download.Decompressor, except that errors are ParallelBz2Error
+    and output can lag behind input until flush. At most max_pending blocks are in
+    flight, decompress blocks on the oldest one when there are more."""
+
+    def __init__(self, executor: Executor, max_pending: int = 16) -> None:
+        self.executor = executor
+        self.max_pending = max_pending
+
+        self._buffer = bytearray()
+        self._offset = 0  # absolute byte position of _buffer[0]
+        self._scanned = 0  # absolute byte position markers were searched up to
+        self._block = None  # absolute bit position of the current block's magic
+        self._checked = False
+        self._ended = False
+        self._pending: deque[Future] = deque()
+
+    def _submit(self, start: int, end: int):
+        first, last = start // 8, (end + 7) // 8
+        data = bytes(self._buffer[first - self._offset : last - self._offset])
+        self._pending.append(
+            self.executor.submit(decompress_block, data, start - first * 8, end - first * 8)
+        )
+
+    def _collect(self, wait: bool) -> bytes:
+        out = []
+
+        while self._pending and (
+            wait or self._pending[0].done() or len(self._pending) > self.max_pending
+        ):
+            future = self._pending.popleft()
+            try:
+                out.append(future.result())
+            except Exception as exc:
+                self.close()
+                raise ParallelBz2Error("Failed decompressing bzip2 block") from exc
+
+        return b"".join(out)
+
+    def decompress(self, data: bytes) -> bytes:
+        self._buffer += data
+
+        if not self._checked and len(self._buffer) >= 4:
+            if self._buffer[:3] != b"BZh" or self._buffer[3] not in b"123456789":
+                raise ParallelBz2Error("Not a bzip2 stream")
+            self._checked = True
+
+        for position, magic in find_markers(self._buffer, self._scanned - self._offset):
+            position += self._offset * 8
+            if self._block is not None:
+                self._submit(self._block, position)
+
+            self._block = position if magic == BLOCK_MAGIC else None
+            self._ended = magic == EOS_MAGIC
+
+        self._scanned = max(self._scanned, self._offset + len(self._buffer) - 6)
+
+        # keep the current block and what hasn't been searched for markers yet
+        keep = self._scanned if self._block is None else min(self._block // 8, self._scanned)
+        del self._buffer[: keep - self._offset]
+        self._offset = keep
+
+        return self._collect(wait=False)
+
+    def flush(self) -> bytes:
+        if not self._ended:
+            self.close()
+            raise ParallelBz2Error("Truncated bzip2 archive")
+
+        return self._collect(wait=True)
+
+    def close(self):
+        for future in self._pending:
+            future.cancel()
+        self._pending.clear()
+
+
+def decompress_file(archive: Path, file: Path, executor: Executor):
+    """Decompresses archive to file a block per worker of executor,
+    and serially if that fails"""
+
+    try:
+        decompressor = ParallelBz2Decompressor(executor)
+        with open(archive, "rb") as src, open(file, "wb") as dst:
+            while chunk := src.read(CHUNK_SIZE):
+                dst.write(decompressor.decompress(chunk))
+            dst.write(decompressor.flush())
+    except ParallelBz2Error:
+        log.warning("Parallel decompression of %s failed, retrying serially", archive)
+        decompress_file_serial(archive, file)
+
+
+def decompress_file_serial(archive: Path, file: Path):
+    # bz2.open reads concatenated streams like bzip2 -d does
+    with bz2.open(archive, "rb") as src, open(file, "wb") as dst:
+        while chunk := src.read(CHUNK_SIZE):
+            dst.write(chunk)
@@ -6,6 +6,7 @@ from pathlib import Path
 from shutil import rmtree
 import signal
 from time import monotonic
+from typing import Callable
 
 import sentry_sdk
 from sentry_sdk.integrations.asyncio import AsyncioIntegration
@@ -35,8 +36,73 @@ class CurlError(RunError):
         self.http_code = http_code
 
 
-async def run(program: str, *args, timeout: float = 8.0):
+# read size for subprocess pipes
+PIPE_CHUNK_SIZE = 64 * 1024
+# stderr, and the end of stdout, kept for diagnostics
+OUTPUT_TAIL_SIZE = 64 * 1024
+
+
+class RunOutput:
+    """What a process wrote before it was stopped"""
+
+    def __init__(self, program: str) -> None:
+        self.program = program
+        self.stdout_size = 0
+        self.stdout_tail = bytearray()
+        self.stderr = bytearray()
+        self.started = monotonic()
+
+    def add_stdout(self, chunk: bytes):
+        self.stdout_size += len(chunk)
+        self.stdout_tail += chunk
+        del self.stdout_tail[:-OUTPUT_TAIL_SIZE]
+
+    def add_stderr(self, chunk: bytes):
+        self.stderr += chunk
+        del self.stderr[:-OUTPUT_TAIL_SIZE]
+
+    def describe(self) -> str:
+        return (
+            f"{self.program} after {monotonic() - self.started:.2f} seconds, "
+            f"{self.stdout_size} bytes of stdout, ending in {bytes(self.stdout_tail[-200:])!r}, "
+            f"stderr ending in {bytes(self.stderr[-500:])!r}"
+        )
+
+
+class RunTimeoutError(asyncio.TimeoutError):
+    def __init__(self, output: RunOutput) -> None:
+        super().__init__(f"Timed out: {output.describe()}")
+        self.output = output
+
+
+class OutputLimitError(RunError):
+    def __init__(self, output: RunOutput, limit: int) -> None:
+        super().__init__(f"Output over {limit} bytes: {output.describe()}")
+        self.output = output
+
+
+async def run_piped(
+    program: str,
+    *args,
+    consumer: Callable[[bytes], object],
+    timeout: float = 8.0,
+    max_output: int = None,
+) -> tuple[int, str]:
+    """Runs program, handing its stdout to consumer chunk by chunk as it comes in.
+
+    consumer can be anything taking bytes, like list.append, an incremental decoder
+    or a compressor. Returns the exit code and stderr, of which only the last
+    OUTPUT_TAIL_SIZE bytes are kept. The process is killed if it runs for longer
+    than timeout, raising RunTimeoutError, or writes more than max_output bytes to
+    stdout, raising OutputLimitError. Both carry what it wrote until then."""
+
+    output = RunOutput(program)
     proc = None
+    stderr_reader = None
+
+    async def read_stderr():
+        while chunk := await proc.stderr.read(PIPE_CHUNK_SIZE):
+            output.add_stderr(chunk)
 
     try:
         async with asyncio.timeout(timeout):
@@ -48,60 +114,35 @@ async def run(program: str, *args, timeout: float = 8.0):
                 stdout=asyncio.subprocess.PIPE,
                 stderr=asyncio.subprocess.PIPE,
             )
+            stderr_reader = asyncio.create_task(read_stderr())
 
-            stdout, stderr = await proc.communicate()
-            return proc.returncode, stdout.decode(), stderr.decode()
-    except asyncio.TimeoutError:
-        if proc is not None:
-            proc.kill()
-        raise
-
-
-async def download_file(url: str, file: Path, timeout: float = 8.0) -> bool:
-    code, stdout, stderr = await run(
-        "curl",
-        "--connect-timeout",
-        "8",
-        "--max-time",
-        str(timeout),
-        "-s",
-        "-w",
-        "%{http_code}",
-        "-o",
-        file,
-        url,
-        timeout=timeout,
-    )
-
-    if code != 0 or stdout != "200":
-        try:
-            http_code = int(stdout.strip())
-        except ValueError:
-            http_code = 0
-
-        raise CurlError(code=code, http_code=http_code)
-
+            while chunk := await proc.stdout.read(PIPE_CHUNK_SIZE):
+                output.add_stdout(chunk)
+                if max_output is not None and output.stdout_size > max_output:
+                    raise OutputLimitError(output, max_output)
 
-async def decompress(archive: Path, file: Path):
-    suffix = archive.suffix
+                consumer(chunk)
 
-    if suffix == ".gz":
-        program = "gzip"
-    elif suffix == ".bz2":
-        program = "bzip2"
-    else:
-        raise RunError("Unknown archive suffix")
+            await stderr_reader
+            return await proc.wait(), output.stderr.decode(errors="replace")
 
-    if file.is_file():
-        delete_file(file)
-
-    code, stdout, stderr = await run(program, "-dk", archive, timeout=32.0)
+    except asyncio.TimeoutError:
+        raise RunTimeoutError(output) from None
+    finally:
+        if stderr_reader is not None:
+            stderr_reader.cancel()
+        if proc is not None and proc.returncode is None:
+            proc.kill()
+            # reaped here, rather than after the loop that owns its pipes is gone
+            await proc.wait()
 
-    if code != 0:
-        raise RunError(code=code)
 
-    decompressed = archive.parent / archive.stem
-    rename_file(decompressed, file)
+async def run(program: str, *args, timeout: float = 8.0, max_output: int = None):
+    stdout = []
+    code, stderr = await run_piped(
+        program, *args, consumer=stdout.append, timeout=timeout, max_output=max_output
+    )
+    return code, b"".join(stdout).decode(), stderr
 
 
 def rename_file(path: Path, dst: Path):
@@ -192,38 +233,3 @@ ordinal = lambda n: "%d%s" % (
     n,
     "tsnrhtdd"[(n // 10 % 10 != 1) * (n % 10 < 4) * n % 10 :: 4],
 )
-
-
-class MISSING:
-    pass
-
-
-class TimedDict(dict):
-    def __init__(self, ttl=10.0):
-        self._ttl = ttl
-        self._used_at = dict()
-
-    def get(self, key, default=MISSING):
-        try:
-            return self.__getitem__(key)
-        except KeyError:
-            if default is MISSING:
-                raise
-
-            return default
-
-    def __getitem__(self, key):
-        set_at = self._used_at.get(key, None)
-        now = monotonic()
-
-        if set_at is not None and now - set_at >= self._ttl:
-            del self[key]
-
-        val = dict.__getitem__(self, key)
-        self._used_at[key] = now
-
-        return val
-
-    def __setitem__(self, key, val):
-        self._used_at[key] = monotonic()
-        dict.__setitem__(self, key, val)
@@ -0,0 +1,287 @@
+import asyncio
+import json
+import logging
+from itertools import count
+from time import monotonic
+from typing import Callable
+
+from shared.metrics import Counter, Gauge, Histogram
+from shared.utils import PIPE_CHUNK_SIZE, RunError
+
+log = logging.getLogger(__name__)
+
+worker_seconds = Histogram(
+    "worker_seconds",
+    "Time spent waiting for a pool worker, and per stage of its jobs as reported by the worker",
+    labelnames=("pool", "stage"),
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0),
+)
+worker_recycles = Counter(
+    "worker_recycles_total",
+    "Pool workers replaced, by reason (jobs, memory, failed, died, unhealthy)",
+    labelnames=("pool", "reason"),
+)
+pool_workers = Gauge("pool_workers", "Running pool workers", labelnames=("pool",))
+
+
+class WorkerError(RunError):
+    pass
+
+
+class WorkerTimeout(asyncio.TimeoutError):
+    pass
+
+
+class Worker:
+    """A long lived process answering one request at a time.
+
+    Requests are written as a json line to its stdin, and answered on its stdout
+    with a json header line, followed by header["length"] bytes of body. The
+    header has the id of the request, ok, error if not ok, the timings of the job
+    and the rss of the worker."""
+
+    def __init__(self, proc: asyncio.subprocess.Process) -> None:
+        self.proc = proc
+        self.jobs = 0
+        self.rss = 0
+        self.last_used = monotonic()
+        # set while a request is in flight, a worker left that way is out of sync
+        self.broken = False
+        self._ids = count()
+
+    @classmethod
+    async def spawn(cls, program: str, *args) -> "Worker":
+        log.info("Spawning worker %s %s", program, " ".join(str(arg) for arg in args))
+
+        proc = await asyncio.create_subprocess_exec(
+            program,
+            *args,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+        )
+        return cls(proc)
+
+    @property
+    def alive(self) -> bool:
+        return self.proc.returncode is None
+
+    async def request(
+        self, request: dict, consumer: Callable[[bytes], object] = None, max_output: int = None
+    ) -> dict:
+        """Sends request and hands the body of the answer to consumer chunk by chunk.
+
+        Returns the header, raising WorkerError if the worker dies, answers more
+        than max_output bytes or answers that the job failed."""
+
+        request_id = next(self._ids)
+        self.broken = True
+
+        try:
+            self.proc.stdin.write(json.dumps(dict(request, id=request_id)).encode() + b"\n")
+            await self.proc.stdin.drain()
+            line = await self.proc.stdout.readline()
+        except ConnectionError as exc:
+            raise WorkerError(f"Worker pipe closed: {exc}") from exc
+
+        if not line:
+            code = await self.proc.wait()
+            raise WorkerError(f"Worker exited with {code}", code=code)
+
+        try:
+            header = json.loads(line)
+        except ValueError as exc:
+            raise WorkerError(f"Worker answered with garbage: {line[:200]!r}") from exc
+
+        if header.get("id") != request_id:
+            raise WorkerError(f"Worker answered request {header.get('id')}, not {request_id}")
+
+        self.rss = header.get("rss", 0)
+        remaining = header.get("length", 0)
+
+        if max_output is not None and remaining > max_output:
+            raise WorkerError(f"Worker answered {remaining} bytes, over {max_output}")
+
+        while remaining:
+            chunk = await self.proc.stdout.read(min(remaining, PIPE_CHUNK_SIZE))
+            if not chunk:
+                raise WorkerError(f"Worker exited with {remaining} bytes left to answer")
+
+            remaining -= len(chunk)
+            if consumer is not None:
+                consumer(chunk)
+
+        self.broken = False
+        self.last_used = monotonic()
+
+        if not header.get("ok"):
+            raise WorkerError(header.get("error") or "Worker failed without saying why")
+
+        return header
+
+    async def kill(self):
+        if self.alive:
+            self.proc.kill()
+        await self.proc.wait()
+
+    async def close(self, timeout: float = 5.0):
+        """Closes stdin, which the worker takes as its cue to exit, or kills it"""
+
+        self.proc.stdin.close()
+
+        try:
+            await asyncio.wait_for(self.proc.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            await self.kill()
+
+
+class WorkerPool:
+    """At most size Workers, each running at most max_jobs jobs.
+
+    Workers are spawned as they're needed, or up front with start. A worker is
+    replaced when it dies, leaves a request half answered, times out, reports an
+    rss over max_rss or has run max_jobs jobs. Workers idle for longer than
+    health_interval are pinged before they get another job, and replaced if they
+    don't answer within health_timeout."""
+
+    def __init__(
+        self,
+        name: str,
+        program: str,
+        *args,
+        size: int = 1,
+        max_jobs: int = 100,
+        max_rss: int = None,
+        timeout: float = 32.0,
+        health_interval: float = 30.0,
+        health_timeout: float = 5.0,
+    ) -> None:
+        self.name = name
+        self.program = program
+        self.args = args
+        self.size = size
+        self.max_jobs = max_jobs
+        self.max_rss = max_rss
+        self.timeout = timeout
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+
+        self.workers: set[Worker] = set()
+        # one entry per worker that may run, None until it's been spawned
+        self.slots: asyncio.Queue[Worker | None] = asyncio.Queue()
+        for _ in range(size):
+            self.slots.put_nowait(None)
+
+        pool_workers.set_function(lambda: len(self.workers), pool=name)
+
+    async def _spawn(self) -> Worker:
+        worker = await Worker.spawn(self.program, *self.args)
+        self.workers.add(worker)
+        return worker
+
+    async def _retire(self, worker: Worker, reason: str):
+        if worker not in self.workers:
+            return
+
+        log.info("Replacing worker %s of pool %s: %s", worker.proc.pid, self.name, reason)
+        worker_recycles.inc(pool=self.name, reason=reason)
+        self.workers.discard(worker)
+
+        if reason in ("jobs", "memory"):
+            await worker.close()
+        else:
+            await worker.kill()
+
+    async def _healthy(self, worker: Worker) -> bool:
+        try:
+            async with asyncio.timeout(self.health_timeout):
+                await worker.request(dict(ping=True))
+        except (WorkerError, TimeoutError) as exc:
+            log.warning(
+                "Worker %s of pool %s failed health check: %r", worker.proc.pid, self.name, exc
+            )
+            return False
+
+        return True
+
+    async def _checkout(self, worker: Worker | None) -> Worker:
+        if worker is not None and not worker.alive:
+            await self._retire(worker, "died")
+            worker = None
+        elif worker is not None and monotonic() - worker.last_used > self.health_interval:
+            if not await self._healthy(worker):
+                await self._retire(worker, "unhealthy")
+                worker = None
+
+        return worker or await self._spawn()
+
+    def _checkin(self, worker: Worker | None) -> tuple[Worker | None, str | None]:
+        """What goes back into the slot of worker, and why worker is retired if it is"""
+
+        if worker is None or worker not in self.workers:
+            return None, None
+        if not worker.alive:
+            return None, "died"
+        if worker.broken:
+            return None, "failed"
+        if worker.jobs >= self.max_jobs:
+            return None, "jobs"
+        if self.max_rss is not None and worker.rss > self.max_rss:
+            return None, "memory"
+
+        return worker, None
+
+    async def start(self):
+        """Spawns a worker for every slot that doesn't have one yet"""
+
+        slots = [self.slots.get_nowait() for _ in range(self.slots.qsize())]
+
+        try:
+            for index, worker in enumerate(slots):
+                if worker is None:
+                    slots[index] = await self._spawn()
+        finally:
+            for worker in slots:
+                self.slots.put_nowait(worker)
+
+    async def run(
+        self, request: dict, consumer: Callable[[bytes], object] = None, max_output: int = None
+    ) -> dict[str, float]:
+        """Runs request on a worker, handing the body of its answer to consumer.
+
+        Returns the timings of the job, wait being how long it took to get a worker
+        and the rest as reported by the worker. Raises WorkerTimeout if the job
+        takes longer than timeout, and WorkerError if it fails."""
+
+        started = monotonic()
+        worker = await self.slots.get()
+
+        try:
+            worker = await self._checkout(worker)
+            timings = dict(wait=monotonic() - started)
+
+            try:
+                async with asyncio.timeout(self.timeout):
+                    header = await worker.request(request, consumer, max_output)
+            except TimeoutError:
+                raise WorkerTimeout(
+                    f"Worker {worker.proc.pid} of pool {self.name} timed out after "
+                    f"{self.timeout} seconds"
+                ) from None
+            finally:
+                worker.jobs += 1
+        finally:
+            slot, reason = self._checkin(worker)
+            self.slots.put_nowait(slot)
+            if reason is not None:
+                await self._retire(worker, reason)
+
+        timings.update(header.get("timings", {}))
+        for stage, seconds in timings.items():
+            worker_seconds.observe(seconds, pool=self.name, stage=stage)
+
+        return timings
+
+    async def close(self):
+        for worker in list(self.workers):
+            self.workers.discard(worker)
+            await worker.close()
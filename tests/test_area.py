@@ -0,0 +1,89 @@
+import json
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("scipy")
+
+from bot import area
+
+NAV = {
+    "de_test": {
+        "BombsiteA": [[0, 0, 0], [100, 0, 0]],
+        "TopofMid": [[1000, 1000, 0]],
+        "CTSpawn": [[-1000, 0, 50]],
+    },
+    "de_empty": {},
+}
+
+
+@pytest.fixture
+def compiled(tmp_path, monkeypatch):
+    nav_json = tmp_path / "nav.json"
+    nav_json.write_text(json.dumps(NAV))
+
+    folder = tmp_path / "maps"
+    monkeypatch.setattr(area, "NAV_JSON", nav_json)
+    monkeypatch.setattr(area, "COMPILED_FOLDER", folder)
+    monkeypatch.setattr(area, "COMPILED_INDEX", folder / "places.json")
+
+    area._load_index.cache_clear()
+    area.get_map_areas.cache_clear()
+    yield folder
+    area._load_index.cache_clear()
+    area.get_map_areas.cache_clear()
+
+
+def test_nearest_place():
+    map_area = area.MapAreas.from_nav("de_test", NAV["de_test"])
+
+    assert map_area.get_vec_name((90, 10, 0)) == "Bombsite A"
+    assert map_area.get_vec_name((900, 900, 30)) == "Top of Mid"
+    assert map_area.get_vec_names([(-900, 0, 0), (0, 0, 0)]) == ["CT Spawn", "Bombsite A"]
+    assert map_area.get_vec_ids([]) == []
+
+
+def test_empty_map():
+    map_area = area.MapAreas.from_nav("de_empty", NAV["de_empty"])
+
+    assert map_area.get_vec_name((0, 0, 0)) == "Unknown"
+
+
+def test_compiles_on_first_use(compiled):
+    assert not compiled.exists()
+
+    map_area = area.get_map_areas("de_test")
+
+    assert (compiled / "places.json").is_file()
+    assert (compiled / "de_test.points.npy").is_file()
+    assert map_area.get_vec_name((90, 10, 0)) == "Bombsite A"
+
+    # cached while resident
+    assert area.get_map_areas("de_test") is map_area
+    assert area.get_map_areas("de_missing") is None
+
+
+def test_loads_compiled(compiled):
+    area.compile_nav(area.NAV_JSON, compiled)
+    area.NAV_JSON.unlink()
+
+    assert area.get_map_areas("de_test").get_vec_name((-1000, 0, 0)) == "CT Spawn"
+
+
+def test_recompiles_changed_nav(compiled):
+    assert area.get_map_areas("de_test").get_vec_name((1000, 1000, 0)) == "Top of Mid"
+
+    nav = dict(NAV, de_test=dict(NAV["de_test"], Long=[[1000, 1000, 0]]))
+    nav["de_test"].pop("TopofMid")
+    area.NAV_JSON.write_text(json.dumps(nav))
+
+    area._load_index.cache_clear()
+    area.get_map_areas.cache_clear()
+
+    assert area.get_map_areas("de_test").get_vec_name((1000, 1000, 0)) == "Long"
+
+
+def test_no_nav_data(compiled):
+    area.NAV_JSON.unlink()
+
+    assert area.get_map_areas("de_test") is None
@@ -0,0 +1,134 @@
+import asyncio
+
+import pytest
+
+from shared.cache import Cache
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_lru_eviction():
+    cache = Cache("test", maxsize=2)
+    cache.set(1, "a")
+    cache.set(2, "b")
+
+    # reading 1 makes 2 the least recently used
+    assert cache.get(1) == "a"
+    cache.set(3, "c")
+
+    assert 2 not in cache
+    assert cache.get(1) == "a" and cache.get(3) == "c"
+    assert cache.stats.evictions == 1
+
+
+def test_ttl():
+    clock = Clock()
+    cache = Cache("test", maxsize=10, ttl=10.0, clock=clock)
+    cache.set(1, "a")
+
+    clock.now = 5.0
+    cache.set(2, "b")
+    assert cache.get(1) == "a"
+
+    # reading doesn't extend the ttl, setting does
+    clock.now = 10.0
+    assert cache.get(1) is None
+    assert cache.get(2) == "b"
+
+    cache.set(2, "c")
+    clock.now = 19.0
+    assert cache.get(2) == "c"
+
+
+def test_expires_unread_keys():
+    clock = Clock()
+    cache = Cache("test", maxsize=10, ttl=10.0, clock=clock)
+
+    for key in range(5):
+        cache.set(key, key)
+
+    clock.now = 10.0
+    cache.set("new", 0)
+
+    assert len(cache) == 1
+    assert cache.stats.expirations == 5
+
+
+def test_stats():
+    cache = Cache("test", maxsize=10)
+    cache.set(1, "a")
+
+    cache.get(1)
+    cache.get(2)
+    cache.peek(1)
+
+    assert (cache.stats.hits, cache.stats.misses) == (1, 1)
+    assert cache.stats.hit_ratio == 0.5
+
+
+@pytest.mark.asyncio
+async def test_single_flight():
+    cache = Cache("test", maxsize=10)
+    loads = 0
+
+    async def load():
+        nonlocal loads
+        loads += 1
+        await asyncio.sleep(0.01)
+        return loads
+
+    results = await asyncio.gather(*(cache.get_or_load(1, load) for _ in range(5)))
+
+    assert results == [1] * 5
+    assert await cache.get_or_load(1, load) == 1
+    assert loads == 1
+    assert cache.stats.hits == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_load_not_cached():
+    cache = Cache("test", maxsize=10)
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("nope")
+
+    async def load():
+        return "a"
+
+    results = await asyncio.gather(
+        cache.get_or_load(1, fail), cache.get_or_load(1, load), return_exceptions=True
+    )
+    assert all(isinstance(result, ValueError) for result in results)
+
+    assert await cache.get_or_load(1, load) == "a"
+
+
+@pytest.mark.asyncio
+async def test_cancelled_load_retried_by_waiters():
+    cache = Cache("test", maxsize=10)
+    started = asyncio.Event()
+
+    async def hang():
+        started.set()
+        await asyncio.sleep(10)
+
+    async def load():
+        return "a"
+
+    loading = asyncio.create_task(cache.get_or_load(1, hang))
+    await started.wait()
+    waiting = asyncio.create_task(cache.get_or_load(1, load))
+    await asyncio.sleep(0)
+
+    loading.cancel()
+
+    assert await waiting == "a"
+    assert loading.cancelled()
+    assert cache.get(1) == "a"
@@ -0,0 +1,86 @@
+from unittest.mock import AsyncMock
+
+import pytest
+
+from bot import demo_index
+from bot.demo_index import DemoIndex
+
+
+def make_index(demos):
+    return DemoIndex(AsyncMock(return_value=demos))
+
+
+@pytest.mark.asyncio
+async def test_loads_once():
+    demos = {2: "[VALVE] de_inferno 16-8", 1: "[VALVE] de_mirage 16-14"}
+    index = make_index(demos)
+
+    assert await index.search(1, "", limit=5) == list(demos.values())
+    assert await index.search(1, "mirage", limit=1) == ["[VALVE] de_mirage 16-14"]
+
+    index.loader.assert_awaited_once_with(1, demo_index.MAX_DEMOS)
+
+
+@pytest.mark.asyncio
+async def test_add_moves_to_front():
+    index = make_index({2: "[VALVE] de_inferno 16-8", 1: "[VALVE] de_mirage 16-14"})
+    await index.search(1, "")
+
+    index.add(1, 1, "[VALVE] de_mirage 16-14")
+    index.add(1, 3, "[FACEIT] de_nuke 13-11")
+
+    recent = await index.search(1, "", limit=2)
+    assert recent == ["[FACEIT] de_nuke 13-11", "[VALVE] de_mirage 16-14"]
+    assert await index.resolve(1, "[FACEIT] de_nuke 13-11") == 3
+    assert await index.resolve(1, "INFERNO") == 2
+
+
+@pytest.mark.asyncio
+async def test_add_ignores_unloaded_users():
+    index = make_index({})
+    index.add(1, 1, "[VALVE] de_mirage 16-14")
+
+    assert await index.search(1, "") == []
+    assert await index.resolve(1, "mirage") is None
+
+
+@pytest.mark.asyncio
+async def test_bounded(monkeypatch):
+    monkeypatch.setattr(demo_index, "MAX_DEMOS", 2)
+
+    index = make_index({})
+    await index.search(1, "")
+
+    for demo_id in range(3):
+        index.add(1, demo_id, f"[UPLOAD] de_dust2 {demo_id}-0")
+
+    assert await index.search(1, "", limit=5) == ["[UPLOAD] de_dust2 2-0", "[UPLOAD] de_dust2 1-0"]
+
+
+@pytest.mark.asyncio
+async def test_remove_deleted():
+    index = make_index({2: "[VALVE] de_inferno 16-8", 1: "[VALVE] de_mirage 16-14"})
+    await index.search(1, "")
+
+    index.remove([1, 3])
+
+    assert await index.search(1, "", limit=5) == ["[VALVE] de_inferno 16-8"]
+    assert await index.search(1, "mirage") == ["[VALVE] de_inferno 16-8"]
+    assert await index.resolve(1, "[VALVE] de_mirage 16-14") == 2
+
+
+@pytest.mark.asyncio
+async def test_reloads_after_ttl():
+    index = make_index({1: "[VALVE] de_mirage 16-14"})
+    now = 0.0
+    index._users.clock = lambda: now
+
+    await index.search(1, "")
+    index.loader.return_value = {2: "[VALVE] de_inferno 16-8"}
+
+    now = demo_index.USER_TTL - 1
+    assert await index.search(1, "") == ["[VALVE] de_mirage 16-14"]
+
+    now = demo_index.USER_TTL
+    assert await index.search(1, "") == ["[VALVE] de_inferno 16-8"]
+    assert index.loader.await_count == 2
@@ -1,5 +1,6 @@
+from copy import deepcopy
 from json import loads
-from domain.match import Match
+from domain.match import Match, annotate_places
 from .testutils import valve, faceit
 
 import pytest
@@ -20,3 +21,82 @@ def test_faceit(faceit):
     m = Match(loads(faceit))
     m.parse()
     print("asd")
+
+
+@pytest.mark.parametrize("fixture", ["valve", "faceit"])
+def test_player_indexes(fixture, request):
+    m = Match(loads(request.getfixturevalue(fixture)))
+    m.parse()
+
+    for player in m._players.values():
+        assert m.get_player_by_xuid(player.xuid) is player
+
+    assert m.get_player_by_xuid(0) is None
+
+    for half in m.halves:
+        for teamnum, players in half.teams.items():
+            for player in players:
+                assert half.get_player_teamnum(player) == teamnum
+
+        # every indexed player is on exactly the team the index says
+        for player, teamnum in half._player_teams.items():
+            assert sum(player in players for players in half.teams.values()) == 1
+            assert player in half.teams[teamnum]
+
+
+@pytest.mark.parametrize("fixture", ["valve", "faceit"])
+def test_parse_does_not_mutate(fixture, request):
+    data = loads(request.getfixturevalue(fixture))
+    original = deepcopy(data)
+
+    m = Match(data)
+    m.parse()
+
+    assert data == original
+
+    # parsing the same data again gives the same result
+    again = Match(data)
+    again.parse()
+
+    assert [dict(half.rounds) for half in again.halves] == [dict(half.rounds) for half in m.halves]
+
+
+def test_annotate_places(valve):
+    data = loads(valve)
+    calls = []
+
+    def resolver(map, positions):
+        calls.append(map)
+        return [f"Place{n}" for n in range(len(positions))]
+
+    annotate_places(data, resolver)
+
+    # one batch for the whole demo
+    assert calls == [data["demoheader"]["mapname"]]
+
+    m = Match(data)
+    m.parse()
+
+    kills = [kill for half in m.halves for deaths in half.rounds.values() for kill in deaths]
+    assert kills and all(kill.place is not None for kill in kills)
+
+    round_id, deaths = next((r, d) for r, d in m.halves[0].rounds.items() if d)
+    assert m.halves[0].kills_info(round_id, deaths)[2] != "?"
+
+    # already annotated kills aren't resolved again
+    annotate_places(data, resolver)
+    assert len(calls) == 1
+
+
+def test_annotate_unknown_map(valve):
+    data = loads(valve)
+    original = deepcopy(data)
+
+    annotate_places(data, lambda map, positions: None)
+    assert data == original
+
+    m = Match(data)
+    m.parse()
+
+    round_id, deaths = next((r, d) for r, d in m.halves[0].rounds.items() if d)
+    assert m.halves[0].kills_info(round_id, deaths)[2] == "?"
@@ -0,0 +1,314 @@
+import asyncio
+import bz2
+import gzip
+import os
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+import pytest_asyncio
+
+aiohttp = pytest.importorskip("aiohttp")
+from aiohttp import web
+
+from shared.download import (
+    CURLE_PARTIAL_FILE,
+    DecompressError,
+    decompress_file,
+    download_chunks,
+    download_demo,
+)
+from shared.utils import CurlError
+
+DEMO = os.urandom(256 * 1024) + b"HL2DEMO" * 200_000
+
+FILES = {
+    "/demo.dem.gz": gzip.compress(DEMO),
+    "/demo.dem.bz2": bz2.compress(DEMO),
+    # bzip2 -dk handles concatenated streams, so should we
+    "/multi.dem.bz2": bz2.compress(DEMO[:1000]) + bz2.compress(DEMO[1000:]),
+    "/corrupt.dem.bz2": bz2.compress(DEMO)[:-1000] + b"\0" * 1000,
+    "/truncated.dem.gz": gzip.compress(DEMO)[:-1000],
+}
+
+
+@pytest.fixture(scope="module")
+def executor():
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        yield executor
+
+
+@pytest_asyncio.fixture
+async def server():
+    async def serve(request: web.Request):
+        if request.path == "/slow":
+            await asyncio.sleep(1.0)
+
+        if request.path == "/trickle.dem.gz":
+            # slow, but never stalling for long
+            body = FILES["/demo.dem.gz"]
+            resp = web.StreamResponse()
+            resp.content_length = len(body)
+            await resp.prepare(request)
+
+            piece = -(-len(body) // 5)
+            for start in range(0, len(body), piece):
+                await asyncio.sleep(0.1)
+                await resp.write(body[start : start + piece])
+
+            return resp
+
+        if request.path == "/encoded.dem.gz":
+            # like a cdn serving the archive as gzip encoded to clients that accept that
+            headers = dict()
+            if "gzip" in request.headers.get("Accept-Encoding", ""):
+                headers["Content-Encoding"] = "gzip"
+            return web.Response(body=FILES["/demo.dem.gz"], headers=headers)
+
+        body = FILES.get(request.path)
+        if body is None:
+            raise web.HTTPNotFound()
+
+        return web.Response(body=body)
+
+    app = web.Application()
+    app.router.add_get("/{name}", serve)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+
+    port = site._server.sockets[0].getsockname()[1]
+    async with aiohttp.ClientSession() as session:
+        yield session, f"http://127.0.0.1:{port}", FILES
+
+    await runner.cleanup()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("name", ["demo.dem.gz", "demo.dem.bz2", "multi.dem.bz2"])
+async def test_download_decompresses(server, tmp_path, name):
+    session, url, files = server
+    demo, archive = tmp_path / "demo.dem", tmp_path / name
+
+    await download_demo(
+        session, f"{url}/{name}", demo, archive=archive, compression=name.rsplit(".", 1)[1]
+    )
+
+    assert demo.read_bytes() == DEMO
+    assert archive.read_bytes() == files[f"/{name}"]
+
+    # and the same from the kept archive
+    again = tmp_path / "again.dem"
+    await decompress_file(archive, again)
+    assert again.read_bytes() == DEMO
+
+
+@pytest.mark.asyncio
+async def test_download_progress_extends_timeout(server, tmp_path):
+    session, url, _ = server
+    demo = tmp_path / "demo.dem"
+
+    started = asyncio.get_running_loop().time()
+    await download_demo(session, f"{url}/trickle.dem.gz", demo, compression="gz", timeout=0.3)
+
+    assert asyncio.get_running_loop().time() - started > 0.3
+    assert demo.read_bytes() == DEMO
+
+
+@pytest.mark.asyncio
+async def test_download_not_decoded(server, tmp_path):
+    session, url, files = server
+    demo, archive = tmp_path / "demo.dem", tmp_path / "demo.dem.gz"
+
+    await download_demo(session, f"{url}/encoded.dem.gz", demo, archive=archive, compression="gz")
+
+    assert demo.read_bytes() == DEMO
+    assert archive.read_bytes() == files["/demo.dem.gz"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("name", ["demo.dem.bz2", "multi.dem.bz2"])
+async def test_download_decompresses_parallel(server, tmp_path, executor, name):
+    session, url, files = server
+    demo, archive = tmp_path / "demo.dem", tmp_path / name
+
+    await download_demo(
+        session, f"{url}/{name}", demo, archive=archive, compression="bz2", executor=executor
+    )
+
+    assert demo.read_bytes() == DEMO
+    assert archive.read_bytes() == files[f"/{name}"]
+
+    again = tmp_path / "again.dem"
+    await decompress_file(archive, again, executor=executor)
+    assert again.read_bytes() == DEMO
+
+
+@pytest.mark.asyncio
+async def test_download_http_error(server, tmp_path):
+    session, url, _ = server
+    demo, archive = tmp_path / "demo.dem", tmp_path / "demo.dem.gz"
+
+    with pytest.raises(CurlError) as exc:
+        await download_demo(session, f"{url}/missing.dem.gz", demo, archive, "gz")
+
+    assert exc.value.http_code == 404
+    assert not demo.exists() and not archive.exists()
+
+
+@pytest.mark.asyncio
+async def test_download_connection_error(tmp_path):
+    async with aiohttp.ClientSession() as session:
+        with pytest.raises(CurlError) as exc:
+            await download_demo(session, "http://127.0.0.1:1/demo.dem", tmp_path / "demo.dem")
+
+    assert exc.value.http_code == 0
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("name", ["corrupt.dem.bz2", "truncated.dem.gz"])
+@pytest.mark.parametrize("parallel", [False, True])
+async def test_download_bad_archive(server, tmp_path, executor, name, parallel):
+    session, url, _ = server
+    demo, archive = tmp_path / "demo.dem", tmp_path / name
+
+    with pytest.raises(DecompressError):
+        await download_demo(
+            session,
+            f"{url}/{name}",
+            demo,
+            archive,
+            compression=name.rsplit(".", 1)[1],
+            executor=executor if parallel else None,
+        )
+
+    assert not demo.exists() and not archive.exists()
+
+
+@pytest.mark.asyncio
+async def test_download_timeout(server, tmp_path):
+    session, url, _ = server
+
+    with pytest.raises(asyncio.TimeoutError):
+        await download_demo(session, f"{url}/slow", tmp_path / "demo.dem", timeout=0.2)
+
+    assert not (tmp_path / "demo.dem").exists()
+
+
+DATA = os.urandom(300_000)
+SEGMENT = 64 * 1024
+
+
+@pytest_asyncio.fixture
+async def ranged(monkeypatch):
+    monkeypatch.setattr("shared.download.RETRY_DELAY", 0.0)
+
+    # faults are one shot unless persistent, keyed by the first byte of the range they hit
+    state = SimpleNamespace(ranges=True, size=len(DATA), faults=dict(), persistent=False, seen=[])
+
+    async def serve(request: web.Request):
+        header = request.headers.get("Range")
+        state.seen.append(header)
+
+        if not state.ranges or header is None:
+            return web.Response(body=DATA)
+
+        start, end = map(int, header.removeprefix("bytes=").split("-"))
+        body = DATA[start : end + 1]
+        fault = state.faults.get(start) if state.persistent else state.faults.pop(start, None)
+
+        if fault == "503":
+            raise web.HTTPServiceUnavailable()
+
+        resp = web.StreamResponse(
+            status=206,
+            headers={"Content-Range": f"bytes {start}-{start + len(body) - 1}/{state.size}"},
+        )
+        resp.content_length = len(body)
+        await resp.prepare(request)
+
+        if fault == "drop":
+            await resp.write(body[: len(body) // 2])
+            request.transport.close()
+            return resp
+        if fault == "stall":
+            await resp.write(body[: len(body) // 2])
+            await asyncio.sleep(1.0)
+
+        await resp.write(body)
+        return resp
+
+    app = web.Application()
+    app.router.add_get("/demo.dem", serve)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+
+    port = site._server.sockets[0].getsockname()[1]
+    async with aiohttp.ClientSession() as session:
+        yield session, f"http://127.0.0.1:{port}/demo.dem", state
+
+    await runner.cleanup()
+
+
+async def fetch_all(session, url, **kwargs) -> bytes:
+    chunks = download_chunks(session, url, connections=3, segment_size=SEGMENT, **kwargs)
+    return b"".join([chunk async for chunk in chunks])
+
+
+@pytest.mark.asyncio
+async def test_ranged_download(ranged):
+    session, url, state = ranged
+
+    assert await fetch_all(session, url) == DATA
+    assert len(state.seen) == -(-len(DATA) // SEGMENT)
+    assert state.seen[0] == f"bytes=0-{SEGMENT - 1}"
+
+
+@pytest.mark.asyncio
+async def test_ranged_download_resumes(ranged):
+    session, url, state = ranged
+    state.faults = {0: "drop", SEGMENT: "stall", 2 * SEGMENT: "503", 3 * SEGMENT: "drop"}
+
+    assert await fetch_all(session, url, read_timeout=0.2) == DATA
+
+    # broken off segments continue where they stopped
+    assert f"bytes={SEGMENT // 2}-{SEGMENT - 1}" in state.seen
+    assert f"bytes={3 * SEGMENT + SEGMENT // 2}-{4 * SEGMENT - 1}" in state.seen
+
+
+@pytest.mark.asyncio
+async def test_download_without_ranges(ranged):
+    session, url, state = ranged
+    state.ranges = False
+
+    assert await fetch_all(session, url) == DATA
+    assert len(state.seen) == 1
+
+
+@pytest.mark.asyncio
+async def test_ranged_download_gives_up(ranged):
+    session, url, state = ranged
+    state.faults, state.persistent = {SEGMENT: "503"}, True
+
+    with pytest.raises(CurlError) as exc:
+        await fetch_all(session, url)
+
+    assert exc.value.http_code == 503
+
+
+@pytest.mark.asyncio
+async def test_ranged_download_checks_size(ranged, tmp_path):
+    session, url, state = ranged
+    # more than the server has to give
+    state.size = len(DATA) + 1000
+
+    with pytest.raises(CurlError) as exc:
+        await download_demo(session, url, tmp_path / "demo.dem")
+
+    assert exc.value.code == CURLE_PARTIAL_FILE
+    assert not (tmp_path / "demo.dem").exists()
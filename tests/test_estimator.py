@@ -0,0 +1,94 @@
+from types import SimpleNamespace
+
+import pytest
+
+from shared.estimator import (
+    DEFAULT_RATES,
+    RecordingEstimator,
+    recorded_seconds,
+    schedule,
+)
+
+TICKRATE = 64
+
+
+def make_command(seconds, skipped=0, playback_seconds=None):
+    end_tick = (seconds + skipped) * TICKRATE
+    skips = [[TICKRATE, TICKRATE + skipped * TICKRATE, "goto"]] if skipped else []
+
+    return SimpleNamespace(
+        tickrate=TICKRATE,
+        start_tick=0,
+        end_tick=end_tick,
+        skips=skips,
+        playback_seconds=playback_seconds,
+    )
+
+
+def test_recorded_seconds():
+    # plain (start, end) skips from before the sequencer added skip methods
+    assert recorded_seconds(TICKRATE, 0, 30 * TICKRATE, [(0, 10 * TICKRATE)]) == 20
+    assert recorded_seconds(TICKRATE, 0, 30 * TICKRATE, [(0, 10 * TICKRATE, "ff")]) == 20
+
+
+def test_schedule():
+    assert schedule([10, 10, 10], busy=[], workers=2) == [10, 10, 20]
+    assert schedule([10, 10], busy=[5, 30], workers=2) == [15, 25]
+    assert schedule([10], busy=[5], workers=2) == [10]
+
+    with pytest.raises(ValueError):
+        schedule([10], busy=[], workers=0)
+
+
+def test_estimate_scales_with_command():
+    estimator = RecordingEstimator()
+
+    short = estimator.estimate(make_command(10))
+    long = estimator.estimate(make_command(60))
+    assert short < long
+
+    # skipped parts aren't recorded, but playing through them still takes time
+    skipped = make_command(10, skipped=60, playback_seconds=20)
+    assert estimator.estimate_stages(skipped)["mux"] == pytest.approx(DEFAULT_RATES["mux"] * 10)
+    assert estimator.estimate_stages(skipped)["record"] == pytest.approx(
+        DEFAULT_RATES["record"] * 20
+    )
+
+
+def test_observe_converges():
+    estimator = RecordingEstimator(alpha=0.5)
+    command = make_command(20)
+
+    for _ in range(50):
+        estimator.observe(command, dict(download=1.0, record=60.0, unknown=100.0))
+
+    assert estimator.rates["download"] == pytest.approx(1.0)
+    assert estimator.rates["record"] == pytest.approx(3.0)
+    assert estimator.rates["mux"] == DEFAULT_RATES["mux"]
+    assert "unknown" not in estimator.rates
+
+
+def test_observe_fetch_stages():
+    # fresh downloads extract inline, cached archives are only decompressed
+    estimator = RecordingEstimator(alpha=0.5)
+    command = make_command(20)
+
+    for _ in range(50):
+        estimator.observe(command, dict(download=4.0, decompress=0.0))
+        estimator.observe(command, dict(download=0.0, decompress=2.0))
+
+    stages = estimator.estimate_stages(command)
+    assert 1.0 < stages["download"] < 3.0
+    assert 0.5 < stages["decompress"] < 1.5
+    assert stages["download"] + stages["decompress"] == pytest.approx(3.0, abs=0.5)
+
+
+def test_eta():
+    estimator = RecordingEstimator()
+    command = make_command(20)
+    duration = estimator.estimate(command)
+
+    assert estimator.eta([command], busy=[], workers=0) is None
+    assert estimator.eta([command], busy=[], workers=1) == pytest.approx(duration)
+    assert estimator.eta([command] * 3, busy=[], workers=1) == pytest.approx(duration * 3)
+    assert estimator.eta([command] * 3, busy=[100.0], workers=3) == pytest.approx(duration * 2)
@@ -0,0 +1,112 @@
+from json import loads
+
+import pytest
+
+from domain.match import Match
+
+from .testutils import faceit, valve
+
+np = pytest.importorskip("numpy")
+
+
+@pytest.fixture(params=["valve", "faceit"])
+def match(request):
+    m = Match(loads(request.getfixturevalue(request.param)))
+    m.parse()
+    return m
+
+
+def test_rows_match_halves(match):
+    table = match.kill_table
+
+    assert table is match.kill_table
+    assert len(table) == sum(len(d) for half in match.halves for d in half.rounds.values())
+    assert table.pos.shape == (len(table), 3)
+
+
+def test_player_kills(match):
+    table = match.kill_table
+
+    for player in match._players.values():
+        for half_num, half in enumerate(match.halves):
+            expected = {
+                round_id: kills
+                for round_id, kills in half.get_player_kills(player).items()
+                if kills
+            }
+
+            assert table.get_player_kills(player, half=half_num) == expected
+
+            for round_id in half.rounds:
+                assert table.get_player_kills_round(
+                    player, round_id, half=half_num
+                ) == half.get_player_kills_round(player, round_id)
+
+
+def test_team_kills(match):
+    expected = [
+        death
+        for half in match.halves
+        for deaths in half.rounds.values()
+        for death in deaths
+        if half.death_is_tk(death)
+    ]
+
+    assert match.kill_table.team_kills() == expected
+
+
+def test_kill_counts(match):
+    table = match.kill_table
+    counts = table.kill_counts()
+
+    assert counts.shape == (len(table.players), len(table.slots))
+
+    for player_id, player in enumerate(table.players):
+        for slot_id, (half_num, round_id) in enumerate(table.slots):
+            half = match.halves[half_num]
+            kills = half.get_player_kills_round(player, round_id)
+            expected = sum(1 for kill in kills if not half.death_is_tk(kill))
+
+            assert counts[player_id, slot_id] == expected
+
+
+def test_best_highlights(match):
+    highlights = match.best_highlights(n=5)
+
+    assert 0 < len(highlights) <= 5
+    assert [h.score for h in highlights] == sorted((h.score for h in highlights), reverse=True)
+
+    for highlight in highlights:
+        assert highlight.kills >= 2
+
+        half = match.halves[highlight.half]
+        kills = half.get_player_kills_round(highlight.player, highlight.round_id)
+        assert highlight.kills == sum(1 for kill in kills if not half.death_is_tk(kill))
+
+    # asking for fewer keeps the order
+    assert match.best_highlights(n=2) == highlights[:2]
+
+
+def test_highlights_prefer_compact(match):
+    table = match.kill_table
+    tickrate = match.tickrate
+
+    # same kill count, the one spread over a whole round should lose
+    table.tick[:] = 0
+    table.slot[:] = 0
+    table.attacker[:] = -1
+    table.is_tk[:] = False
+    table.headshot[:] = False
+    table.weapon_weights[:] = 0.0
+
+    table.attacker[:3] = 0
+    table.attacker[3:6] = 1
+    table.tick[:3] = [0, tickrate, 2 * tickrate]
+    table.tick[3:6] = [0, 30 * tickrate, 60 * tickrate]
+
+    first, second = table.highlights(tickrate, n=2)
+
+    assert first.player == table.players[0]
+    assert second.player == table.players[1]
+    assert first.kills == second.kills == 3
+    assert first.score > second.score
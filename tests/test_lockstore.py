@@ -0,0 +1,104 @@
+import asyncio
+import logging
+
+import pytest
+
+from shared.lockstore import LockStore, LockTimeout, lock_hold_seconds, lock_wait_seconds
+
+
+def observations(histogram, store: str, holder: str) -> int:
+    snapshot = histogram.snapshot().get((store, holder))
+    return 0 if snapshot is None else snapshot[2]
+
+
+@pytest.mark.asyncio
+async def test_serializes_per_key():
+    store = LockStore("test_serializes")
+    order = []
+
+    async def hold(key, name):
+        async with store.get(key, holder=name):
+            order.append(f"{name} in")
+            await asyncio.sleep(0.01)
+            order.append(f"{name} out")
+
+    await asyncio.gather(hold(1, "a"), hold(1, "b"), hold(2, "c"))
+
+    assert order.index("a out") < order.index("b in")
+    assert order.index("c in") < order.index("a out")
+
+    # nothing is kept around once released
+    assert store.locks == {}
+
+
+@pytest.mark.asyncio
+async def test_records_wait_and_hold():
+    store = LockStore("test_records")
+
+    async with store.get(1, holder="first"):
+        pass
+
+    assert observations(lock_wait_seconds, "test_records", "first") == 1
+    assert observations(lock_hold_seconds, "test_records", "first") == 1
+
+
+@pytest.mark.asyncio
+async def test_timeout():
+    store = LockStore("test_timeout", timeout=0.01)
+
+    async with store.get(1, holder="slow"):
+        with pytest.raises(LockTimeout) as exc:
+            async with store.get(1, holder="impatient"):
+                pass
+
+        assert "held by slow" in str(exc.value)
+        assert store.locks[1].waiters == {}
+
+        # a timeout of its own overrides the store's
+        waiting = asyncio.create_task(store.get(1, holder="patient", timeout=1.0).__aenter__())
+        await asyncio.sleep(0.05)
+        assert not waiting.done()
+
+    await waiting
+    assert store.locks[1].holder == "patient"
+
+
+@pytest.mark.asyncio
+async def test_timeout_logs_dump(caplog):
+    store = LockStore("test_timeout_logs", timeout=0.01)
+    caplog.set_level(logging.DEBUG, logger="shared.lockstore")
+
+    async with store.get(1, holder="slow"):
+        with pytest.raises(LockTimeout):
+            async with store.get(1, holder="impatient"):
+                pass
+
+    (record,) = [record for record in caplog.records if "timed out" in record.message]
+    assert "'holder': 'slow'" in record.message
+    assert "'holder': 'impatient'" in record.message
+
+
+@pytest.mark.asyncio
+async def test_dump():
+    store = LockStore("test_dump")
+    held = asyncio.Event()
+
+    async def hold():
+        async with store.get("demo", holder="demoparse_success"):
+            held.set()
+            await asyncio.sleep(0.05)
+
+    holding = asyncio.create_task(hold())
+    await held.wait()
+
+    waiting = asyncio.create_task(store.get("demo", holder="record").__aenter__())
+    await asyncio.sleep(0.01)
+
+    (dumped,) = store.dump()
+    assert dumped["key"] == "demo"
+    assert dumped["holder"] == "demoparse_success"
+    assert dumped["held"] > 0
+    assert [waiter["holder"] for waiter in dumped["waiters"]] == ["record"]
+
+    await holding
+    await waiting
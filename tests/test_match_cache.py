@@ -0,0 +1,79 @@
+import os
+import pickle
+from json import loads
+
+import pytest
+
+from adapters import match_cache as match_cache_module
+from adapters.match_cache import MatchCache
+from domain.match import Match
+
+from .testutils import valve
+
+
+@pytest.fixture
+def match(valve):
+    m = Match(loads(valve))
+    m.parse()
+    return m
+
+
+def entry_size(match):
+    return len(pickle.dumps(match, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def test_round_trip(tmp_path, match):
+    cache = MatchCache(tmp_path, max_bytes=1024**3)
+
+    assert cache.get(1) is None
+
+    cache.put(1, match)
+    cached = cache.get(1)
+
+    assert cached is not match
+    assert cached.data is None
+    assert cached.score == match.score
+    assert [p.xuid for p in cached._players.values()] == [p.xuid for p in match._players.values()]
+
+    # survives a restart
+    cached = MatchCache(tmp_path, max_bytes=1024**3).get(1)
+    assert cached.get_player_by_xuid(next(iter(match._players.values())).xuid) is not None
+
+
+def test_evicts_least_recently_used(tmp_path, match):
+    size = entry_size(match)
+    cache = MatchCache(tmp_path, max_bytes=size * 2)
+
+    cache.put(1, match)
+    cache.put(2, match)
+
+    # 1 is now more recent than 2
+    assert cache.get(1) is not None
+
+    cache.put(3, match)
+
+    assert cache.get(2) is None
+    assert cache.get(1) is not None
+    assert cache.get(3) is not None
+    assert len(os.listdir(tmp_path)) == 2
+
+
+def test_drops_stale_entries(tmp_path, match, monkeypatch):
+    MatchCache(tmp_path, max_bytes=1024**3).put(1, match)
+    (tmp_path / "2.tmp").write_bytes(b"interrupted")
+
+    monkeypatch.setattr(match_cache_module, "FORMAT_VERSION", match_cache_module.FORMAT_VERSION + 1)
+    cache = MatchCache(tmp_path, max_bytes=1024**3)
+
+    assert cache.get(1) is None
+    assert os.listdir(tmp_path) == []
+
+
+def test_drops_unreadable_entries(tmp_path, match):
+    cache = MatchCache(tmp_path, max_bytes=1024**3)
+    cache.put(1, match)
+
+    (tmp_path / cache._name(1)).write_bytes(b"not a pickle")
+
+    assert cache.get(1) is None
+    assert os.listdir(tmp_path) == []
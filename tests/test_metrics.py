@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+
+import messages.broker
+import services.services
+import services.views
+import shared.cache
+import shared.download
+import shared.workerpool
+from shared import metrics
+from shared.metrics import Counter, Gauge, Histogram, render
+
+
+def test_render():
+    counter = Counter("test_render_total", 'Things "counted"\nby kind', labelnames=("kind",))
+    counter.inc(kind="a")
+    counter.inc(2, kind='b"')
+
+    histogram = Histogram("test_render_seconds", "Durations", buckets=(0.1, 1.0))
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5.0)
+
+    lines = render().splitlines()
+
+    assert '# HELP test_render_total Things "counted"\\nby kind' in lines
+    assert "# TYPE test_render_total counter" in lines
+    assert 'test_render_total{kind="a"} 1.0' in lines
+    assert 'test_render_total{kind="b\\""} 2.0' in lines
+
+    assert "# TYPE test_render_seconds histogram" in lines
+    assert 'test_render_seconds_bucket{le="0.1"} 1' in lines
+    assert 'test_render_seconds_bucket{le="1.0"} 2' in lines
+    assert 'test_render_seconds_bucket{le="+Inf"} 3' in lines
+    assert "test_render_seconds_sum 5.55" in lines
+    assert "test_render_seconds_count 3" in lines
+
+
+def test_service_label():
+    gauge = Gauge("test_service_label", "A gauge")
+    gauge.set(1)
+
+    metrics.set_service("test")
+    try:
+        assert 'test_service_label{service="test"} 1' in render().splitlines()
+    finally:
+        metrics.service_labels.clear()
+
+
+def test_gauge():
+    gauge = Gauge("test_gauge", "A gauge", labelnames=("kind",))
+    gauge.set(5, kind="set")
+    gauge.dec(2, kind="set")
+
+    with gauge.track_inprogress(kind="inprogress"):
+        assert gauge.snapshot()[("inprogress",)] == 1
+
+    items = [1, 2]
+    gauge.set_function(lambda: len(items), kind="function")
+    items.append(3)
+
+    assert gauge.snapshot() == {("set",): 3, ("inprogress",): 0, ("function",): 3.0}
+
+
+def test_labels_checked():
+    counter = Counter("test_labels_checked_total", labelnames=("kind",))
+
+    with pytest.raises(ValueError):
+        counter.inc(other="a")
+
+    with pytest.raises(ValueError):
+        Counter("test_labels_checked_total")
+
+
+def test_names():
+    # no service prefix, that's what the service label is for
+    for name, metric in metrics.registry.items():
+        assert not name.startswith("striker_"), name
+        assert name.endswith("_total") == isinstance(metric, Counter), name
+
+
+@pytest.mark.asyncio
+async def test_server():
+    Counter("test_server_total", "Requests").inc()
+    server = await metrics.start_server(0, host="127.0.0.1")
+    port = server.sockets[0].getsockname()[1]
+
+    async def get(path: str) -> tuple[str, bytes]:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+        response = await reader.read()
+        writer.close()
+
+        head, body = response.split(b"\r\n\r\n", 1)
+        return head.decode().splitlines()[0], body
+
+    try:
+        status, body = await get("/metrics")
+        assert status == "HTTP/1.1 200 OK"
+        assert b"test_server_total 1.0" in body.splitlines()
+
+        status, _ = await get("/")
+        assert status == "HTTP/1.1 404 Not Found"
+    finally:
+        server.close()
+        await server.wait_closed()
@@ -0,0 +1,89 @@
+import os
+from unittest.mock import AsyncMock
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from adapters import orm
+from adapters.outbox import OutboxRelay, OutboxRepository, message_type_from_name
+from messages import commands
+
+# see test_migrations, needs a real (and disposable!) postgres database
+TEST_DB = os.environ.get("STRIKER_TEST_DB")
+
+needs_db = pytest.mark.skipif(TEST_DB is None, reason="STRIKER_TEST_DB not set")
+
+
+def make_command(identifier):
+    return commands.RequestDemoParse(
+        origin="VALVE", identifier=identifier, download_url="not a url", data_version=None
+    )
+
+
+def test_message_type_from_name():
+    assert message_type_from_name("RequestDemoParse") is commands.RequestDemoParse
+
+    with pytest.raises(ValueError):
+        message_type_from_name("NotAMessage")
+
+
+@pytest_asyncio.fixture
+async def engine():
+    engine = create_async_engine(TEST_DB)
+
+    async with engine.begin() as conn:
+        await conn.run_sync(orm.outbox_table.drop, checkfirst=True)
+        await conn.run_sync(orm.outbox_table.create)
+
+    yield engine
+
+    await engine.dispose()
+
+
+async def add_messages(engine, messages):
+    async with AsyncSession(engine) as session:
+        async with session.begin():
+            outbox = OutboxRepository(session)
+            for message in messages:
+                outbox.add(message)
+
+            await outbox.flush()
+
+
+async def outbox_count(engine):
+    async with engine.connect() as conn:
+        return await conn.scalar(select(func.count()).select_from(orm.outbox_table))
+
+
+@needs_db
+@pytest.mark.asyncio
+async def test_relay_publishes_and_deletes(engine):
+    messages = [make_command(str(n)) for n in range(5)]
+    await add_messages(engine, messages)
+
+    publish = AsyncMock()
+    relay = OutboxRelay(engine, publish, batch_size=3)
+
+    assert await relay.relay_batch() == 3
+    assert await relay.relay_batch() == 2
+    assert await relay.relay_batch() == 0
+
+    assert [call.args[0] for call in publish.await_args_list] == messages
+    assert await outbox_count(engine) == 0
+
+
+@needs_db
+@pytest.mark.asyncio
+async def test_relay_keeps_failed(engine):
+    await add_messages(engine, [make_command("ok"), make_command("fails")])
+
+    async def publish(message):
+        if message.identifier == "fails":
+            raise ConnectionError()
+
+    relay = OutboxRelay(engine, publish)
+
+    assert await relay.relay_batch() == 1
+    assert await outbox_count(engine) == 1
@@ -0,0 +1,93 @@
+import bz2
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from shared import parallel_bz2
+from shared.parallel_bz2 import (
+    BLOCK_MAGIC,
+    EOS_MAGIC,
+    ParallelBz2Decompressor,
+    ParallelBz2Error,
+    decompress_file,
+    find_markers,
+)
+
+random.seed(1)
+
+# compressible enough to look like a demo, random enough for several 100k blocks
+DEMO = b"".join(
+    os.urandom(random.randrange(1, 2000)) + b"HL2DEMO" * random.randrange(1, 3000)
+    for _ in range(300)
+)
+
+
+@pytest.fixture(scope="module")
+def executor():
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        yield executor
+
+
+def decompress(executor, data: bytes, chunk_size: int) -> bytes:
+    decompressor = ParallelBz2Decompressor(executor, max_pending=2)
+    out = [
+        decompressor.decompress(data[i : i + chunk_size]) for i in range(0, len(data), chunk_size)
+    ]
+    return b"".join(out) + decompressor.flush()
+
+
+def test_find_markers():
+    data = bz2.compress(DEMO, 1)
+    markers = find_markers(data)
+
+    assert markers[0] == (32, BLOCK_MAGIC)
+    assert markers[-1][1] == EOS_MAGIC
+    assert len(markers) > 3
+
+    # same positions when searching from a byte offset
+    assert find_markers(data, markers[1][0] // 8) == markers[1:]
+
+
+@pytest.mark.parametrize("chunk_size", [1000, 64 * 1024, 8 * 1024 * 1024])
+def test_decompress(executor, chunk_size):
+    # blocks are split across chunks, and chunks hold several blocks
+    data = bz2.compress(DEMO, 1)
+    assert decompress(executor, data, chunk_size) == DEMO
+
+
+def test_concatenated_streams(executor):
+    data = bz2.compress(DEMO[:1000], 9) + bz2.compress(b"") + bz2.compress(DEMO[1000:], 2)
+    assert decompress(executor, data, 64 * 1024) == DEMO
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        b"HL2DEMO" * 100,
+        bz2.compress(DEMO, 1)[:-1000],
+        bz2.compress(DEMO, 1)[:100_000] + b"\0" * 1000 + bz2.compress(DEMO, 1)[101_000:],
+    ],
+    ids=["not bz2", "truncated", "corrupt"],
+)
+def test_bad_archive(executor, data):
+    with pytest.raises(ParallelBz2Error):
+        decompress(executor, data, 64 * 1024)
+
+
+def test_decompress_file_falls_back(executor, tmp_path, monkeypatch):
+    archive, demo = tmp_path / "demo.dem.bz2", tmp_path / "demo.dem"
+    archive.write_bytes(bz2.compress(DEMO, 1))
+
+    # a block magic showing up by chance inside a block
+    def find_spurious(data, start=0):
+        markers = find_markers(data, start)
+        if markers and markers[0][1] == BLOCK_MAGIC:
+            markers.append((markers[0][0] + 1000, BLOCK_MAGIC))
+        return sorted(markers)
+
+    monkeypatch.setattr(parallel_bz2, "find_markers", find_spurious)
+
+    decompress_file(archive, demo, executor)
+    assert demo.read_bytes() == DEMO
@@ -0,0 +1,83 @@
+import os
+from datetime import timedelta
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import clear_mappers
+
+from adapters import orm
+from adapters.repo import DemoRepository
+from domain.enums import DemoGame, DemoOrigin, DemoState
+from shared.utils import utcnow
+
+# see test_migrations, needs a real (and disposable!) postgres database
+TEST_DB = os.environ.get("STRIKER_TEST_DB")
+
+needs_db = pytest.mark.skipif(TEST_DB is None, reason="STRIKER_TEST_DB not set")
+
+
+@pytest_asyncio.fixture
+async def session():
+    engine = create_async_engine(TEST_DB)
+    orm.start_mappers()
+
+    async with engine.connect() as conn:
+        trans = await conn.begin()
+        await conn.run_sync(orm.meta.drop_all)
+        await conn.run_sync(orm.meta.create_all)
+
+        yield AsyncSession(conn)
+        await trans.rollback()
+
+    clear_mappers()
+    await engine.dispose()
+
+
+async def add_demos(session, count: int, **values):
+    await session.execute(
+        insert(orm.demo_table),
+        [
+            dict(
+                game=DemoGame.CSGO,
+                origin=DemoOrigin.VALVE,
+                state=DemoState.READY,
+                identifier=str(n),
+                downloaded_at=utcnow() - timedelta(days=1),
+                **values,
+            )
+            for n in range(count)
+        ],
+    )
+
+
+@needs_db
+@pytest.mark.asyncio
+async def test_evicted_data_is_not_evicted_again(session):
+    await add_demos(session, 3, data=dict(events=[]), data_version=1)
+    demos = DemoRepository(session)
+
+    rows = await demos.evictable_data(budget=0, limit=10)
+    assert len(rows) == 3
+    assert set(await demos.bulk_clear_data([row.id for row in rows])) == {row.id for row in rows}
+
+    # cleared for real, not set to a json null
+    data = await session.scalars(select(orm.demo_table.c.data.is_(None)))
+    assert all(data)
+
+    assert await demos.evictable_data(budget=0, limit=10) == []
+    assert await demos.bulk_clear_data([row.id for row in rows]) == []
+
+
+@needs_db
+@pytest.mark.asyncio
+async def test_deleted_demos_lose_their_data(session):
+    await add_demos(session, 2, data=dict(events=[]), data_version=1, archive_size=100)
+    demos = DemoRepository(session)
+
+    rows = await demos.evictable_archives(budget=0, limit=10)
+    assert len(await demos.bulk_set_deleted([row.id for row in rows])) == 2
+
+    assert await demos.evictable_data(budget=0, limit=10) == []
+    assert await demos.evictable_archives(budget=0, limit=10) == []
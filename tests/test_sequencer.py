@@ -0,0 +1,106 @@
+from json import loads
+
+import pytest
+
+from domain.match import Death, Match
+from domain.sequencer import (
+    ADD_AFTER_KILL,
+    ADD_BEFORE_KILL,
+    ADD_INTRO,
+    ADD_OUTRO,
+    SKIP_FAST_FORWARD,
+    SKIP_GOTO,
+    CostModel,
+    plan_highlights,
+)
+
+from .testutils import valve
+
+TICKRATE = 64
+
+
+def kills_at(*seconds):
+    return [Death(int(s * TICKRATE), None, None, (0, 0, 0), "ak47") for s in seconds]
+
+
+def test_single_kill():
+    plan = plan_highlights(TICKRATE, kills_at(10))
+
+    assert plan.start_tick == (10 - ADD_INTRO) * TICKRATE
+    assert plan.end_tick == (10 + ADD_OUTRO) * TICKRATE
+    assert plan.skips == []
+    assert plan.seconds == ADD_INTRO + ADD_OUTRO
+
+
+def test_overlapping_windows_merge():
+    plan = plan_highlights(TICKRATE, kills_at(12, 10, 11))
+
+    assert plan.skips == []
+    assert plan.start_tick == (10 - ADD_INTRO) * TICKRATE
+    assert plan.end_tick == (12 + ADD_OUTRO) * TICKRATE
+
+
+def test_skip_methods():
+    # a short gap is recorded through, a medium one fast forwarded and a long one jumped
+    plan = plan_highlights(TICKRATE, kills_at(10, 14.5, 30, 120))
+
+    assert plan.start_tick == (10 - ADD_INTRO) * TICKRATE
+    assert [method for _, _, method in plan.skips] == [SKIP_FAST_FORWARD, SKIP_GOTO]
+
+    for start, end, _ in plan.skips:
+        assert plan.start_tick < start < end < plan.end_tick
+
+    skipped = sum(end - start for start, end, _ in plan.skips)
+    assert plan.seconds == (plan.end_tick - plan.start_tick - skipped) / TICKRATE
+    assert plan.wall_seconds > plan.seconds
+
+
+def test_record_through_threshold():
+    # windows 5 seconds apart are recorded through, like before the cost model
+    kills = kills_at(10, 10 + ADD_BEFORE_KILL + ADD_AFTER_KILL + 5)
+    assert plan_highlights(TICKRATE, kills).skips == []
+
+    kills = kills_at(10, 10 + ADD_BEFORE_KILL + ADD_AFTER_KILL + 5.5)
+    assert [method for _, _, method in plan_highlights(TICKRATE, kills).skips] == [
+        SKIP_FAST_FORWARD
+    ]
+
+    no_penalty = CostModel(cut_penalty=0.0)
+    assert plan_highlights(TICKRATE, kills_at(10, 16), no_penalty).skips != []
+
+
+def test_cost_model_changes_plan():
+    kills = kills_at(10, 120)
+
+    assert plan_highlights(TICKRATE, kills).skips[0][2] == SKIP_GOTO
+
+    slow_goto = CostModel(goto_seconds=60.0)
+    assert plan_highlights(TICKRATE, kills, slow_goto).skips[0][2] == SKIP_FAST_FORWARD
+
+    free_recording = CostModel(record_weight=0.0, cut_seconds=1000.0)
+    assert plan_highlights(TICKRATE, kills, free_recording).skips == []
+
+
+def test_no_kills():
+    with pytest.raises(ValueError):
+        plan_highlights(TICKRATE, [])
+
+
+def test_plan_whole_match(valve):
+    match = Match(loads(valve))
+    match.parse()
+
+    # every kill of the match, all rounds and players
+    kills = [kill for half in match.halves for deaths in half.rounds.values() for kill in deaths]
+    plan = plan_highlights(match.tickrate, kills)
+
+    assert plan.start_tick < min(kill.tick for kill in kills)
+    assert plan.end_tick > max(kill.tick for kill in kills)
+
+    # rounds are far enough apart to be jumped over
+    assert any(method == SKIP_GOTO for _, _, method in plan.skips)
+
+    previous = plan.start_tick
+    for start, end, _ in plan.skips:
+        assert previous < start < end
+        previous = end
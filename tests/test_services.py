@@ -1,5 +1,5 @@
 import asyncio
-from collections import deque
+from collections import deque, namedtuple
 from datetime import datetime, timedelta, timezone
 from unittest.mock import ANY, AsyncMock
 from uuid import uuid4
@@ -11,10 +11,14 @@ from domain.match import Match
 from messages import commands, dto, events
 from messages.bus import MessageBus
 from services import services
+from services.counters import RecordingCounter, recording_counter
 from shared.const import CSGO_DEMOPARSE_VERSION
 from tests.testutils import *
 
 
+EvictableRow = namedtuple("EvictableRow", ("id", "origin", "identifier", "size"))
+
+
 class FakeRepository:
     def __init__(self, instances=None):
         self.instances = {}
@@ -55,7 +59,7 @@ class FakeJobRepository(FakeRepository):
 
         return jobs
 
-    async def get_restart(self):
+    async def get_restart(self, defer_data=False):
         jobs = []
         for job in self.instances.values():
             if job.state is JobState.SELECTING:
@@ -99,6 +103,44 @@ class FakeDemoRepository(FakeRepository):
                 return instance
         return None
 
+    def _over_budget(self, demos, size, budget, limit):
+        demos = sorted(demos, key=lambda demo: demo.downloaded_at, reverse=True)
+        rows, total = [], 0
+
+        for demo in demos:
+            total += size(demo)
+            if total > budget:
+                rows.append(EvictableRow(demo.id, demo.origin.name, demo.identifier, size(demo)))
+
+        return list(reversed(rows))[:limit]
+
+    async def evictable_data(self, budget, limit):
+        demos = [demo for demo in self.instances.values() if demo.data is not None]
+        return self._over_budget(demos, lambda demo: len(str(demo.data)), budget, limit)
+
+    async def evictable_archives(self, budget, limit):
+        demos = [
+            demo
+            for demo in self.instances.values()
+            if demo.archive_size is not None and demo.state is not DemoState.DELETED
+        ]
+        return self._over_budget(demos, lambda demo: demo.archive_size, budget, limit)
+
+    async def ensure_data(self, demo):
+        pass
+
+    async def bulk_clear_data(self, ids):
+        for _id in ids:
+            self.instances[_id].data = None
+        return ids
+
+    async def bulk_set_deleted(self, ids):
+        for _id in ids:
+            demo = self.instances[_id]
+            demo.state = DemoState.DELETED
+            demo.data = demo.data_version = demo.archive_size = None
+        return ids
+
 
 class FakeUserSettingsRepository(FakeRepository):
     def __init__(self, instances=None):
@@ -112,15 +154,37 @@ class FakeUserSettingsRepository(FakeRepository):
         return None
 
 
+class FakeOutbox:
+    def __init__(self):
+        self.pending = []
+        self.messages = []  # committed, what the relay would publish
+
+    def add(self, message):
+        self.pending.append(message)
+
+
+class FakeMatchCache:
+    def __init__(self):
+        self.matches = dict()
+
+    def get(self, demo_id):
+        return self.matches.get(demo_id, None)
+
+    def put(self, demo_id, match):
+        self.matches[demo_id] = match
+
+
 class FakeUnitOfWork:
     def __init__(self, jobs=None, demos=None, users=None) -> None:
         self.jobs = FakeJobRepository(jobs or [])
         self.demos = FakeDemoRepository(demos or [])
         self.users = FakeUserSettingsRepository(users or [])
+        self.outbox = FakeOutbox()
         self.committed = False
 
     async def __aenter__(self):
         self.messages = deque()
+        self.outbox.pending.clear()
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
@@ -138,6 +202,8 @@ class FakeUnitOfWork:
         pass
 
     async def commit(self):
+        self.outbox.messages.extend(self.outbox.pending)
+        self.outbox.pending.clear()
         self.committed = True
 
 
@@ -155,6 +221,8 @@ async def create_bus(uow: FakeUnitOfWork, dependencies=None) -> MessageBus:
         publish=AsyncMock(),
         sharecode_resolver=AsyncMock(),
         faceit_resolver=AsyncMock(),
+        match_cache=FakeMatchCache(),
+        place_resolver=lambda map, positions: ["Somewhere"] * len(positions),
     )
 
     if dependencies:
@@ -237,8 +305,7 @@ async def test_new_job_do_not_request_again(new_job_junk):
     )
 
     uow = FakeUnitOfWork(demos=[demo])
-    publish = AsyncMock()
-    bus, deps = await create_bus(uow, dict(publish=publish))
+    bus, deps = await create_bus(uow)
 
     await bus.dispatch(commands.CreateJob(demo_id=demo.id, **new_job_junk))
 
@@ -248,7 +315,7 @@ async def test_new_job_do_not_request_again(new_job_junk):
     assert not demo.is_up_to_date()
     assert job.state is JobState.WAITING
 
-    publish.assert_not_awaited()
+    assert not uow.outbox.messages
 
 
 @pytest.mark.asyncio
@@ -265,8 +332,7 @@ async def test_new_job_demo_id_not_up_to_date(new_job_junk):
     demo.data_version -= 1
 
     uow = FakeUnitOfWork(demos=[demo])
-    publish = AsyncMock()
-    bus, deps = await create_bus(uow, dict(publish=publish))
+    bus, deps = await create_bus(uow)
 
     await bus.dispatch(commands.CreateJob(demo_id=demo.id, **new_job_junk))
 
@@ -277,9 +343,9 @@ async def test_new_job_demo_id_not_up_to_date(new_job_junk):
     assert demo.state is DemoState.PROCESSING
     assert job.state is JobState.WAITING
 
-    publish.assert_awaited_once_with(
+    assert uow.outbox.messages == [
         commands.RequestDemoParse(origin=ANY, identifier=ANY, download_url=ANY, data_version=ANY)
-    )
+    ]
 
 
 @pytest.mark.asyncio
@@ -323,7 +389,7 @@ async def test_demo_step_can_record():
     uow = FakeUnitOfWork(demos=[demo])
 
     async with uow:
-        await services.handle_demo_step(demo=demo, publish=AsyncMock())
+        services.handle_demo_step(demo, uow)
 
     assert not uow.committed
 
@@ -364,9 +430,81 @@ async def test_demoparse_success(valve):
     assert len(demo.score) == 2
     assert demo.map is not None
 
+    deaths = [event for event in demo.data["events"] if event["event"] == "player_death"]
+    assert deaths and all(event["place"] == "Somewhere" for event in deaths)
+
     assert job.state is JobState.SELECTING
 
 
+@pytest.mark.asyncio
+async def test_demo_ready_parses_once(monkeypatch):
+    demo = new_demo(
+        state=DemoState.READY,
+        add_valve_data=True,
+        add_matchinfo=True,
+    )
+
+    jobs = [create_job(state=JobState.WAITING) for _ in range(3)]
+
+    uow = FakeUnitOfWork(jobs=jobs, demos=[demo])
+    bus, deps = await create_bus(uow)
+
+    for job in jobs:
+        job.demo = demo
+        job.demo_id = demo.id
+
+    parse = Match.parse
+    parsed = []
+
+    def counting_parse(match):
+        parsed.append(match)
+        return parse(match)
+
+    monkeypatch.setattr(Match, "parse", counting_parse)
+
+    await bus.dispatch(events.DemoReady(demo.id))
+
+    assert len(parsed) == 1
+    assert all(job.state is JobState.SELECTING for job in jobs)
+
+    selectable = [msg for msg in uow.messages if isinstance(msg, dto.JobSelectable)]
+    assert {msg.job_id for msg in selectable} == {job.id for job in jobs}
+    assert all(msg.match is parsed[0] for msg in selectable)
+    assert deps["match_cache"].get(demo.id) is parsed[0]
+
+
+@pytest.mark.asyncio
+async def test_restore_uses_match_cache(monkeypatch):
+    demo = new_demo(
+        state=DemoState.READY,
+        add_valve_data=True,
+        add_matchinfo=True,
+    )
+
+    job = create_job(state=JobState.SELECTING)
+
+    uow = FakeUnitOfWork(jobs=[job], demos=[demo])
+    bus, deps = await create_bus(uow)
+
+    job.demo = demo
+    job.demo_id = demo.id
+
+    match = Match.from_demo(demo)
+    match.parse()
+    deps["match_cache"].put(demo.id, match)
+
+    def fail_parse(match):
+        raise AssertionError("cached match was parsed again")
+
+    monkeypatch.setattr(Match, "parse", fail_parse)
+
+    await bus.dispatch(commands.Restore())
+
+    selectable = [msg for msg in uow.messages if isinstance(msg, dto.JobSelectable)]
+    assert [msg.job_id for msg in selectable] == [job.id]
+    assert selectable[0].match is match
+
+
 @pytest.mark.asyncio
 async def test_demoparse_success_outdated():
     demo = new_demo(
@@ -377,8 +515,7 @@ async def test_demoparse_success_outdated():
 
     job = create_job(state=JobState.WAITING)
     uow = FakeUnitOfWork(jobs=[job], demos=[demo])
-    publish = AsyncMock()
-    bus, deps = await create_bus(uow, dict(publish=publish))
+    bus, deps = await create_bus(uow)
 
     job.demo_id = demo.id
 
@@ -393,9 +530,9 @@ async def test_demoparse_success_outdated():
     assert uow.committed
     assert demo.state is DemoState.PROCESSING
 
-    publish.assert_awaited_once_with(
+    assert uow.outbox.messages == [
         commands.RequestDemoParse(origin=ANY, identifier=ANY, download_url=ANY, data_version=ANY)
-    )
+    ]
 
     assert job.state is JobState.WAITING
 
@@ -465,6 +602,9 @@ async def test_record():
     assert job.recording_data == {"player_xuid": player.xuid, "round_id": round_id}
     assert job.video_title == "R1 melan 1k usp_silencer"
 
+    # published by the outbox relay once committed
+    assert isinstance(uow.outbox.messages[-1], commands.RequestRecording)
+
 
 @pytest.mark.asyncio
 async def test_recorder_failure():
@@ -539,3 +679,101 @@ async def test_restore_restart_jobs():
     await bus.dispatch(commands.Restore())
 
     assert isinstance(uow.messages[-1], dto.JobSelectable)
+
+
+@pytest.mark.asyncio
+async def test_recording_counter():
+    counter = RecordingCounter()
+    job_id = uuid4()
+
+    counter.update(job_id, user_id=1, started_at=utcnow(), recording=True)
+    assert counter.count(1) == 1
+
+    # a reconcile snapshot that missed the change does not lose it
+    await counter.reconcile(AsyncMock(return_value=[]))
+    assert counter.count(1) == 1
+
+    counter.update(job_id, user_id=1, started_at=utcnow(), recording=False)
+    assert counter.count(1) == 0
+
+    # jobs outside the interaction window don't count
+    old = utcnow() - timedelta(minutes=30)
+    counter.update(uuid4(), user_id=2, started_at=old, recording=True)
+    assert counter.count(2) == 0
+
+
+@pytest.mark.asyncio
+async def test_uploader_success_releases_recording_slot():
+    job = create_job(state=JobState.RECORDING)
+    job.user_id = 1337
+
+    uow = FakeUnitOfWork(jobs=[job])
+    bus, deps = await create_bus(uow)
+
+    recording_counter.update(job.id, job.user_id, job.started_at, recording=True)
+    assert recording_counter.count(job.user_id) == 1
+
+    await bus.dispatch(events.UploaderSuccess(job_id=str(job.id)))
+
+    assert recording_counter.count(job.user_id) == 0
+
+
+@pytest.mark.asyncio
+async def test_demo_step_evicted_data():
+    demo = new_demo(
+        state=DemoState.READY,
+        add_matchinfo=True,
+        data_version=CSGO_DEMOPARSE_VERSION,
+    )
+
+    uow = FakeUnitOfWork(demos=[demo])
+
+    async with uow:
+        services.handle_demo_step(demo, uow)
+        await uow.commit()
+
+    assert demo.state is DemoState.PROCESSING
+
+    # archive is still in the bucket, so demoparse should reparse from there
+    assert uow.outbox.messages == [
+        commands.RequestDemoParse(
+            origin=ANY, identifier=ANY, download_url=ANY, data_version=CSGO_DEMOPARSE_VERSION
+        )
+    ]
+
+
+@pytest.mark.asyncio
+async def test_enforce_retention():
+    demos = []
+    for days in range(4):
+        demo = new_demo(
+            state=DemoState.READY,
+            add_valve_data=True,
+            add_matchinfo=True,
+            downloaded_at=utcnow() - timedelta(days=days),
+            archive_size=100,
+        )
+        demos.append(demo)
+
+    uow = FakeUnitOfWork(demos=demos)
+    bus, deps = await create_bus(uow)
+
+    data_size = len(str(demos[0].data))
+    await bus.dispatch(
+        commands.EnforceRetention(data_budget=data_size, archive_budget=300, batch_size=1)
+    )
+
+    newest, recent, old, oldest = demos
+
+    # the oldest archive is over budget, so that demo is gone for good
+    assert oldest.state is DemoState.DELETED
+    assert uow.outbox.messages == [
+        commands.DeleteDemoArchives(archives=[[oldest.origin.name, oldest.identifier]])
+    ]
+    # and dropped from the /demos index of the bot
+    assert list(uow.messages) == [dto.DemosDeleted(demo_ids=[oldest.id])]
+
+    # only the newest demo data fits the budget, older data can be reparsed from the archive
+    assert newest.is_ready()
+    assert recent.is_evicted() and old.is_evicted()
+    assert recent.state is DemoState.READY
@@ -0,0 +1,66 @@
+import sys
+import zlib
+
+import pytest
+
+from shared.utils import OutputLimitError, RunTimeoutError, run, run_piped
+
+WRITE = "import sys; sys.stdout.buffer.write(b'x' * {size}); sys.stdout.flush()"
+
+
+@pytest.mark.asyncio
+async def test_run():
+    code, stdout, stderr = await run(
+        sys.executable, "-c", "import sys; print('out'); print('err', file=sys.stderr)"
+    )
+
+    assert (code, stdout.strip(), stderr.strip()) == (0, "out", "err")
+
+
+@pytest.mark.asyncio
+async def test_run_piped_streams_to_consumer():
+    compressor = zlib.compressobj()
+    compressed, chunks = [], []
+
+    def consume(chunk: bytes):
+        chunks.append(len(chunk))
+        compressed.append(compressor.compress(chunk))
+
+    code, _ = await run_piped(
+        sys.executable, "-c", WRITE.format(size=1024 * 1024), consumer=consume
+    )
+
+    assert code == 0
+    assert sum(chunks) == 1024 * 1024
+    assert len(chunks) > 1
+    compressed.append(compressor.flush())
+    assert zlib.decompress(b"".join(compressed)) == b"x" * 1024 * 1024
+
+
+@pytest.mark.asyncio
+async def test_run_piped_max_output():
+    with pytest.raises(OutputLimitError) as exc:
+        await run_piped(
+            sys.executable,
+            "-c",
+            WRITE.format(size=1024 * 1024),
+            consumer=lambda chunk: None,
+            max_output=100_000,
+        )
+
+    assert 100_000 < exc.value.output.stdout_size <= 1024 * 1024
+
+
+@pytest.mark.asyncio
+async def test_run_piped_timeout_keeps_partial_output():
+    script = (
+        "import sys, time; print('halfway', flush=True);"
+        "print('stuck', file=sys.stderr, flush=True); time.sleep(10)"
+    )
+
+    with pytest.raises(RunTimeoutError) as exc:
+        await run_piped(sys.executable, "-c", script, consumer=lambda chunk: None, timeout=1.0)
+
+    assert bytes(exc.value.output.stdout_tail).strip() == b"halfway"
+    assert bytes(exc.value.output.stderr).strip() == b"stuck"
+    assert "halfway" in str(exc.value)
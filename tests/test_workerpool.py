@@ -0,0 +1,149 @@
+import asyncio
+import sys
+
+import pytest
+
+from shared.workerpool import WorkerError, WorkerPool, WorkerTimeout, worker_recycles
+
+# answers with the path upper cased, or fails, hangs, dies or grows as the path asks
+WORKER = """
+import json, os, sys, time
+
+rss = 0
+for line in sys.stdin:
+    request = json.loads(line)
+    header = dict(id=request["id"], ok=True, timings=dict(parse=0.5))
+    body = b""
+
+    path = request.get("path", "")
+    if path == "die":
+        sys.exit(3)
+    elif path == "hang":
+        time.sleep(10)
+    elif path == "fail":
+        header.update(ok=False, error="broken demo")
+    elif path == "grow":
+        rss = 10_000
+    elif path == "pid":
+        body = str(os.getpid()).encode()
+    elif path:
+        body = path.upper().encode()
+
+    header.update(length=len(body), rss=rss)
+    sys.stdout.buffer.write(json.dumps(header).encode() + b"\\n" + body)
+    sys.stdout.buffer.flush()
+"""
+
+
+def make_pool(name: str, **kwargs) -> WorkerPool:
+    return WorkerPool(name, sys.executable, "-c", WORKER, **kwargs)
+
+
+async def run(pool: WorkerPool, path: str) -> bytes:
+    body = bytearray()
+    await pool.run(dict(path=path), consumer=body.extend)
+    return bytes(body)
+
+
+def recycles(pool: WorkerPool, reason: str) -> float:
+    return worker_recycles.snapshot().get((pool.name, reason), 0.0)
+
+
+@pytest.mark.asyncio
+async def test_reuses_workers():
+    pool = make_pool("test_reuses", size=2)
+
+    try:
+        body = bytearray()
+        timings = await pool.run(dict(path="demo.dem"), consumer=body.extend)
+
+        assert body == b"DEMO.DEM"
+        assert timings["parse"] == 0.5 and timings["wait"] >= 0
+
+        pids = await asyncio.gather(*(run(pool, "pid") for _ in range(6)))
+        assert len(set(pids)) == 2
+        assert len(pool.workers) == 2
+    finally:
+        await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_failed_job_keeps_worker():
+    pool = make_pool("test_failed_job")
+
+    try:
+        pid = await run(pool, "pid")
+
+        with pytest.raises(WorkerError, match="broken demo"):
+            await run(pool, "fail")
+
+        assert await run(pool, "pid") == pid
+    finally:
+        await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_replaces_dead_and_timed_out_workers():
+    pool = make_pool("test_replaces", timeout=0.5)
+
+    try:
+        with pytest.raises(WorkerError) as exc:
+            await run(pool, "die")
+        assert exc.value.code == 3
+
+        with pytest.raises(WorkerTimeout):
+            await run(pool, "hang")
+
+        assert await run(pool, "demo") == b"DEMO"
+        assert recycles(pool, "died") == 1
+        assert recycles(pool, "failed") == 1
+        assert len(pool.workers) == 1
+    finally:
+        await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_recycles_after_jobs():
+    pool = make_pool("test_recycles_jobs", max_jobs=2)
+
+    try:
+        first = await run(pool, "pid")
+        assert await run(pool, "pid") == first
+
+        assert await run(pool, "pid") != first
+        assert recycles(pool, "jobs") == 1
+    finally:
+        await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_recycles_on_memory_growth():
+    pool = make_pool("test_recycles_memory", max_rss=1_000)
+
+    try:
+        first = await run(pool, "pid")
+        await run(pool, "grow")
+
+        assert await run(pool, "pid") != first
+        assert recycles(pool, "memory") == 1
+    finally:
+        await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_health_check():
+    pool = make_pool("test_health", health_interval=0.0)
+
+    try:
+        await pool.start()
+        (worker,) = pool.workers
+        pid = str(worker.proc.pid).encode()
+
+        # pinged and found healthy
+        assert await run(pool, "pid") == pid
+
+        worker.proc.stdout.feed_data(b"not json\n")
+        assert await run(pool, "pid") != pid
+        assert recycles(pool, "unhealthy") == 1
+    finally:
+        await pool.close()
@@ -43,6 +43,10 @@ def new_demo(
             kwargs["data"] = loads(f.read())
         kwargs["data_version"] = CSGO_DEMOPARSE_VERSION
 
+        # what Demo.set_demo_data would have filled in
+        kwargs.setdefault("map", kwargs["data"]["demoheader"]["mapname"])
+        kwargs.setdefault("score", kwargs["data"]["score"])
+
     return Demo(game=game, origin=origin, state=state, **kwargs)
 
 